@@ -8,15 +8,72 @@ from typing_extensions import Annotated
 
 StructuredResponse = Union[dict, BaseModel]
 
+import hashlib
+import mmap
 import os
+import tempfile
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Iterator, Optional
+
+# Kích thước mỗi lần đọc/ghi khi lưu file upload
+COPY_BLOCK_BYTES = 1 << 20
+
+
+@dataclass(frozen=True, slots=True)
+class FileRef:
+    """
+    Tham chiếu tới file upload đã lưu trên đĩa, dùng trong state/checkpoint thay cho bytes của file.
+    Nội dung chỉ được đọc khi cần (mmap), nên kích thước checkpoint không phụ thuộc kích thước file.
+    """
+    hash: str  # sha256 nội dung file
+    path: str
+    size: int
+    mime: str
+    ext: str
+    original_name: str = ""  # tên file lúc upload (path lưu theo hash nội dung)
+
+    @classmethod
+    def save(cls, uploaded_file, folder: str) -> "FileRef":
+        """
+        Ghi file upload (file-like có name/type) vào folder theo từng block, tính sha256 trong lúc ghi.
+        File được lưu theo nội dung (<sha256><ext>): upload sau trùng tên không ghi đè bytes mà checkpoint cũ
+        đang trỏ tới, upload trùng nội dung dùng chung một file.
+        """
+        ext = os.path.splitext(uploaded_file.name)[1].lower()
+        digest, size = hashlib.sha256(), 0
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for block in iter(lambda: uploaded_file.read(COPY_BLOCK_BYTES), b""):
+                    digest.update(block)
+                    size += len(block)
+                    f.write(block)
+            path = os.path.join(folder, digest.hexdigest() + ext)
+            # Cùng đường dẫn nghĩa là cùng nội dung: thay thế nguyên tử, người đang đọc file cũ không bị ảnh hưởng
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return cls(digest.hexdigest(), path, size, uploaded_file.type or "", ext, uploaded_file.name)
+
+    @classmethod
+    def from_path(cls, path: str, mime: str = "") -> "FileRef":
+        """Tham chiếu tới file đã có trên đĩa."""
+        from tools.documents import file_digest
+
+        return cls(file_digest(path), path, os.path.getsize(path), mime, os.path.splitext(path)[1].lower())
 
+    @property
+    def name(self) -> str:
+        """Tên file trong thư mục upload (tool mở file theo tên này)."""
+        return os.path.basename(self.path)
 
-class UploadedFileInfo:
-    def __init__(self, uploaded_file):
-        self.name: str = uploaded_file.name
-        self.type: str = uploaded_file.type
-        self.bytes: bytes = uploaded_file.read()
-        self.ext: str = os.path.splitext(uploaded_file.name)[1].lower()
+    @property
+    def display_name(self) -> str:
+        """Tên hiển thị cho người dùng."""
+        return self.original_name or self.name
 
     @property
     def is_image(self) -> bool:
@@ -30,13 +87,30 @@ class UploadedFileInfo:
     def is_docx(self) -> bool:
         return self.ext == ".docx"
 
+    @contextmanager
+    def open_bytes(self) -> Iterator[memoryview]:
+        """
+        Nội dung file qua mmap (chỉ đọc). Không giữ memoryview sau khi ra khỏi khối with.
+        Ném ValueError nếu file trên đĩa đã bị ghi đè bằng nội dung khác kích thước.
+        """
+        if os.path.getsize(self.path) != self.size:
+            raise ValueError(f"File {self.name} đã thay đổi kể từ lúc upload")
+        if self.size == 0:
+            yield memoryview(b"")
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+
+    def read_bytes(self) -> bytes:
+        with self.open_bytes() as view:
+            return view.tobytes()
+
     def as_dict(self) -> dict:
-        return {
-            "name": self.name,
-            "type": self.type,
-            "bytes": self.bytes,
-            "ext": self.ext,
-        }
+        return {**asdict(self), "name": self.name}
 
 
 class AgentState(TypedDict):
@@ -53,4 +127,4 @@ class AgentState(TypedDict):
 
     current: str = None
 
-    file: UploadedFileInfo = None
+    file: Optional[FileRef] = None
@@ -10,7 +10,12 @@ st.set_page_config(layout="wide", page_title="Agent Chat", page_icon="🤖")
 import asyncio
 import json
 from uuid import uuid4
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
+
+import profiling
+from agent_state import FileRef
+from cancellation import CancelToken, TurnCancelled, with_cancel_token
+from deadline import with_deadline
 
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -41,9 +46,21 @@ def get_this_week_time() -> dict:
     }
 
 
+def cancel_active_turn(reason: str) -> None:
+    """Hủy lượt chat đang chạy dở của session (nếu có): tool, trích xuất file, lượt gọi model dừng ở điểm kiểm tra kế tiếp."""
+    token = st.session_state.get("turn_token")
+    if token is not None:
+        token.cancel(reason)
+
+
+def clear_messages() -> None:
+    cancel_active_turn("clear")
+    st.session_state.clear()
+
+
 # ========== Page Config ==========
 st.title("Chat with Agent")
-st.button("Clear message", on_click=lambda: st.session_state.clear(), key="clear_message_btn")
+st.button("Clear message", on_click=clear_messages, key="clear_message_btn")
 
 # ========== Init Session State ==========
 if "session_id" not in st.session_state:
@@ -83,6 +100,19 @@ with st.expander("Config"):
     config["user_name"] = col1.text_input("User Name", value=config["user_name"])
     config["gender"] = col2.text_input("Gender", value=config["gender"])
     config["x_birthdate"] = col3.text_input("Date of Birth", value=config["x_birthdate"])
+    st.session_state.show_trace = st.checkbox(
+        "Hiển thị thời gian từng bước (node, tool, DB, LLM)",
+        value=st.session_state.get("show_trace", False),
+        key="show_trace_checkbox",
+    )
+    profile_options = ["", "sampling", "cprofile"]
+    st.session_state.profile_mode = st.selectbox(
+        "Profiling lượt chat tiếp theo (lưu vào profiles/)",
+        profile_options,
+        index=profile_options.index(st.session_state.get("profile_mode", profiling.profile_mode_from_env())),
+        format_func=lambda mode: mode or "Tắt",
+        key="profile_mode_select",
+    )
 
     if st.button("Submit Config", key="submit_config_btn"):
         session_id = str(uuid4())
@@ -92,17 +122,30 @@ with st.expander("Config"):
             "configurable": config
         }
 
-from graph import graph_builder
+import graph
+import tracing
+
+from settings import get_settings
+
+if get_settings().metrics_port:
+    tracing.start_metrics_server(get_settings().metrics_port)
+# Ghi log trên thread nền, không chiếm event loop của astream_events
+tracing.log_in_background()
 
 
 # ========== Process Events ==========
-async def process_events(inputs: dict) -> AsyncGenerator[str, None]:
-    async for event in graph_builder.astream_events(inputs, config=st.session_state.config, version="v1"):
+async def process_events(inputs: dict, token: CancelToken) -> AsyncGenerator[str, None]:
+    # Tool return_direct kết thúc lượt chat bằng chính kết quả tool (không có lượt LLM trả lời sau đó)
+    streamed_in_tool = False
+    config = with_cancel_token(with_deadline(st.session_state.config), token)
+
+    async for event in graph.graph_builder.astream_events(inputs, config=config, version="v2"):
         kind = event["event"]
 
         if kind == "on_chat_model_stream":
             content = event["data"]["chunk"].content
             if content:
+                streamed_in_tool = True
                 yield content
 
         elif kind == "on_tool_start":
@@ -122,25 +165,46 @@ async def process_events(inputs: dict) -> AsyncGenerator[str, None]:
 
                 output += f" with:\n```\n{formatted_input}\n```"
 
+            streamed_in_tool = False
             yield output
 
         elif kind == "on_tool_end":
-            pass
+            tool = graph.tools_by_name.get(event["name"])
+            output = event["data"].get("output")
+            # summary/check_cv gọi LLM bên trong tool và đã stream kết quả, không in lại
+            if tool is not None and tool.return_direct and output and not streamed_in_tool:
+                yield f"\n\n{getattr(output, 'content', output)}"
 
 
 # ========== Async to Sync Generator ==========
-def to_sync_generator(async_func, *args, **kwargs):
+def to_sync_generator(async_func, *args, cancel_token: Optional[CancelToken] = None, **kwargs):
+    """
+    Chạy async generator trên event loop riêng. Nếu generator bị bỏ dở (Streamlit dừng script khi người dùng
+    gửi tin nhắn mới / bấm nút giữa chừng) thì hủy token của lượt chat và cancel mọi task còn chạy trên loop.
+    """
     async_gen = async_func(*args, **kwargs)
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    finished = False
     try:
         while True:
             try:
                 yield loop.run_until_complete(anext(async_gen))
-            except StopAsyncIteration:
+            except (StopAsyncIteration, TurnCancelled):
+                # TurnCancelled: lượt chat đã bị hủy từ nơi khác, dừng im lặng
+                finished = True
                 break
     finally:
-        loop.close()
+        if not finished and cancel_token is not None:
+            cancel_token.cancel("abandoned")
+        try:
+            loop.run_until_complete(async_gen.aclose())
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        finally:
+            loop.close()
 
 
 # ========== Show Chat History ==========
@@ -185,7 +249,7 @@ with st.container():
     with col2:
         uploaded_file = st.file_uploader(
             "📎",
-            type=["png", "jpg", "jpeg", "pdf"],
+            type=["png", "jpg", "jpeg", "pdf", "docx", "txt"],
             key="chat_upload",
         )
 
@@ -193,27 +257,25 @@ with st.container():
 
 # ========== Handle Message ==========
 if prompt:  # chỉ gửi khi có text
+    # Lượt trước còn chạy dở (người dùng gửi tin nhắn mới giữa chừng) thì hủy, lượt mới có token riêng
+    cancel_active_turn("new_message")
+    turn_token = st.session_state.turn_token = CancelToken()
     user_message = {"role": "user", "content": prompt}
 
-    file_bytes = None
-    ext = None
+    file_ref = None
     file_info = ""
 
     if uploaded_file is not None:
-        file_bytes = uploaded_file.read()
-        ext = os.path.splitext(uploaded_file.name)[1].lower()
-
-        user_message["file"] = {
-            "name": uploaded_file.name,
-            "bytes": file_bytes,
-            "type": uploaded_file.type
-        }
+        # Ghi file theo từng block; session/state chỉ giữ tham chiếu (hash, path, size), không giữ bytes
+        file_ref = FileRef.save(uploaded_file, UPLOAD_FOLDER)
+        user_message["file"] = file_ref
 
-        file_info = f"\n\n[File đính kèm: {uploaded_file.name}, loại {uploaded_file.type}, kích thước {len(file_bytes)} bytes]"
+        file_info = (f"\n\n[File đính kèm: {file_ref.name}, loại {file_ref.mime}, kích thước {file_ref.size} bytes, "
+                     f"tên gốc {file_ref.display_name}]")
 
-        filepath = os.path.join(UPLOAD_FOLDER, uploaded_file.name)
-        with open(filepath, "wb") as f:
-            f.write(file_bytes)
+        # Trích xuất nền ngay khi lưu file, chạy song song với lượt gọi model đầu tiên
+        from tools.documents import preextract
+        preextract(file_ref.path, turn_token)
 
     # Lưu tin nhắn user
     st.session_state.messages.append(user_message)
@@ -222,21 +284,21 @@ if prompt:  # chỉ gửi khi có text
     with st.chat_message("user"):
         st.markdown(prompt)
 
-        if uploaded_file is not None:
-            if ext in [".png", ".jpg", ".jpeg"]:
-                st.image(file_bytes, caption=uploaded_file.name, use_container_width=True)
-            elif ext == ".pdf":
+        if file_ref is not None:
+            if file_ref.is_image:
+                st.image(file_ref.path, caption=file_ref.display_name, use_container_width=True)
+            elif file_ref.is_pdf:
                 st.download_button(
-                    label=f"📄 Xem {uploaded_file.name}",
-                    data=file_bytes,
-                    file_name=uploaded_file.name,
+                    label=f"📄 Xem {file_ref.display_name}",
+                    data=file_ref.read_bytes(),
+                    file_name=file_ref.display_name,
                     mime="application/pdf"
                 )
-            elif ext == ".docx":
+            elif file_ref.is_docx:
                 st.download_button(
-                    label=f"📄 Tải {uploaded_file.name}",
-                    data=file_bytes,
-                    file_name=uploaded_file.name,
+                    label=f"📄 Tải {file_ref.display_name}",
+                    data=file_ref.read_bytes(),
+                    file_name=file_ref.display_name,
                     mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
                 )
 
@@ -244,20 +306,34 @@ if prompt:  # chỉ gửi khi có text
     inputs = {
         "messages": [("user", prompt + " " + file_info)],
     }
+    if file_ref is not None:
+        inputs["file"] = file_ref
 
     # Assistant trả lời
     with st.chat_message("assistant"):
         start_time = time.time()
-        response = st.write_stream(
-            to_sync_generator(process_events, inputs)
-        )
+        with tracing.turn() as turn_trace, \
+                profiling.profile_turn(st.session_state.get("profile_mode"), label=prompt) as profile_result:
+            response = st.write_stream(
+                to_sync_generator(process_events, inputs, turn_token, cancel_token=turn_token)
+            )
         end_time = time.time() - start_time
 
         response_id = uuid4().hex
         st.write(f"⏱️ **Processed in**: {round(end_time, 2)}s")
+        if st.session_state.get("show_trace"):
+            with st.expander("📊 Chi tiết thời gian", expanded=False):
+                st.dataframe(turn_trace.breakdown(), use_container_width=True)
+        if profile_result is not None:
+            with st.expander("🔥 Profile", expanded=False):
+                st.caption(", ".join(profile_result.files))
+                st.dataframe(profile_result.top, use_container_width=True)
         st.session_state.messages.append({
             "role": "assistant",
             "content": response,
             "id": response_id,
             "stars": 0
         })
+
+# Khởi tạo model nền sau khi UI đã render xong
+graph.prewarm()
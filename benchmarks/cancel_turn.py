@@ -0,0 +1,104 @@
+"""
+Kiểm tra hủy lượt chat giữa chừng: lượt tạo bộ đề (tool question_generator, gọi model chậm rồi xuất docx)
+bị bỏ dở sau --cancel-after-ms, giống khi người dùng gửi tin nhắn mới trong app.py.
+
+- Mặc định: hủy token của lượt chat và cancel task astream_events. Tool phải dừng ở điểm kiểm tra kế tiếp,
+  lượt gọi model không hoàn thành và không có file docx nào được ghi.
+- --no-token: chỉ cancel task (như trước khi có cancellation.py), tool trong thread vẫn chạy tới hết.
+
+Exit code 1 nếu có token mà việc của lượt bị hủy vẫn chạy tới cùng.
+
+Ví dụ:
+    python -m benchmarks.cancel_turn
+    python -m benchmarks.cancel_turn --no-token
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from uuid import uuid4
+
+TOPIC = "huy giua chung"
+
+
+def output_path() -> str:
+    return os.path.join("output", f"bo_de_{TOPIC.replace(' ', '_')}.docx")
+
+
+async def run(args) -> dict:
+    import llm
+    from benchmarks.fake_llm import fake_chat_model_factory
+
+    llm.set_chat_model_factory(fake_chat_model_factory(latency_median_ms=args.latency_ms, latency_sigma=0.0))
+
+    import graph as graph_module
+    import tracing
+    from cancellation import CancelToken, with_cancel_token
+    from deadline import with_deadline
+
+    if os.path.exists(output_path()):
+        os.remove(output_path())
+
+    token = CancelToken()
+    config = {"configurable": {"thread_id": f"cancel-{uuid4().hex[:8]}"}, "recursion_limit": 10}
+    config = with_deadline(config)
+    if not args.no_token:
+        config = with_cancel_token(config, token)
+    inputs = {"messages": [("user", f"Tạo 5 câu hỏi trắc nghiệm về {TOPIC}")]}
+
+    async def consume():
+        async for _event in graph_module.graph_builder.astream_events(inputs, config=config, version="v2"):
+            pass
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(args.cancel_after_ms / 1000)
+    cancelled_at = time.perf_counter()
+    token.cancel("benchmark")
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    def requests(result: str) -> int:
+        return int(tracing.metrics.counter_total("llm_scheduler_requests_total", result=result))
+
+    # Chờ thread của tool: dừng ở điểm kiểm tra (có token) hoặc chạy tới hết (không có token)
+    ok_before = requests("ok")
+    while time.perf_counter() - cancelled_at < args.latency_ms / 1000 * 2 + 1:
+        if requests("cancelled") or requests("ok") > ok_before or os.path.exists(output_path()):
+            break
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.5)
+
+    return {
+        "stopped_after_s": round(time.perf_counter() - cancelled_at - 0.5, 3),
+        "llm_ok": requests("ok"),
+        "llm_cancelled": requests("cancelled"),
+        "cancelled_work": int(tracing.metrics.counter_total("agent_cancelled_work_total")),
+        "docx_written": os.path.exists(output_path()),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Hủy lượt chat giữa chừng")
+    parser.add_argument("--latency-ms", type=float, default=3000.0, help="độ trễ của fake LLM")
+    parser.add_argument("--cancel-after-ms", type=float, default=300.0)
+    parser.add_argument("--no-token", action="store_true", help="chỉ cancel task, không hủy token của lượt chat")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+    os.environ.setdefault("DB_BACKEND", "sqlite")
+    os.environ.setdefault("DB_SQLITE_PATH", os.path.join("data", "loadtest.db"))
+    report = asyncio.run(run(args))
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+    if os.path.exists(output_path()):
+        os.remove(output_path())
+    if not args.no_token and (report["docx_written"] or report["llm_ok"] or not report["llm_cancelled"]):
+        print("FAIL: việc của lượt chat đã hủy vẫn chạy tới cùng")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+So sánh search_by_topic cũ (JOIN BookCategory + CategoryName LIKE) với bản dùng category cache (CategoryID IN).
+
+Ví dụ:
+    python -m benchmarks.category_search --books 20000 --repeat 200
+    python -m benchmarks.category_search --real-db
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from benchmarks.load_test import percentile
+
+TOPICS = ["Toán học", "toan", "Vật lý", "lap trinh", "Lịch sử", "tiếng anh", "Kinh tế", "sinh hoc"]
+
+LEGACY_QUERY = """
+    SELECT Book.BookID, Book.BookName, Book.Content, BookCategory.CategoryName
+    FROM Book
+    LEFT JOIN BookCategory ON Book.CategoryID = BookCategory.CategoryID
+    WHERE BookCategory.CategoryName LIKE %s
+"""
+
+
+def legacy_search_by_topic(topic):
+    """Bản search_by_topic trước khi có category cache."""
+    from db.database import create_database
+
+    db = create_database()
+    db.connect()
+    results = db.fetch(LEGACY_QUERY, ("%" + topic + "%",))
+    db.close()
+    return results
+
+
+def measure(func, repeat: int) -> list:
+    timings = []
+    for i in range(repeat):
+        topic = TOPICS[i % len(TOPICS)]
+        start = time.perf_counter()
+        func(topic)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark search_by_topic: JOIN+LIKE vs category cache")
+    parser.add_argument("--books", type=int, default=5000, help="số sách giả khi dùng DB stand-in")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--real-db", action="store_true", help="chạy trên MySQL thật")
+    args = parser.parse_args(argv)
+
+    if not args.real_db:
+        os.environ["DB_BACKEND"] = "sqlite"
+        os.environ.setdefault("DB_SQLITE_PATH", os.path.join("data", f"bench_{args.books}.db"))
+
+    from db.database import create_database
+    from benchmarks.fixtures import seed_catalogue
+    from tools.book_search import search_by_topic
+
+    db = create_database()
+    db.connect()
+    seed_catalogue(db, books=args.books, words_per_chapter=50)
+    db.close()
+
+    # Bỏ qua lần gọi đầu (nạp cache, warm-up DB)
+    legacy_search_by_topic(TOPICS[0])
+    search_by_topic(TOPICS[0])
+
+    legacy = measure(legacy_search_by_topic, args.repeat)
+    cached = measure(search_by_topic, args.repeat)
+
+    # Kiểm tra cùng tập kết quả với những chủ đề mà LIKE cũ tìm được
+    for topic in TOPICS:
+        old_ids = {row[0] for row in legacy_search_by_topic(topic)}
+        new_ids = {row[0] for row in search_by_topic(topic)}
+        if not old_ids <= new_ids:
+            print(f"FAIL: '{topic}' thiếu {len(old_ids - new_ids)} sách so với truy vấn cũ")
+            return 1
+
+    print(f"{'variant':<18}{'mean_ms':>10}{'p50_ms':>10}{'p95_ms':>10}")
+    for name, timings in (("join+like", legacy), ("category cache", cached)):
+        print(f"{name:<18}{statistics.mean(timings):>10.3f}"
+              f"{percentile(timings, 50):>10.3f}{percentile(timings, 95):>10.3f}")
+    print(f"speedup (mean): {statistics.mean(legacy) / statistics.mean(cached):.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
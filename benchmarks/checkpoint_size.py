@@ -0,0 +1,92 @@
+"""
+Kiểm tra kích thước checkpoint không phụ thuộc kích thước file upload (state chỉ giữ FileRef).
+
+Mỗi cỡ file chạy một lượt chat trên một thread mới với fake LLM, đo số byte checkpoint của thread đó.
+Chênh lệch giữa các cỡ file vượt --max-spread-bytes thì exit code 1.
+
+Ví dụ:
+    python -m benchmarks.checkpoint_size
+    python -m benchmarks.checkpoint_size --sizes-mb 0.001,1,64 --max-spread-bytes 2048
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from uuid import uuid4
+
+# Chênh lệch cho phép (byte): số chữ số của size trong FileRef, id message, timestamp, ...
+MAX_SPREAD_BYTES = 4096
+
+
+def write_file(folder: str, size: int) -> str:
+    path = os.path.join(folder, f"upload-{size}.bin")
+    block = os.urandom(1 << 20)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:min(remaining, len(block))])
+            remaining -= len(block)
+    return path
+
+
+def thread_checkpoint_bytes(memory, thread_id: str) -> int:
+    from benchmarks.load_test import checkpoint_bytes
+
+    class View:
+        storage = {thread_id: memory.storage.get(thread_id, {})}
+        writes = {k: v for k, v in memory.writes.items() if k[0] == thread_id}
+        blobs = {k: v for k, v in memory.blobs.items() if k[0] == thread_id}
+
+    return checkpoint_bytes(View)
+
+
+async def measure(sizes: list) -> list:
+    import llm
+    from benchmarks.fake_llm import fake_chat_model_factory
+
+    llm.set_chat_model_factory(fake_chat_model_factory(latency_median_ms=1.0, latency_sigma=0.0))
+
+    from agent_state import FileRef
+    import graph as graph_module
+
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            file_ref = FileRef.from_path(write_file(folder, size), mime="application/octet-stream")
+            thread_id = f"checkpoint-{size}-{uuid4().hex[:8]}"
+            config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 10}
+            inputs = {"messages": [("user", "Xin chào")], "file": file_ref}
+            await graph_module.graph_builder.ainvoke(inputs, config=config)
+
+            state = await graph_module.graph_builder.aget_state(config)
+            assert state.values["file"] == file_ref, "FileRef không được giữ nguyên qua checkpoint"
+            rows.append((size, thread_checkpoint_bytes(graph_module.memory, thread_id)))
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Kích thước checkpoint theo kích thước file upload")
+    parser.add_argument("--sizes-mb", default="0.001,1,16,64", help="các cỡ file (MB), cách nhau bởi dấu phẩy")
+    parser.add_argument("--max-spread-bytes", type=int, default=MAX_SPREAD_BYTES)
+    args = parser.parse_args(argv)
+
+    os.environ["INTENT_ROUTER"] = "0"
+    sizes = [int(float(mb) * 2 ** 20) for mb in args.sizes_mb.split(",")]
+    rows = asyncio.run(measure(sizes))
+
+    print(f"{'file_bytes':>14}{'checkpoint_bytes':>18}")
+    for size, checkpoint in rows:
+        print(f"{size:>14}{checkpoint:>18}")
+
+    checkpoints = [checkpoint for _, checkpoint in rows]
+    spread = max(checkpoints) - min(checkpoints)
+    print(f"spread: {spread} bytes (cho phép {args.max_spread_bytes})")
+    if spread > args.max_spread_bytes:
+        print("FAIL: kích thước checkpoint tăng theo kích thước file")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
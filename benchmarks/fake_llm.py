@@ -0,0 +1,197 @@
+import asyncio
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+FILE_NOTE_PATTERN = re.compile(r"\[File đính kèm: (.+?), loại")
+
+# Thời điểm các request gần đây, dùng chung mọi instance (quota tính theo API key như Gemini)
+_recent_requests = deque()
+_quota_lock = threading.Lock()
+
+
+class FakeQuotaError(Exception):
+    """Giả lập lỗi 429 RESOURCE_EXHAUSTED khi vượt quota request/phút."""
+    code = 429
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model giả lập Gemini: không gọi mạng, độ trễ theo phân phối log-normal có đuôi dài.
+    Hỗ trợ bind_tools và with_structured_output (sinh dữ liệu giả theo JSON schema của tool).
+    """
+
+    latency_median_ms: float = 800.0
+    latency_sigma: float = 0.5
+    tail_prob: float = 0.0
+    tail_ms: float = 5000.0
+    # Số request/phút tối đa trước khi trả lỗi 429 (0 = không giới hạn)
+    quota_rpm: float = 0.0
+    # Hàm quyết định câu trả lời cho graph: nhận messages, trả AIMessage hoặc None (mặc định)
+    responder: Optional[Callable[[List[BaseMessage], List[dict]], Optional[AIMessage]]] = None
+    bound_tools: List[dict] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs: Any) -> "FakeChatModel":
+        return self.model_copy(update={"bound_tools": [convert_to_openai_tool(t) for t in tools]})
+
+    def sample_latency(self) -> float:
+        """Thời gian (giây) cho một lần gọi model."""
+        latency = random.lognormvariate(math.log(self.latency_median_ms), self.latency_sigma)
+        if self.tail_prob and random.random() < self.tail_prob:
+            latency += self.tail_ms
+        return latency / 1000
+
+    def check_quota(self) -> None:
+        if not self.quota_rpm:
+            return
+        now = time.monotonic()
+        with _quota_lock:
+            while _recent_requests and now - _recent_requests[0] > 60:
+                _recent_requests.popleft()
+            if len(_recent_requests) >= self.quota_rpm:
+                raise FakeQuotaError(f"429 RESOURCE_EXHAUSTED: vượt quota {self.quota_rpm:g} request/phút")
+            _recent_requests.append(now)
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        self.check_quota()
+        time.sleep(self.sample_latency())
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        self.check_quota()
+        await asyncio.sleep(self.sample_latency())
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        message = None
+        if self.responder is not None:
+            message = self.responder(messages, self.bound_tools)
+        if message is None:
+            message = default_responder(messages, self.bound_tools)
+
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = len(str(message.content)) // 4 + 20 * len(message.tool_calls)
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return message
+
+
+def default_responder(messages: List[BaseMessage], bound_tools: List[dict]) -> AIMessage:
+    """
+    Hành vi mặc định: structured output khi chỉ bind 1 schema lạ,
+    gọi tool theo từ khóa trong tin nhắn user, trả lời văn bản sau khi tool chạy xong.
+    """
+    tool_names = {t["function"]["name"] for t in bound_tools}
+
+    # with_structured_output: bind đúng 1 schema
+    if len(bound_tools) == 1:
+        function = bound_tools[0]["function"]
+        args = fake_from_schema(function.get("parameters", {}), _prompt_text(messages))
+        return _tool_call_message(function["name"], args)
+
+    last = messages[-1]
+    if isinstance(last, ToolMessage) or not isinstance(last, HumanMessage):
+        return AIMessage(content=f"Đã xử lý xong yêu cầu. {str(last.content)[:200]}")
+
+    text = str(last.content)
+    lowered = text.lower()
+
+    # Gọi LLM trực tiếp trong tool/job (tóm tắt, chấm CV, ...): trả lời bằng phần đầu văn bản
+    if not bound_tools:
+        return AIMessage(content=" ".join(text.split()[:60]))
+
+    file_match = FILE_NOTE_PATTERN.search(text)
+
+    if file_match and "extract_file" in tool_names:
+        return _tool_call_message("extract_file", {"message": text, "file_name": file_match.group(1)})
+
+    if ("câu hỏi" in lowered or "trắc nghiệm" in lowered) and "question_generator_tool" in tool_names:
+        so_cau = re.search(r"(\d+)\s*câu", lowered)
+        return _tool_call_message("question_generator_tool", {
+            "loai_bode": "trắc nghiệm",
+            "so_cau": int(so_cau.group(1)) if so_cau else 5,
+            "chu_de": text.rsplit("về", 1)[-1].strip(),
+        })
+
+    if "sách" in lowered and "search_by_topic" in tool_names:
+        return _tool_call_message("search_by_topic", {"topic": text.rsplit("về", 1)[-1].strip()})
+
+    return AIMessage(content="Xin chào, tôi có thể giúp gì cho bạn?")
+
+
+def fake_from_schema(schema: dict, prompt: str = "", defs: Optional[dict] = None) -> Any:
+    """Sinh giá trị giả hợp lệ theo JSON schema (dùng cho with_structured_output)."""
+    defs = defs if defs is not None else schema.get("$defs", {})
+
+    if "$ref" in schema:
+        return fake_from_schema(defs[schema["$ref"].split("/")[-1]], prompt, defs)
+    if "anyOf" in schema:
+        options = [s for s in schema["anyOf"] if s.get("type") != "null"]
+        return fake_from_schema(options[0], prompt, defs) if options else None
+
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            name: fake_from_schema(prop, prompt, defs)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        count = re.search(r"(\d+)\s*câu", prompt)
+        size = min(int(count.group(1)), 50) if count else 3
+        return [fake_from_schema(schema.get("items", {}), prompt, defs) for _ in range(size)]
+    if kind == "integer":
+        return random.randint(1, 10)
+    if kind == "number":
+        return round(random.random(), 2)
+    if kind == "boolean":
+        return random.random() < 0.5
+    if "enum" in schema:
+        return schema["enum"][0]
+    return f"nội dung giả {random.randint(1, 1000)}"
+
+
+def _prompt_text(messages: List[BaseMessage]) -> str:
+    return "\n".join(str(m.content) for m in messages)
+
+
+def _tool_call_message(name: str, args: dict) -> AIMessage:
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": uuid.uuid4().hex}])
+
+
+def fake_chat_model_factory(**latency: Any) -> Callable[..., BaseChatModel]:
+    """Factory dùng với llm.set_chat_model_factory, bỏ qua tham số của Gemini."""
+
+    def factory(**_: Any) -> BaseChatModel:
+        return FakeChatModel(**latency)
+
+    return factory
@@ -0,0 +1,48 @@
+import random
+
+CATEGORIES = [
+    "Toán học", "Vật lý", "Hóa học", "Sinh học", "Ngữ văn",
+    "Lịch sử", "Địa lý", "Tin học", "Tiếng Anh", "Kinh tế",
+]
+
+WORDS = (
+    "bài học kiến thức phương trình hàm số định lý chứng minh lực chuyển động năng lượng "
+    "phản ứng nguyên tố tế bào di truyền văn bản nhân vật tác phẩm triều đại chiến tranh "
+    "khí hậu dân số thuật toán dữ liệu lập trình ngữ pháp từ vựng thị trường giá cả"
+).split()
+
+
+def seed_catalogue(db, books: int = 200, chapters: int = 5, words_per_chapter: int = 400, seed: int = 42) -> int:
+    """
+    Sinh dữ liệu sách giả vào DB stand-in nếu bảng Book còn trống.
+
+    :param db: đối tượng DB (thường là SqliteDatabase)
+    :param books: số sách cần sinh
+    :param chapters: số chương mỗi sách
+    :param words_per_chapter: số từ mỗi chương
+    :param seed: seed cho random để dữ liệu ổn định giữa các lần chạy
+    :return: số sách hiện có trong DB
+    """
+    existing = db.fetch("SELECT COUNT(*) FROM Book")[0][0]
+    if existing:
+        return existing
+
+    rng = random.Random(seed)
+    for category_id, name in enumerate(CATEGORIES, 1):
+        db.execute_query(
+            "INSERT INTO BookCategory (CategoryID, CategoryName) VALUES (%s, %s)", (category_id, name)
+        )
+
+    for book_id in range(1, books + 1):
+        category_id = rng.randint(1, len(CATEGORIES))
+        name = f"{CATEGORIES[category_id - 1]} {rng.choice(WORDS)} tập {book_id}"
+        content = "\n\n".join(
+            f"Chương {chapter}: {rng.choice(WORDS)} {rng.choice(WORDS)}\n"
+            + " ".join(rng.choice(WORDS) for _ in range(words_per_chapter))
+            for chapter in range(1, chapters + 1)
+        )
+        db.execute_query(
+            "INSERT INTO Book (BookID, BookName, Content, CategoryID) VALUES (%s, %s, %s, %s)",
+            (book_id, name, content, category_id),
+        )
+    return books
@@ -0,0 +1,250 @@
+"""
+Load test nhiều session đồng thời chạy trên graph_builder với fake LLM.
+
+Ví dụ:
+    python -m benchmarks.load_test --sessions 50 --turns 4 --mix upload=1,search=2,quiz=1
+    python -m benchmarks.load_test --sessions 20 --latency-median-ms 1200 --tail-prob 0.02 --json report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from uuid import uuid4
+
+SCENARIOS = ("upload", "search", "quiz")
+
+
+def percentile(values, q):
+    """Percentile q (0..100) theo nội suy tuyến tính."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def checkpoint_bytes(memory) -> int:
+    """Tổng số byte checkpoint đã serialize trong MemorySaver."""
+
+    def walk(value):
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        if isinstance(value, dict):
+            return sum(walk(v) for v in value.values())
+        if isinstance(value, (list, tuple)):
+            return sum(walk(v) for v in value)
+        return 0
+
+    return walk(memory.storage) + walk(getattr(memory, "writes", {})) + walk(getattr(memory, "blobs", {}))
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Kịch bản không hợp lệ: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def build_message(scenario: str, upload_file: str) -> str:
+    if scenario == "upload":
+        size = os.path.getsize(os.path.join("uploads", upload_file))
+        return f"Đọc giúp tôi file này \n\n[File đính kèm: {upload_file}, loại application/pdf, kích thước {size} bytes]"
+    if scenario == "search":
+        return f"Tìm sách về {random.choice(['Toán học', 'Vật lý', 'Tin học', 'Lịch sử'])}"
+    return f"Tạo {random.randint(3, 10)} câu hỏi trắc nghiệm về {random.choice(['hàm số', 'tế bào', 'thuật toán'])}"
+
+
+async def run_session(graph_builder, session_index: int, args, mix: dict, results: list) -> None:
+    from deadline import with_deadline
+
+    thread_id = f"load-{session_index}-{uuid4().hex[:8]}"
+    config = {"configurable": {"thread_id": thread_id, "user_id": f"load-{session_index}"}, "recursion_limit": 15}
+    scenarios, weights = zip(*mix.items())
+
+    for _ in range(args.turns):
+        scenario = random.choices(scenarios, weights)[0]
+        inputs = {"messages": [("user", build_message(scenario, args.upload_file))]}
+        start = time.perf_counter()
+        error = None
+        try:
+            turn_config = with_deadline(config, args.turn_budget_s)
+            async for _event in graph_builder.astream_events(inputs, config=turn_config, version="v2"):
+                pass
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        results.append({
+            "scenario": scenario,
+            "latency": time.perf_counter() - start,
+            "error": error,
+        })
+        if args.think_time_ms:
+            await asyncio.sleep(random.expovariate(1000 / args.think_time_ms))
+
+
+async def run_load(args) -> dict:
+    # Fake LLM phải được cài trước khi import graph (graph tạo model lúc import)
+    import llm
+    from benchmarks.fake_llm import fake_chat_model_factory
+
+    llm.set_chat_model_factory(fake_chat_model_factory(
+        latency_median_ms=args.latency_median_ms,
+        latency_sigma=args.latency_sigma,
+        tail_prob=args.tail_prob,
+        tail_ms=args.tail_ms,
+        quota_rpm=args.quota_rpm,
+    ))
+
+    from db.database import create_database
+    from benchmarks.fixtures import seed_catalogue
+
+    db = create_database()
+    db.connect()
+    seed_catalogue(db, books=args.books)
+    db.close()
+
+    import graph as graph_module
+
+    mix = args.mix
+    results = []
+    tracemalloc.start()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    heap_before, _ = tracemalloc.get_traced_memory()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_session(graph_module.graph_builder, i, args, mix, results) for i in range(args.sessions)
+    ))
+    elapsed = time.perf_counter() - start
+
+    import tracing
+
+    decisions = tracing.metrics.counter_total("agent_router_decisions_total")
+    routed = decisions - tracing.metrics.counter_value("agent_router_decisions_total", route="llm")
+    llm_saved = tracing.metrics.counter_total("agent_llm_calls_saved_total")
+    llm_stats = {
+        "routed_turns": int(routed),
+        "llm_calls_saved": int(llm_saved),
+        "scheduler_retries": int(tracing.metrics.counter_total("llm_scheduler_retries_total")),
+        "scheduler_backoffs": int(tracing.metrics.counter_total("llm_scheduler_backoff_total")),
+        "llm_errors": int(tracing.metrics.counter_total("llm_scheduler_requests_total", result="error")),
+        "llm_timeouts": int(tracing.metrics.counter_total("llm_scheduler_requests_total", result="timeout")),
+        "deadline_exceeded": int(tracing.metrics.counter_total("agent_deadline_exceeded_total")),
+        "hedges_sent": int(tracing.metrics.counter_total("llm_hedges_total", result="sent")),
+        "hedges_won": int(tracing.metrics.counter_total("llm_hedges_total", result="won")),
+    }
+
+    heap_after, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return summarize(results, elapsed, {
+        "heap_growth_mb": (heap_after - heap_before) / 2 ** 20,
+        "heap_peak_mb": heap_peak / 2 ** 20,
+        "max_rss_growth_mb": (rss_after - rss_before) / 1024,
+        "checkpoint_mb": checkpoint_bytes(graph_module.memory) / 2 ** 20,
+    }, args, llm_stats)
+
+
+def summarize(results: list, elapsed: float, memory: dict, args, llm: dict) -> dict:
+    groups = defaultdict(list)
+    for result in results:
+        groups[result["scenario"]].append(result)
+    groups["all"] = results
+
+    report = {
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_turns_per_s": round(len(results) / elapsed, 3) if elapsed else 0.0,
+        "memory": {k: round(v, 3) for k, v in memory.items()},
+        "llm": llm,
+        "scenarios": {},
+    }
+    for name, group in groups.items():
+        latencies = [r["latency"] for r in group if r["error"] is None]
+        errors = [r["error"] for r in group if r["error"] is not None]
+        report["scenarios"][name] = {
+            "turns": len(group),
+            "errors": len(errors),
+            "p50_s": round(percentile(latencies, 50), 3),
+            "p95_s": round(percentile(latencies, 95), 3),
+            "p99_s": round(percentile(latencies, 99), 3),
+            "sample_error": errors[0] if errors else None,
+        }
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"Sessions: {report['sessions']} x {report['turns_per_session']} turns "
+          f"trong {report['elapsed_s']}s -> {report['throughput_turns_per_s']} turns/s")
+    print(f"{'scenario':<10}{'turns':>7}{'errors':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, stats in report["scenarios"].items():
+        print(f"{name:<10}{stats['turns']:>7}{stats['errors']:>8}"
+              f"{stats['p50_s']:>9.3f}{stats['p95_s']:>9.3f}{stats['p99_s']:>9.3f}")
+    for key, value in report["memory"].items():
+        print(f"{key}: {value}")
+    for key, value in report["llm"].items():
+        print(f"{key}: {value}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test nhiều session đồng thời trên graph_builder")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3, help="số lượt chat mỗi session")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("upload=1,search=1,quiz=1"))
+    parser.add_argument("--latency-median-ms", type=float, default=800.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="xác suất một request bị chậm đuôi")
+    parser.add_argument("--tail-ms", type=float, default=5000.0)
+    parser.add_argument("--think-time-ms", type=float, default=0.0, help="thời gian nghỉ trung bình giữa các lượt")
+    parser.add_argument("--upload-file", default="keyboard-shortcuts-windows.pdf", help="file trong uploads/")
+    parser.add_argument("--books", type=int, default=200, help="số sách giả khi dùng DB stand-in")
+    parser.add_argument("--real-db", action="store_true", help="dùng MySQL thật thay cho SQLite stand-in")
+    parser.add_argument("--no-router", action="store_true", help="tắt intent router, mọi lượt đều hỏi LLM trước")
+    parser.add_argument("--quota-rpm", type=float, default=0.0, help="fake LLM trả lỗi 429 khi vượt số request/phút này")
+    parser.add_argument("--llm-rpm", type=float, default=None, help="giới hạn request/phút của scheduler (LLM_RPM)")
+    parser.add_argument("--no-scheduler", action="store_true", help="tắt LLM scheduler, model tự retry như trước")
+    parser.add_argument("--turn-budget-s", type=float, default=None, help="thời gian tối đa mỗi lượt chat (TURN_BUDGET_S)")
+    parser.add_argument("--hedging", action="store_true", help="bật hedging request LLM (LLM_HEDGING)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="ghi báo cáo ra file JSON")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    if not args.real_db:
+        os.environ["DB_BACKEND"] = "sqlite"
+        os.environ.setdefault("DB_SQLITE_PATH", os.path.join("data", "loadtest.db"))
+    if args.no_router:
+        os.environ["INTENT_ROUTER"] = "0"
+    if args.no_scheduler:
+        os.environ["LLM_SCHEDULER"] = "0"
+    if args.hedging:
+        os.environ["LLM_HEDGING"] = "1"
+    if args.llm_rpm is not None:
+        os.environ["LLM_RPM"] = str(args.llm_rpm)
+    # question_generator kiểm tra API key trước khi gọi model
+    os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+
+    report = asyncio.run(run_load(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
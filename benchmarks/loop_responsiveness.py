@@ -0,0 +1,214 @@
+"""
+Event loop có còn phản hồi khi tool đang bận không: --turns lượt chat chạy đồng thời trên cùng một event loop
+(như astream_events trong app.py), trong khi một coroutine "UI" ngủ 10 ms mỗi vòng và đo độ trễ khi được chạy lại.
+Trước khi đo, mỗi kịch bản chạy một lượt khởi động (import module tool, process worker, cache): độ trễ lúc
+khởi động lạnh được đo riêng bằng benchmarks/startup.py.
+
+--mode:
+- async (mặc định): tool và node gọi model dùng bản async (ASYNC_TOOLS=1), chờ DB/model/worker bằng asyncio.
+- sync: ASYNC_TOOLS=0, tool sync chạy trên thread của executor mặc định như trước
+  (số lượt chạy song song bị giới hạn bởi số thread của executor).
+
+--compare chạy cả hai chế độ (mỗi chế độ một process) và exit code 1 nếu có lượt lỗi hoặc chế độ async:
+- có độ trễ p99 của event loop cao hơn chế độ sync quá --lag-margin-ms,
+- chạy hết các lượt chậm hơn chế độ sync, hoặc dùng nhiều thread hơn chế độ sync.
+Async làm cùng lượng việc trong thời gian ngắn hơn nhiều nên việc của framework (langgraph, astream_events)
+dồn dày hơn trên loop; biên --lag-margin-ms dành cho phần đó, không cho việc chặn loop của tool.
+Chạy một chế độ: exit code 1 nếu có lượt lỗi, hoặc ở chế độ async độ trễ p99 vượt --max-lag-ms.
+--profile sampling|cprofile: profile cả lô lượt chat bằng profiling.py (tìm việc CPU còn chạy trên thread của loop).
+
+Ví dụ:
+    python -m benchmarks.loop_responsiveness --compare
+    python -m benchmarks.loop_responsiveness --mode sync
+    python -m benchmarks.loop_responsiveness --turns 32 --latency-ms 1500
+    python -m benchmarks.loop_responsiveness --profile sampling
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from uuid import uuid4
+
+TICK_S = 0.01
+MODES = ("async", "sync")
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))] if values else 0.0
+
+
+async def measure_lag(stop: asyncio.Event, lags: list, threads: list) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_S)
+        lags.append(time.perf_counter() - start - TICK_S)
+        threads.append(threading.active_count())
+
+
+async def run_turn(graph_builder, scenario: str, message: str, latencies: list, errors: list) -> None:
+    from deadline import with_deadline
+
+    config = {"configurable": {"thread_id": f"loop-{uuid4().hex[:8]}"}, "recursion_limit": 15}
+    start = time.perf_counter()
+    try:
+        async for _event in graph_builder.astream_events({"messages": [("user", message)]},
+                                                          config=with_deadline(config), version="v2"):
+            pass
+        latencies.append(time.perf_counter() - start)
+    except Exception as e:
+        errors.append(f"{scenario}: {type(e).__name__}: {e}")
+
+
+async def run(args) -> dict:
+    import llm
+    from benchmarks.fake_llm import fake_chat_model_factory
+
+    llm.set_chat_model_factory(fake_chat_model_factory(latency_median_ms=args.latency_ms, latency_sigma=0.2))
+
+    from benchmarks.fixtures import seed_catalogue
+    from benchmarks.load_test import build_message
+    from db.database import create_database
+
+    db = create_database()
+    db.connect()
+    seed_catalogue(db, books=50)
+    db.close()
+
+    import graph as graph_module
+    import tracing
+    from profiling import profile_turn
+
+    # Như app.py: log ghi trên thread nền
+    tracing.log_in_background()
+
+    scenarios = ("search", "quiz", "upload")
+    turns = [scenarios[i % len(scenarios)] for i in range(args.turns)]
+    messages = [(scenario, build_message(scenario, args.upload_file)) for scenario in turns]
+
+    # Khởi động nóng (import module tool, process worker, cache category/tài liệu): mỗi kịch bản một lượt, chưa đo
+    latencies, errors = [], []
+    for scenario in scenarios:
+        await run_turn(graph_module.graph_builder, scenario, build_message(scenario, args.upload_file), [], errors)
+
+    stop, lags, threads = asyncio.Event(), [], []
+    ticker = asyncio.ensure_future(measure_lag(stop, lags, threads))
+    start = time.perf_counter()
+    with profile_turn(args.profile, label=f"loop_{args.mode}") as profile:
+        await asyncio.gather(*(run_turn(graph_module.graph_builder, scenario, message, latencies, errors)
+                               for scenario, message in messages))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    if profile is not None:
+        print(f"profile: {', '.join(profile.files)}", file=sys.stderr)
+
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "turn_p50_s": round(percentile(latencies, 50), 2),
+        "turn_max_s": round(max(latencies, default=0.0), 2),
+        "loop_lag_p50_ms": round(percentile(lags, 50) * 1000, 1),
+        "loop_lag_p99_ms": round(percentile(lags, 99) * 1000, 1),
+        "loop_lag_max_ms": round(max(lags, default=0.0) * 1000, 1),
+        "peak_threads": max(threads, default=0),
+        "errors": errors,
+    }
+
+
+def compare(args) -> int:
+    """Chạy từng chế độ trong một process riêng (ASYNC_TOOLS đọc lúc import) và so sánh async với sync."""
+    reports = {}
+    for mode in MODES:
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.loop_responsiveness", "--mode", mode, "--json",
+             "--turns", str(args.turns), "--latency-ms", str(args.latency_ms), "--upload-file", args.upload_file,
+             "--seed", str(args.seed)],
+            capture_output=True,
+            text=True,
+        )
+        if not proc.stdout.strip():
+            print(f"chế độ {mode} lỗi:\n{proc.stderr[-2000:]}")
+            return 1
+        reports[mode] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    print(f"{'chế độ':<10}{'thời gian (s)':>15}{'lượt p50 (s)':>14}{'lag p50 (ms)':>14}{'lag p99 (ms)':>14}"
+          f"{'lag max (ms)':>14}{'thread':>8}")
+    for mode, report in reports.items():
+        print(f"{mode:<10}{report['elapsed_s']:>15}{report['turn_p50_s']:>14}{report['loop_lag_p50_ms']:>14}"
+              f"{report['loop_lag_p99_ms']:>14}{report['loop_lag_max_ms']:>14}{report['peak_threads']:>8}")
+
+    async_, sync = reports["async"], reports["sync"]
+    failures = [f"{mode}: {len(report['errors'])} lượt lỗi, ví dụ: {report['errors'][0]}"
+                for mode, report in reports.items() if report["errors"]]
+    if async_["loop_lag_p99_ms"] > sync["loop_lag_p99_ms"] + args.lag_margin_ms:
+        failures.append(f"async: độ trễ p99 {async_['loop_lag_p99_ms']} ms cao hơn sync {sync['loop_lag_p99_ms']} ms "
+                        f"quá {args.lag_margin_ms:g} ms")
+    if async_["elapsed_s"] > sync["elapsed_s"]:
+        failures.append(f"async: chạy hết {args.turns} lượt mất {async_['elapsed_s']}s, chậm hơn sync "
+                        f"{sync['elapsed_s']}s")
+    if async_["peak_threads"] > sync["peak_threads"]:
+        failures.append(f"async: {async_['peak_threads']} thread, nhiều hơn sync {sync['peak_threads']}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Độ phản hồi của event loop khi tool đang bận")
+    parser.add_argument("--turns", type=int, default=24, help="số lượt chat chạy đồng thời")
+    parser.add_argument("--latency-ms", type=float, default=1000.0, help="độ trễ của fake LLM")
+    parser.add_argument("--upload-file", default="keyboard-shortcuts-windows.pdf", help="file trong uploads/")
+    parser.add_argument("--mode", choices=MODES, default="async",
+                        help="async: ASYNC_TOOLS=1; sync: tool sync trên executor")
+    parser.add_argument("--compare", action="store_true", help="chạy cả hai chế độ và so sánh")
+    parser.add_argument("--json", action="store_true", help="in kết quả dạng JSON (dùng cho --compare)")
+    parser.add_argument("--max-lag-ms", type=float, default=50.0, help="ngưỡng độ trễ p99 khi chỉ chạy chế độ async")
+    parser.add_argument("--lag-margin-ms", type=float, default=10.0,
+                        help="độ trễ p99 của async được cao hơn sync tối đa chừng này (một nhịp đo)")
+    parser.add_argument("--profile", choices=("", "sampling", "cprofile"), default="",
+                        help="profile cả lô lượt chat (profiling.py), file lưu trong profiles/")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(args)
+
+    random.seed(args.seed)
+    os.environ["ASYNC_TOOLS"] = "1" if args.mode == "async" else "0"
+    os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+    os.environ["DB_BACKEND"] = "sqlite"
+    data = tempfile.TemporaryDirectory(prefix="loop-bench-")
+    os.environ["DB_SQLITE_PATH"] = os.path.join(data.name, "library.db")
+    os.environ["CACHE_DIR"] = data.name
+
+    report = asyncio.run(run(args))
+    data.cleanup()
+    for name in ("hàm số", "tế bào", "thuật toán"):
+        path = os.path.join("output", f"bo_de_{name.replace(' ', '_')}.docx")
+        if os.path.exists(path):
+            os.remove(path)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+        return 1 if report["errors"] else 0
+    print(f"tool {args.mode}: {args.turns} lượt đồng thời trong {report['elapsed_s']}s, "
+          f"mỗi lượt p50 {report['turn_p50_s']}s, chậm nhất {report['turn_max_s']}s")
+    print(f"độ trễ event loop: p50 {report['loop_lag_p50_ms']} ms, p99 {report['loop_lag_p99_ms']} ms, "
+          f"max {report['loop_lag_max_ms']} ms; số thread tối đa {report['peak_threads']}")
+    if report["errors"]:
+        print(f"{len(report['errors'])} lượt lỗi, ví dụ: {report['errors'][0]}")
+        return 1
+    if args.mode == "async" and report["loop_lag_p99_ms"] > args.max_lag_ms:
+        print(f"FAIL: event loop bị chặn quá {args.max_lag_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
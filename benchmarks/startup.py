@@ -0,0 +1,109 @@
+"""
+Đo cold start khi import graph (giống một worker Streamlit mới) bằng python -X importtime.
+
+Ví dụ:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget-ms 800 --runs 5 --module graph
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+# Ngân sách cold start (ms) cho import graph trên máy dev; vượt ngưỡng thì exit code 1
+COLD_START_BUDGET_MS = 1000
+
+# Các module nặng không được import trước lượt chat đầu tiên
+DEFERRED_MODULES = (
+    "PyPDF2",
+    "PIL",
+    "docx",
+    "langchain_google_genai",
+    "google.genai",
+    "google.ai.generativelanguage",
+    "langchain_tavily",
+    "mysql.connector",
+)
+
+
+def run_importtime(module: str) -> tuple[float, list[tuple[str, int, int]], list[str]]:
+    """
+    Import module trong process mới với -X importtime.
+
+    :return: (thời gian cumulative của module, danh sách (tên, self_us, cumulative_us), module nặng đã bị import)
+    """
+    code = (
+        f"import {module}, sys; "
+        f"print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "0"},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+
+    rows = []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        stripped = name.strip()
+        rows.append((stripped, int(self_us), int(cumulative_us)))
+        if stripped == module:
+            total_us = int(cumulative_us)
+
+    loaded = [m for m in proc.stdout.strip().split(",") if m]
+    return total_us / 1000, rows, loaded
+
+
+def top_packages(rows: list[tuple[str, int, int]], limit: int) -> list[tuple[str, float]]:
+    """Gộp self time theo package gốc."""
+    totals = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name.split(".")[0]] += self_us
+    return [(name, us / 1000) for name, us in sorted(totals.items(), key=lambda x: x[1], reverse=True)[:limit]]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark cold start (import time)")
+    parser.add_argument("--module", default="graph")
+    parser.add_argument("--runs", type=int, default=3, help="số process đo (lấy median)")
+    parser.add_argument("--budget-ms", type=float, default=COLD_START_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    # Lần đầu để ghi .pyc, không tính vào kết quả
+    run_importtime(args.module)
+
+    timings, rows, loaded = [], [], []
+    for _ in range(args.runs):
+        total_ms, rows, loaded = run_importtime(args.module)
+        timings.append(total_ms)
+
+    median = statistics.median(timings)
+    print(f"import {args.module}: median {median:.1f} ms (runs: {', '.join(f'{t:.1f}' for t in timings)})")
+    print(f"budget: {args.budget_ms:.0f} ms")
+    print("Package tốn thời gian nhất (self time):")
+    for name, ms in top_packages(rows, args.top):
+        print(f"  {name:<30}{ms:>9.1f} ms")
+
+    ok = True
+    if loaded:
+        print(f"FAIL: module nặng bị import lúc khởi động: {', '.join(loaded)}")
+        ok = False
+    if median > args.budget_ms:
+        print(f"FAIL: vượt ngân sách cold start ({median:.1f} > {args.budget_ms:.0f} ms)")
+        ok = False
+    if ok:
+        print("OK")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
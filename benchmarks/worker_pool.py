@@ -0,0 +1,124 @@
+"""
+Ảnh hưởng của việc nặng CPU trong tool lên các session khác cùng process (GIL), có và không có process worker.
+
+Trong khi --jobs file .txt lớn được trích xuất song song qua DocumentStore, một thread "UI" ngủ 10 ms mỗi vòng
+và đo độ trễ khi được chạy lại (giống thread phục vụ session khác của Streamlit).
+Sau đó kiểm tra: thay process sau WORKER_MAX_JOBS job, và hủy lượt chat thì process đang chạy bị terminate.
+
+Ví dụ:
+    python -m benchmarks.worker_pool
+    python -m benchmarks.worker_pool --processes 0     # chạy trên thread như trước
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+TICK_S = 0.01
+
+
+def write_text_file(folder: str, index: int, size_mb: float) -> str:
+    path = os.path.join(folder, f"sach-{index}.txt")
+    line = f"Dòng {index}: nội dung sách giáo khoa dùng để đo thời gian trích xuất văn bản.\n"
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(int(size_mb * 2 ** 20 / len(line.encode("utf-8")))):
+            f.write(line)
+    return path
+
+
+def measure_lag(stop: threading.Event, lags: list) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        time.sleep(TICK_S)
+        lags.append(time.perf_counter() - start - TICK_S)
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))] if values else 0.0
+
+
+def busy(seconds: float) -> int:
+    """Job CPU thuần (module-level để pickle được)."""
+    end, count = time.perf_counter() + seconds, 0
+    while time.perf_counter() < end:
+        count += 1
+    return count
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Process worker cho tool nặng CPU")
+    parser.add_argument("--processes", type=int, default=2, help="WORKER_PROCESSES (0 = chạy trên thread)")
+    parser.add_argument("--jobs", type=int, default=4, help="số file trích xuất song song")
+    parser.add_argument("--size-mb", type=float, default=20.0, help="kích thước mỗi file .txt")
+    parser.add_argument("--max-jobs", type=int, default=3, help="WORKER_MAX_JOBS cho phần kiểm tra thay process")
+    args = parser.parse_args(argv)
+
+    os.environ["WORKER_PROCESSES"] = str(args.processes)
+    os.environ["WORKER_MAX_JOBS"] = str(args.max_jobs)
+    cache = tempfile.TemporaryDirectory(prefix="worker-bench-")
+    os.environ["CACHE_DIR"] = cache.name
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    import tracing
+    from cancellation import CancelToken, TurnCancelled, use
+    from tools.documents import DocumentStore
+    from workers import run_in_worker
+
+    store = DocumentStore(workers=args.jobs)
+    with tempfile.TemporaryDirectory() as folder:
+        files = [write_text_file(folder, i, args.size_mb) for i in range(args.jobs)]
+        if args.processes:
+            # Khởi động process trước để không tính thời gian spawn vào độ trễ
+            run_in_worker(busy, 0.0)
+
+        stop, lags = threading.Event(), []
+        ticker = threading.Thread(target=measure_lag, args=(stop, lags))
+        ticker.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            pages = sum(d.page_count for d in executor.map(store.get, files))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        ticker.join()
+    cache.cleanup()
+
+    print(f"processes={args.processes}: {args.jobs} file x {args.size_mb} MB, {pages} trang trong {elapsed:.2f}s")
+    print(f"độ trễ thread UI: p50 {percentile(lags, 50) * 1000:.1f} ms, p99 {percentile(lags, 99) * 1000:.1f} ms, "
+          f"max {max(lags, default=0) * 1000:.1f} ms")
+
+    if not args.processes:
+        return 0
+
+    ok = True
+    for _ in range(args.max_jobs * 2):
+        run_in_worker(busy, 0.01)
+    recycled = tracing.metrics.counter_value("worker_recycles_total", reason="jobs")
+    print(f"thay process sau {args.max_jobs} job: {int(recycled)} lần")
+    ok &= recycled >= 1
+
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel, args=("benchmark",)).start()
+    start = time.perf_counter()
+    try:
+        with use(token):
+            run_in_worker(busy, 30.0)
+        ok = False
+    except TurnCancelled:
+        pass
+    time.sleep(0.3)
+    terminated = tracing.metrics.counter_value("worker_recycles_total", reason="cancelled")
+    print(f"hủy job 30s sau 0.2s: dừng sau {time.perf_counter() - start - 0.3:.2f}s, terminate {int(terminated)} process")
+    ok &= terminated == 1
+    print(f"job sau khi hủy: {run_in_worker(busy, 0.01) > 0}")
+    if not ok:
+        print("FAIL")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
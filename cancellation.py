@@ -0,0 +1,148 @@
+"""
+Hủy hợp tác (cooperative cancellation) lượt chat đang chạy dở.
+
+Mỗi lượt chat có một CancelToken, truyền qua config của LangGraph: configurable["cancel_token"].
+Khi người dùng gửi tin nhắn mới hoặc bấm "Clear message" giữa chừng, app.py hủy token của lượt cũ:
+- task astream_events của lượt cũ bị cancel;
+- tool, trích xuất file, truy vấn DB, LLM scheduler gọi check() giữa các trang/lô/truy vấn và dừng ở điểm kiểm tra kế tiếp;
+- việc đã đăng ký on_cancel (job chưa chạy trong pool, process worker) bị hủy/dừng ngay.
+
+TurnCancelled kế thừa BaseException (giống asyncio.CancelledError) để không bị các khối
+`except Exception` trong tool nuốt mất rồi trả về như một kết quả lỗi bình thường.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from langchain_core.runnables.config import var_child_runnable_config
+
+from tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+CANCEL_TOKEN_KEY = "cancel_token"
+
+# Token của việc đang chạy ngoài config của LangGraph (thread của DocumentStore, pool chấm CV, ...)
+_current_token: ContextVar[Optional["CancelToken"]] = ContextVar("cancel_token", default=None)
+
+
+class TurnCancelled(BaseException):
+    """Lượt chat đã bị hủy (người dùng gửi tin nhắn mới hoặc xóa hội thoại)."""
+
+
+class CancelToken:
+    """Cờ hủy dùng chung giữa event loop, thread của graph và worker; hủy nhiều lần chỉ có tác dụng lần đầu."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self._future: Optional[Future] = None
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Hủy token và chạy các callback on_cancel. Trả về False nếu token đã bị hủy trước đó."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        metrics.inc("agent_turns_cancelled_total", help="Số lượt chat bị hủy giữa chừng", reason=reason)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Lỗi khi hủy việc đang chạy: {e}")
+        return True
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Đăng ký việc cần làm khi token bị hủy (chạy ngay nếu token đã bị hủy)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def future(self) -> Future:
+        """Future hoàn thành khi token bị hủy: chờ kết quả và chờ hủy cùng lúc bằng wait/asyncio.wrap_future."""
+        with self._lock:
+            if self._future is None:
+                self._future = Future()
+                if self._event.is_set():
+                    self._future.set_result(None)
+                else:
+                    self._callbacks.append(lambda: self._future.set_result(None))
+            return self._future
+
+    def check(self, stage: str) -> None:
+        if self._event.is_set():
+            metrics.inc("agent_cancelled_work_total", help="Số bước dừng giữa chừng vì lượt chat bị hủy", stage=stage)
+            raise TurnCancelled(f"Lượt chat đã bị hủy ({self.reason}) tại {stage}")
+
+
+def with_cancel_token(config: dict, token: CancelToken) -> dict:
+    """Bản sao config có token hủy của lượt chat."""
+    configurable = dict(config.get("configurable") or {})
+    configurable[CANCEL_TOKEN_KEY] = token
+    return {**config, "configurable": configurable}
+
+
+def current_token() -> Optional[CancelToken]:
+    """Token của lượt chat đang chạy: token đặt bằng use() nếu có, nếu không thì đọc từ config của LangChain."""
+    token = _current_token.get()
+    if token is not None:
+        return token
+    config = var_child_runnable_config.get() or {}
+    token = (config.get("configurable") or {}).get(CANCEL_TOKEN_KEY)
+    return token if isinstance(token, CancelToken) else None
+
+
+@contextmanager
+def use(token: Optional[CancelToken]):
+    """Đặt token cho code chạy trên thread khác (pool không mang theo config của LangChain)."""
+    marker = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(marker)
+
+
+def check(stage: str, token: Optional[CancelToken] = None) -> None:
+    """Điểm kiểm tra: ném TurnCancelled nếu lượt chat đang chạy đã bị hủy, stage dùng làm nhãn metric."""
+    token = current_token() if token is None else token
+    if token is not None:
+        token.check(stage)
+
+
+async def wait_future(future: Future, token: Optional[CancelToken] = None, timeout: Optional[float] = None) -> None:
+    """
+    Chờ trên event loop tới khi future của thread/process xong, token bị hủy hoặc hết timeout (không ném lỗi).
+    Không bọc future bằng asyncio.wrap_future: task bị cancel không hủy theo future (job dùng chung giữa các lượt),
+    lỗi của job không bị log "exception was never retrieved"; người gọi đọc kết quả bằng future.result().
+    """
+    loop = asyncio.get_running_loop()
+    done = asyncio.Event()
+
+    def wake(_=None):
+        if not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(done.set)
+            except RuntimeError:
+                pass
+
+    future.add_done_callback(wake)
+    if token is not None:
+        token.future().add_done_callback(wake)
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
@@ -0,0 +1,92 @@
+import re
+from typing import List, NamedTuple, Tuple
+
+from tools.text_utils import estimate_tokens
+
+# Số token tối đa mỗi chunk
+CHUNK_TOKENS = 800
+
+# Dòng tiêu đề chương/phần/bài: "Chương 3", "CHƯƠNG IV: ...", "Bài 12 - ...", "Chapter 2"
+HEADING_PATTERN = re.compile(
+    r"^\s*(chương|chuong|phần|phan|bài|bai|chapter|part)\s+([0-9]+|[ivxlcdm]+)\b\s*[.:\-–]?\s*(.*)$",
+    re.IGNORECASE,
+)
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?…])\s+")
+
+
+class Chunk(NamedTuple):
+    chunk_index: int
+    chapter_index: int
+    chapter_title: str
+    content: str
+    token_count: int
+
+
+def split_chapters(text: str) -> List[Tuple[str, str]]:
+    """
+    Tách văn bản theo dòng tiêu đề chương/phần/bài.
+
+    :return: danh sách (tiêu đề, nội dung); phần trước tiêu đề đầu tiên có tiêu đề "Mở đầu"
+    """
+    chapters = []
+    title, lines = "Mở đầu", []
+    for line in (text or "").splitlines():
+        if len(line) <= 150 and HEADING_PATTERN.match(line):
+            if any(l.strip() for l in lines) or chapters:
+                chapters.append((title, "\n".join(lines).strip()))
+            title, lines = line.strip(), []
+        else:
+            lines.append(line)
+    if any(l.strip() for l in lines) or not chapters:
+        chapters.append((title, "\n".join(lines).strip()))
+    return chapters
+
+
+def _split_long(paragraph: str, max_tokens: int) -> List[str]:
+    """Cắt đoạn văn quá dài theo câu, câu quá dài thì cắt theo số ký tự."""
+    pieces, current = [], ""
+    for sentence in _SENTENCE_SPLIT.split(paragraph):
+        while estimate_tokens(sentence) > max_tokens:
+            head, sentence = sentence[:max_tokens * 4], sentence[max_tokens * 4:]
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(head)
+        if current and estimate_tokens(current) + estimate_tokens(sentence) > max_tokens:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_book(content: str, max_tokens: int = CHUNK_TOKENS) -> List[Chunk]:
+    """
+    Chia nội dung sách thành chunk theo chương, mỗi chunk không vượt max_tokens và không cắt ngang đoạn văn
+    (trừ đoạn dài hơn max_tokens). Chương đánh số theo thứ tự xuất hiện, "Mở đầu" là chương 0.
+    """
+    chunks: List[Chunk] = []
+    chapters = split_chapters(content)
+    has_intro = chapters and chapters[0][0] == "Mở đầu"
+
+    for position, (title, body) in enumerate(chapters):
+        chapter_index = position if has_intro else position + 1
+        paragraphs = []
+        for paragraph in _PARAGRAPH_SPLIT.split(body):
+            paragraph = paragraph.strip()
+            if paragraph:
+                paragraphs.extend(_split_long(paragraph, max_tokens))
+
+        current = ""
+        for paragraph in paragraphs or [""]:
+            if current and estimate_tokens(current) + estimate_tokens(paragraph) > max_tokens:
+                chunks.append(Chunk(len(chunks), chapter_index, title, current, estimate_tokens(current)))
+                current = paragraph
+            else:
+                current = f"{current}\n\n{paragraph}" if current else paragraph
+        if current or not paragraphs:
+            chunks.append(Chunk(len(chunks), chapter_index, title, current, estimate_tokens(current)))
+    return chunks
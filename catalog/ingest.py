@@ -0,0 +1,190 @@
+"""
+Job tách Book.Content thành chunk theo chương, lưu vào bảng BookChunk.
+Chỉ xử lý lại sách có nội dung thay đổi (so sánh hash với bảng BookIngest).
+
+Ví dụ:
+    python -m catalog.ingest
+    python -m catalog.ingest --full --max-tokens 600
+    python -m catalog.ingest --book-id 12 --book-id 15
+"""
+import argparse
+import hashlib
+import logging
+import sys
+import threading
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from catalog.chunking import CHUNK_TOKENS, chunk_book
+from db.database import create_database
+
+logger = logging.getLogger(__name__)
+
+# Số sách đọc mỗi lượt (phân trang theo BookID để không nạp cả bảng vào bộ nhớ)
+BATCH_SIZE = 50
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS BookChunk (
+        BookID INT NOT NULL,
+        ChunkIndex INT NOT NULL,
+        ChapterIndex INT NOT NULL,
+        ChapterTitle VARCHAR(255),
+        Content MEDIUMTEXT,
+        TokenCount INT NOT NULL,
+        PRIMARY KEY (BookID, ChunkIndex)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS BookIngest (
+        BookID INT NOT NULL PRIMARY KEY,
+        ContentHash CHAR(64) NOT NULL,
+        ChunkCount INT NOT NULL,
+        TokenCount INT NOT NULL,
+        IngestedAt DATETIME NOT NULL
+    )
+    """,
+]
+
+
+def ensure_schema(db) -> None:
+    """Tạo bảng BookChunk/BookIngest nếu chưa có (cú pháp chạy được trên cả MySQL và SQLite)."""
+    for statement in SCHEMA:
+        db.execute_query(statement)
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def ensure_schema_once(db) -> None:
+    """ensure_schema một lần mỗi process, cho đường request (read_book, đề theo chương): không chạy DDL mỗi lượt."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            ensure_schema(db)
+            _schema_ready = True
+
+
+def content_hash(content: Optional[str]) -> str:
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+def iter_books(db, book_ids: Optional[Iterable[int]] = None, batch_size: int = BATCH_SIZE) -> Iterator[Tuple[int, str, str]]:
+    """Duyệt (BookID, BookName, Content) theo từng batch."""
+    if book_ids:
+        for book_id in book_ids:
+            yield from db.fetch("SELECT BookID, BookName, Content FROM Book WHERE BookID = %s", (book_id,))
+        return
+
+    last_id = 0
+    while True:
+        rows = db.fetch(
+            "SELECT BookID, BookName, Content FROM Book WHERE BookID > %s ORDER BY BookID LIMIT %s",
+            (last_id, batch_size),
+        )
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+
+def ingest_book(db, book_id: int, content: str, digest: str, max_tokens: int = CHUNK_TOKENS) -> int:
+    """Ghi lại toàn bộ chunk của một sách. Trả về số chunk."""
+    chunks = chunk_book(content or "", max_tokens)
+    # Một transaction: lỗi giữa chừng không để lại sách chỉ có một phần chunk
+    with db.transaction():
+        db.execute_query("DELETE FROM BookChunk WHERE BookID = %s", (book_id,))
+        db.execute_many(
+            "INSERT INTO BookChunk (BookID, ChunkIndex, ChapterIndex, ChapterTitle, Content, TokenCount) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            [(book_id, c.chunk_index, c.chapter_index, c.chapter_title[:255], c.content, c.token_count) for c in chunks],
+        )
+        db.execute_query("DELETE FROM BookIngest WHERE BookID = %s", (book_id,))
+        db.execute_query(
+            "INSERT INTO BookIngest (BookID, ContentHash, ChunkCount, TokenCount, IngestedAt) VALUES (%s, %s, %s, %s, %s)",
+            (book_id, digest, len(chunks), sum(c.token_count for c in chunks), datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+        )
+    return len(chunks)
+
+
+def ensure_ingested(db, book_id: int, max_tokens: int = CHUNK_TOKENS) -> bool:
+    """
+    Chia chunk ngay cho một sách nếu job chưa xử lý nó (hoặc nội dung đã đổi).
+
+    :return: False nếu không có sách với book_id
+    """
+    ensure_schema_once(db)
+    # Hash tính trong DB: sách đã chia chunk và không đổi thì không tải Book.Content về
+    rows = db.fetch(
+        "SELECT SHA2(COALESCE(Book.Content, ''), 256), BookIngest.ContentHash FROM Book "
+        "LEFT JOIN BookIngest ON BookIngest.BookID = Book.BookID WHERE Book.BookID = %s",
+        (book_id,),
+    )
+    if not rows:
+        return False
+    digest, known = rows[0]
+    if known != digest:
+        content = db.fetch("SELECT Content FROM Book WHERE BookID = %s", (book_id,))[0][0]
+        ingest_book(db, book_id, content, content_hash(content), max_tokens)
+    return True
+
+
+def ingest_catalogue(db, full: bool = False, book_ids: Optional[List[int]] = None,
+                     max_tokens: int = CHUNK_TOKENS) -> dict:
+    """
+    Chạy ingestion cho toàn bộ catalogue (hoặc danh sách book_ids).
+
+    :param full: xử lý lại cả sách không đổi
+    :param book_ids: chỉ xử lý các sách này
+    :param max_tokens: số token tối đa mỗi chunk
+    :return: thống kê {processed, skipped, chunks, removed}
+    """
+    ensure_schema(db)
+    known = dict(db.fetch("SELECT BookID, ContentHash FROM BookIngest"))
+    stats = {"processed": 0, "skipped": 0, "chunks": 0, "removed": 0}
+    seen = set()
+
+    for book_id, book_name, content in iter_books(db, book_ids):
+        seen.add(book_id)
+        digest = content_hash(content)
+        if not full and known.get(book_id) == digest:
+            stats["skipped"] += 1
+            continue
+        count = ingest_book(db, book_id, content, digest, max_tokens)
+        stats["processed"] += 1
+        stats["chunks"] += count
+        logger.info(f"Đã chia '{book_name}' (BookID={book_id}) thành {count} chunk")
+
+    # Sách đã bị xóa khỏi bảng Book
+    if not book_ids:
+        for book_id in set(known) - seen:
+            with db.transaction():
+                db.execute_query("DELETE FROM BookChunk WHERE BookID = %s", (book_id,))
+                db.execute_query("DELETE FROM BookIngest WHERE BookID = %s", (book_id,))
+            stats["removed"] += 1
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Chia nội dung sách thành chunk theo chương")
+    parser.add_argument("--full", action="store_true", help="xử lý lại toàn bộ, bỏ qua hash")
+    parser.add_argument("--book-id", type=int, action="append", help="chỉ xử lý sách này (lặp lại được)")
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_TOKENS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    db = create_database()
+    db.connect()
+    try:
+        stats = ingest_catalogue(db, full=args.full, book_ids=args.book_id, max_tokens=args.max_tokens)
+    finally:
+        db.close()
+    logger.info(f"Ingestion xong: {stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
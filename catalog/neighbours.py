@@ -0,0 +1,274 @@
+"""
+Chỉ mục "sách tương tự": vector TF-IDF (hashing trick, NumPy) của nội dung từng sách
+và top-k sách gần nhất theo cosine, tính trước và lưu vào bảng BookNeighbour.
+
+Ma trận TF và top-k hiện tại được lưu ra file (settings.neighbour_index_path) để lần chạy sau
+chỉ tính lại cho sách mới/đổi nội dung thay vì toàn bộ n x n.
+
+Ví dụ:
+    python -m catalog.neighbours
+    python -m catalog.neighbours --full --top-k 20
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from catalog.ingest import content_hash, iter_books
+from db.database import create_database
+from settings import get_settings
+from tools.text_utils import fold_text
+
+logger = logging.getLogger(__name__)
+
+# Số chiều vector (số bucket của hashing trick)
+DIMENSIONS = 2048
+# Số sách tương tự lưu cho mỗi sách
+TOP_K = 10
+# Số hàng nhân ma trận mỗi lượt khi tính top-k (giới hạn bộ nhớ: BLOCK_ROWS x số sách)
+BLOCK_ROWS = 512
+# Số sách mỗi lượt ghi bảng BookNeighbour
+WRITE_BATCH = 500
+
+_TOKEN = re.compile(r"\w{2,}")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS BookNeighbour (
+        BookID INT NOT NULL,
+        NeighbourRank INT NOT NULL,
+        NeighbourID INT NOT NULL,
+        Score FLOAT NOT NULL,
+        PRIMARY KEY (BookID, NeighbourRank)
+    )
+"""
+
+
+@lru_cache(maxsize=200_000)
+def _bucket(token: str) -> int:
+    # crc32 thay cho hash(): cố định giữa các process, file chỉ mục dùng lại được
+    return zlib.crc32(token.encode("utf-8")) % DIMENSIONS
+
+
+def term_frequencies(content: Optional[str]) -> np.ndarray:
+    """Vector TF dạng 1 + log(tf) theo bucket của từng từ (đã bỏ dấu, chữ thường)."""
+    buckets = [_bucket(token) for token in _TOKEN.findall(fold_text(content))]
+    counts = np.bincount(np.asarray(buckets, dtype=np.int64), minlength=DIMENSIONS).astype(np.float32)
+    np.log1p(counts, out=counts, where=counts > 0)
+    return counts
+
+
+def tfidf_vectors(tf: np.ndarray) -> np.ndarray:
+    """Nhân IDF (tính trên toàn bộ các hàng của tf) rồi chuẩn hóa L2 từng hàng."""
+    n_docs = tf.shape[0]
+    df = np.count_nonzero(tf, axis=0)
+    idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+    vectors = tf * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, candidate_ids: np.ndarray, k: int):
+    """Top-k theo từng hàng của ma trận điểm. Trả về (ids, scores), cùng shape (hàng, k)."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64), np.empty((scores.shape[0], 0), dtype=np.float32)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    best = np.take_along_axis(part, order, axis=1)
+    return candidate_ids[best], np.take_along_axis(part_scores, order, axis=1)
+
+
+def neighbours_for_rows(vectors: np.ndarray, book_ids: np.ndarray, rows: Sequence[int], k: int = TOP_K):
+    """Top-k của các hàng rows so với toàn bộ sách (bỏ chính nó), nhân ma trận theo block."""
+    rows = np.asarray(rows, dtype=np.int64)
+    top_ids = np.full((len(rows), k), -1, dtype=np.int64)
+    top_scores = np.full((len(rows), k), -np.inf, dtype=np.float32)
+    for start in range(0, len(rows), BLOCK_ROWS):
+        block = rows[start:start + BLOCK_ROWS]
+        scores = vectors[block] @ vectors.T
+        scores[np.arange(len(block)), block] = -np.inf
+        ids, best = _top_k(scores, book_ids, k)
+        top_ids[start:start + len(block), :ids.shape[1]] = ids
+        top_scores[start:start + len(block), :best.shape[1]] = best
+    return top_ids, top_scores
+
+
+class NeighbourIndex:
+    """Trạng thái chỉ mục lưu giữa các lần chạy: BookID, hash nội dung, ma trận TF và top-k hiện tại."""
+
+    def __init__(self, book_ids=None, hashes=None, tf=None, top_ids=None, top_scores=None, k: int = TOP_K):
+        self.k = k
+        self.book_ids = np.asarray(book_ids if book_ids is not None else [], dtype=np.int64)
+        self.hashes = np.asarray(hashes if hashes is not None else [], dtype="U64")
+        self.tf = tf if tf is not None else np.zeros((0, DIMENSIONS), dtype=np.float32)
+        self.top_ids = top_ids if top_ids is not None else np.zeros((0, k), dtype=np.int64)
+        self.top_scores = top_scores if top_scores is not None else np.zeros((0, k), dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str, k: int = TOP_K) -> "NeighbourIndex":
+        """Đọc chỉ mục từ file; file không có hoặc khác cấu hình (số chiều, k) thì trả về chỉ mục rỗng."""
+        if not os.path.exists(path):
+            return cls(k=k)
+        with np.load(path) as data:
+            if data["tf"].shape[1] != DIMENSIONS or data["top_ids"].shape[1] != k:
+                logger.info("Cấu hình chỉ mục đã đổi, tính lại toàn bộ")
+                return cls(k=k)
+            return cls(data["book_ids"], data["hashes"], data["tf"], data["top_ids"], data["top_scores"], k)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, book_ids=self.book_ids, hashes=self.hashes, tf=self.tf,
+                 top_ids=self.top_ids, top_scores=self.top_scores)
+        os.replace(tmp_path, path)
+
+    def update(self, hashes: Dict[int, str], new_tf: Dict[int, np.ndarray]) -> List[int]:
+        """
+        Đồng bộ với catalogue hiện tại và cập nhật top-k.
+
+        Sách mới/đổi nội dung được so với toàn bộ catalogue; sách cũ chỉ được so với các sách mới
+        (trừ khi top-k của nó chứa sách đã xóa/đổi, khi đó tính lại cả hàng).
+        IDF tính lại theo catalogue mới nhưng điểm của các cặp sách cũ không đổi được giữ nguyên;
+        chạy --full định kỳ để tính lại chính xác.
+
+        :param hashes: {BookID: content_hash} của toàn bộ catalogue
+        :param new_tf: {BookID: term_frequencies(content)} của các sách mới/đổi nội dung
+        :return: danh sách BookID có top-k thay đổi
+        """
+        known = dict(zip(self.book_ids.tolist(), self.hashes.tolist()))
+        stale = {book_id for book_id, digest in known.items() if hashes.get(book_id) != digest}
+        added = list(new_tf)
+
+        keep = np.array([book_id not in stale for book_id in self.book_ids.tolist()], dtype=bool)
+        old_count = int(keep.sum())
+        self.book_ids = np.concatenate([self.book_ids[keep], np.asarray(added, dtype=np.int64)])
+        self.hashes = np.concatenate([self.hashes[keep], np.asarray([hashes[b] for b in added], dtype="U64")])
+        self.tf = np.vstack([self.tf[keep]] + [new_tf[b] for b in added]) if added else self.tf[keep]
+        top_ids, top_scores = self.top_ids[keep], self.top_scores[keep]
+
+        vectors = tfidf_vectors(self.tf)
+        new_rows = np.arange(old_count, len(self.book_ids))
+        changed = set(added)
+
+        # Sách cũ có top-k trỏ tới sách đã xóa/đổi: tính lại cả hàng
+        dirty = np.isin(top_ids, list(stale)).any(axis=1) if stale else np.zeros(old_count, dtype=bool)
+        full_rows = np.concatenate([np.flatnonzero(dirty), new_rows]).astype(np.int64)
+        full_ids, full_scores = neighbours_for_rows(vectors, self.book_ids, full_rows, self.k)
+
+        # Các sách cũ còn lại: gộp top-k hiện tại với điểm so với sách mới
+        merge_rows = np.flatnonzero(~dirty)
+        if len(new_rows) and len(merge_rows):
+            for start in range(0, len(merge_rows), BLOCK_ROWS):
+                block = merge_rows[start:start + BLOCK_ROWS]
+                scores = np.hstack([top_scores[block], vectors[block] @ vectors[new_rows].T])
+                candidates = np.hstack([top_ids[block], np.broadcast_to(self.book_ids[new_rows], (len(block), len(new_rows)))])
+                best = np.argsort(-scores, axis=1)[:, :self.k]
+                merged_ids = np.take_along_axis(candidates, best, axis=1)
+                moved = (merged_ids != top_ids[block]).any(axis=1)
+                top_ids[block] = merged_ids
+                top_scores[block] = np.take_along_axis(scores, best, axis=1)
+                changed.update(self.book_ids[block[moved]].tolist())
+
+        self.top_ids = np.vstack([top_ids[:old_count], np.zeros((len(new_rows), self.k), dtype=np.int64)])
+        self.top_scores = np.vstack([top_scores[:old_count], np.zeros((len(new_rows), self.k), dtype=np.float32)])
+        self.top_ids[full_rows], self.top_scores[full_rows] = full_ids, full_scores
+        changed.update(self.book_ids[full_rows].tolist())
+        return sorted(changed)
+
+    def neighbours(self, book_id: int) -> List[tuple]:
+        """[(NeighbourID, Score)] của một sách, bỏ vị trí trống và điểm <= 0."""
+        rows = np.flatnonzero(self.book_ids == book_id)
+        if not len(rows):
+            return []
+        row = rows[0]
+        return [
+            (int(neighbour), float(score))
+            for neighbour, score in zip(self.top_ids[row], self.top_scores[row])
+            if neighbour >= 0 and score > 0
+        ]
+
+
+def delete_neighbours(db, book_ids: Sequence[int]) -> None:
+    for start in range(0, len(book_ids), WRITE_BATCH):
+        batch = list(book_ids[start:start + WRITE_BATCH])
+        placeholders = ", ".join(["%s"] * len(batch))
+        db.execute_query(f"DELETE FROM BookNeighbour WHERE BookID IN ({placeholders})", tuple(batch))
+
+
+def save_neighbours(db, index: NeighbourIndex, book_ids: Sequence[int]) -> None:
+    """Ghi lại các dòng BookNeighbour của book_ids theo chỉ mục."""
+    delete_neighbours(db, book_ids)
+    for start in range(0, len(book_ids), WRITE_BATCH):
+        rows = [
+            (book_id, rank, neighbour, score)
+            for book_id in book_ids[start:start + WRITE_BATCH]
+            for rank, (neighbour, score) in enumerate(index.neighbours(book_id))
+        ]
+        if rows:
+            db.execute_many(
+                "INSERT INTO BookNeighbour (BookID, NeighbourRank, NeighbourID, Score) VALUES (%s, %s, %s, %s)", rows
+            )
+
+
+def build_neighbours(db, full: bool = False, k: int = TOP_K, path: Optional[str] = None) -> dict:
+    """
+    Cập nhật chỉ mục sách tương tự theo catalogue hiện tại.
+
+    :param full: bỏ qua chỉ mục cũ, tính lại toàn bộ
+    :param k: số sách tương tự cho mỗi sách
+    :param path: file lưu chỉ mục, mặc định settings.neighbour_index_path
+    :return: thống kê {books, updated, removed}
+    """
+    path = path or get_settings().neighbour_index_path
+    db.execute_query(SCHEMA)
+    index = NeighbourIndex(k=k) if full else NeighbourIndex.load(path, k)
+    before = set(index.book_ids.tolist())
+
+    # Chỉ giữ TF của sách mới/đổi nội dung, không giữ nội dung cả catalogue trong bộ nhớ
+    known = dict(zip(index.book_ids.tolist(), index.hashes.tolist()))
+    hashes, new_tf = {}, {}
+    for book_id, _, content in iter_books(db):
+        hashes[book_id] = content_hash(content)
+        if known.get(book_id) != hashes[book_id]:
+            new_tf[book_id] = term_frequencies(content)
+
+    changed = index.update(hashes, new_tf)
+    removed = sorted(before - set(hashes))
+
+    if full:
+        db.execute_query("DELETE FROM BookNeighbour")
+    delete_neighbours(db, removed)
+    save_neighbours(db, index, changed)
+    index.save(path)
+    return {"books": len(hashes), "updated": len(changed), "removed": len(removed)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tính chỉ mục sách tương tự (TF-IDF + cosine top-k)")
+    parser.add_argument("--full", action="store_true", help="tính lại toàn bộ, bỏ qua chỉ mục cũ")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    db = create_database()
+    db.connect()
+    try:
+        start = time.perf_counter()
+        stats = build_neighbours(db, full=args.full, k=args.top_k)
+    finally:
+        db.close()
+    logger.info(f"Cập nhật chỉ mục sách tương tự trong {time.perf_counter() - start:.1f}s: {stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Job tóm tắt trước toàn bộ sách trong bảng Book với nhiều độ dài, lưu vào bảng BookSummary.
+Mỗi sách ghi xong là một checkpoint: chạy lại sẽ bỏ qua sách đã có đủ bản tóm tắt
+với cùng hash nội dung, nên job dừng giữa chừng có thể chạy tiếp.
+
+Ví dụ:
+    python -m catalog.summarize --concurrency 8
+    python -m catalog.summarize --book-id 12 --full
+    DB_BACKEND=sqlite python -m catalog.summarize --fake-llm --seed-books 200
+"""
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from catalog.chunking import chunk_book
+from catalog.ingest import content_hash, iter_books
+from db.database import create_database
+from llm import create_chat_model
+from tools.text_utils import estimate_tokens
+from tracing import record_usage, span
+
+logger = logging.getLogger(__name__)
+
+# Độ dài tóm tắt -> số từ mục tiêu. Bản dài tóm từ nội dung sách, bản ngắn hơn tóm lại từ bản dài hơn liền trước.
+SUMMARY_LENGTHS = {
+    "long": 600,
+    "medium": 250,
+    "short": 80,
+}
+# Sách dài hơn ngưỡng này được tóm tắt từng phần rồi gộp lại (map-reduce)
+MAX_INPUT_TOKENS = 100_000
+# Số sách tóm tắt song song
+CONCURRENCY = 4
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS BookSummary (
+        BookID INT NOT NULL,
+        Length VARCHAR(16) NOT NULL,
+        ContentHash CHAR(64) NOT NULL,
+        Summary TEXT NOT NULL,
+        GeneratedAt DATETIME NOT NULL,
+        PRIMARY KEY (BookID, Length)
+    )
+"""
+HASH_INDEX = "CREATE INDEX idx_book_summary_hash ON BookSummary (ContentHash)"
+# Mã lỗi MySQL khi index đã tồn tại (ER_DUP_KEYNAME)
+DUPLICATE_INDEX_ERRNO = 1061
+
+
+def ensure_schema(db) -> None:
+    """Tạo bảng BookSummary (và index theo ContentHash để tra bằng nội dung) nếu chưa có."""
+    db.execute_query(SCHEMA)
+    try:
+        db.execute_query(HASH_INDEX)
+    except Exception as e:
+        # MySQL không có CREATE INDEX IF NOT EXISTS: chỉ bỏ qua lỗi index đã tồn tại, lỗi khác (quyền, kết nối) ném tiếp
+        if getattr(e, "errno", None) != DUPLICATE_INDEX_ERRNO and "already exists" not in str(e):
+            raise
+
+
+def _summarize(model, text: str, words: int, config=None) -> str:
+    with span("summary.batch.llm", kind="llm", words=words) as record:
+        response = model.invoke([
+            SystemMessage(content=f"Tóm tắt nội dung văn bản trong khoảng {words} từ, bằng tiếng Việt."),
+            HumanMessage(content=text),
+        ], config)
+        record_usage(record, response)
+    return response.content if isinstance(response.content, str) else str(response.content)
+
+
+def summarize_book(model, content: str) -> Dict[str, str]:
+    """
+    Tạo đủ các độ dài tóm tắt cho một sách.
+
+    :return: {length: summary} theo SUMMARY_LENGTHS
+    """
+    content = content or ""
+    if estimate_tokens(content) > MAX_INPUT_TOKENS:
+        parts = [_summarize(model, chunk.content, SUMMARY_LENGTHS["long"])
+                 for chunk in chunk_book(content, MAX_INPUT_TOKENS)]
+        content = "\n\n".join(parts)
+
+    summaries = {}
+    source = content
+    for length, words in SUMMARY_LENGTHS.items():
+        source = summaries[length] = _summarize(model, source, words)
+    return summaries
+
+
+def save_summaries(db, book_id: int, digest: str, summaries: Dict[str, str]) -> None:
+    generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db.transaction():
+        db.execute_query("DELETE FROM BookSummary WHERE BookID = %s", (book_id,))
+        db.execute_many(
+            "INSERT INTO BookSummary (BookID, Length, ContentHash, Summary, GeneratedAt) VALUES (%s, %s, %s, %s, %s)",
+            [(book_id, length, digest, text, generated_at) for length, text in summaries.items()],
+        )
+
+
+def summarize_catalogue(db, model=None, full: bool = False, book_ids: Optional[List[int]] = None,
+                        concurrency: int = CONCURRENCY) -> dict:
+    """
+    Tóm tắt toàn bộ catalogue (hoặc danh sách book_ids).
+    Gọi LLM trên thread pool, còn đọc/ghi DB chỉ ở thread gọi hàm này.
+
+    :param model: chat model, mặc định create_chat_model()
+    :param full: tóm tắt lại cả sách không đổi
+    :param book_ids: chỉ xử lý các sách này
+    :param concurrency: số sách tóm tắt cùng lúc
+    :return: thống kê {processed, skipped, failed, removed}
+    """
+    ensure_schema(db)
+    model = model or create_chat_model(temperature=0.3, max_retries=3, priority="background")
+    complete = {
+        book_id: digest
+        for book_id, digest, count in db.fetch(
+            "SELECT BookID, MIN(ContentHash), COUNT(*) FROM BookSummary GROUP BY BookID HAVING COUNT(DISTINCT ContentHash) = 1"
+        )
+        if count == len(SUMMARY_LENGTHS)
+    }
+    stats = {"processed": 0, "skipped": 0, "failed": 0, "removed": 0}
+    seen = set()
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            book_id, book_name, digest = pending.pop(future)
+            try:
+                save_summaries(db, book_id, digest, future.result())
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"Lỗi tóm tắt '{book_name}' (BookID={book_id}): {e}")
+                continue
+            stats["processed"] += 1
+            logger.info(f"Đã tóm tắt '{book_name}' (BookID={book_id})")
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="summarize") as executor:
+        for book_id, book_name, content in iter_books(db, book_ids):
+            seen.add(book_id)
+            digest = content_hash(content)
+            if not full and complete.get(book_id) == digest:
+                stats["skipped"] += 1
+                continue
+            # Giữ tối đa 2 * concurrency sách trong bộ nhớ
+            while len(pending) >= 2 * concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(summarize_book, model, content)] = (book_id, book_name, digest)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    # Sách đã bị xóa khỏi bảng Book
+    if not book_ids:
+        stored = {row[0] for row in db.fetch("SELECT DISTINCT BookID FROM BookSummary")}
+        for book_id in stored - seen:
+            db.execute_query("DELETE FROM BookSummary WHERE BookID = %s", (book_id,))
+            stats["removed"] += 1
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tóm tắt trước toàn bộ sách trong catalogue")
+    parser.add_argument("--full", action="store_true", help="tóm tắt lại toàn bộ, bỏ qua hash")
+    parser.add_argument("--book-id", type=int, action="append", help="chỉ xử lý sách này (lặp lại được)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--fake-llm", action="store_true", help="dùng model giả (benchmarks.fake_llm), không gọi Gemini")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="độ trễ trung vị của model giả")
+    parser.add_argument("--seed-books", type=int, default=0, help="tạo catalogue giả với số sách này trước khi chạy")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.fake_llm:
+        from benchmarks.fake_llm import fake_chat_model_factory
+        from llm import set_chat_model_factory
+
+        set_chat_model_factory(fake_chat_model_factory(latency_median_ms=args.latency_ms))
+
+    db = create_database()
+    db.connect()
+    try:
+        if args.seed_books:
+            from benchmarks.fixtures import seed_catalogue
+
+            seed_catalogue(db, books=args.seed_books)
+        start = time.perf_counter()
+        stats = summarize_catalogue(db, full=args.full, book_ids=args.book_id, concurrency=args.concurrency)
+    finally:
+        db.close()
+    logger.info(f"Tóm tắt xong trong {time.perf_counter() - start:.1f}s: {stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
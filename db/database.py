@@ -1,20 +1,28 @@
-from dotenv import load_dotenv
-import os
-import mysql.connector
+import asyncio
+import importlib.util
+from contextlib import contextmanager
+from functools import lru_cache
+
+import cancellation
+from settings import get_settings
+from tracing import span
 
 class Database:
     def __init__(self):
-        load_dotenv()
-        self.host = os.getenv("DB_HOST")
-        self.user = os.getenv("DB_USER")
-        self.password = os.getenv("DB_PASSWORD")
-        self.database = os.getenv("DB_NAME")
-        self.port = int(os.getenv("DB_PORT", 3306))
+        settings = get_settings()
+        self.host = settings.db_host
+        self.user = settings.db_user
+        self.password = settings.db_password
+        self.database = settings.db_name
+        self.port = settings.db_port
         self.charset = 'utf8mb4'
         self.conn = None
         self.cursor = None
+        self.in_transaction = False
 
     def connect(self):
+        import mysql.connector
+
         self.conn = mysql.connector.connect(
             host=self.host,
             user=self.user,
@@ -27,16 +35,37 @@ class Database:
     def execute_query(self, query, params=None):
         if self.conn is None or self.cursor is None:
             self.connect()
-        self.cursor.execute(query, params or ())
-        # Chỉ commit nếu không phải SELECT
-        if not query.strip().lower().startswith("select"):
+        cancellation.check("db")
+        with span("db.execute", kind="db", statement=_statement_name(query)):
+            self.cursor.execute(query, params or ())
+        # Chỉ commit nếu không phải SELECT (trong transaction() thì commit một lần ở cuối)
+        if not self.in_transaction and not query.strip().lower().startswith("select"):
             self.conn.commit()
 
+    def execute_many(self, query, rows):
+        if self.conn is None or self.cursor is None:
+            self.connect()
+        cancellation.check("db")
+        with span("db.execute_many", kind="db", statement=_statement_name(query), rows=len(rows)):
+            self.cursor.executemany(query, rows)
+            if not self.in_transaction:
+                self.conn.commit()
+
     def fetch(self, query, params=None):
         if self.conn is None or self.cursor is None:
             self.connect()
-        self.cursor.execute(query, params or ())
-        return self.cursor.fetchall()
+        cancellation.check("db")
+        with span("db.fetch", kind="db", statement=_statement_name(query)) as record:
+            self.cursor.execute(query, params or ())
+            rows = self.cursor.fetchall()
+            record["rows"] = len(rows)
+        return rows
+
+    @contextmanager
+    def transaction(self):
+        """Gộp các lệnh ghi trong khối thành một transaction: commit khi xong, rollback nếu có lỗi."""
+        with _transaction(self):
+            yield self
 
     def close(self):
         if self.cursor:
@@ -45,3 +74,149 @@ class Database:
             self.conn.close()
 
 
+class AsyncDatabase:
+    """
+    Bản async của Database (aiomysql) cho tool chạy trên event loop của astream_events,
+    cùng interface connect/execute_query/execute_many/fetch/close nhưng là coroutine.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.host = settings.db_host
+        self.user = settings.db_user
+        self.password = settings.db_password
+        self.database = settings.db_name
+        self.port = settings.db_port
+        self.charset = 'utf8mb4'
+        self.conn = None
+        self.cursor = None
+
+    async def connect(self):
+        import aiomysql
+
+        self.conn = await aiomysql.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            db=self.database,
+            port=self.port,
+            charset=self.charset,
+        )
+        self.cursor = await self.conn.cursor()
+
+    async def execute_query(self, query, params=None):
+        if self.conn is None or self.cursor is None:
+            await self.connect()
+        cancellation.check("db")
+        with span("db.execute", kind="db", statement=_statement_name(query)):
+            await self.cursor.execute(query, params or ())
+        if not query.strip().lower().startswith("select"):
+            await self.conn.commit()
+
+    async def execute_many(self, query, rows):
+        if self.conn is None or self.cursor is None:
+            await self.connect()
+        cancellation.check("db")
+        with span("db.execute_many", kind="db", statement=_statement_name(query), rows=len(rows)):
+            await self.cursor.executemany(query, rows)
+            await self.conn.commit()
+
+    async def fetch(self, query, params=None):
+        if self.conn is None or self.cursor is None:
+            await self.connect()
+        cancellation.check("db")
+        with span("db.fetch", kind="db", statement=_statement_name(query)) as record:
+            await self.cursor.execute(query, params or ())
+            rows = await self.cursor.fetchall()
+            record["rows"] = len(rows)
+        return rows
+
+    async def close(self):
+        if self.cursor:
+            await self.cursor.close()
+        if self.conn:
+            self.conn.close()
+
+
+class ThreadedDatabase:
+    """
+    Interface async trên một kết nối sync: mỗi lệnh chạy trên thread (asyncio.to_thread), không chặn event loop.
+    Dùng cho SQLite và cho MySQL khi chưa cài aiomysql.
+    """
+
+    def __init__(self, db):
+        self._db = db
+
+    async def connect(self):
+        await asyncio.to_thread(self._db.connect)
+
+    async def execute_query(self, query, params=None):
+        await asyncio.to_thread(self._db.execute_query, query, params)
+
+    async def execute_many(self, query, rows):
+        await asyncio.to_thread(self._db.execute_many, query, rows)
+
+    async def fetch(self, query, params=None):
+        return await asyncio.to_thread(self._db.fetch, query, params)
+
+    async def close(self):
+        await asyncio.to_thread(self._db.close)
+
+
+@contextmanager
+def _transaction(db):
+    """transaction() dùng chung cho Database và SqliteDatabase."""
+    if db.conn is None or db.cursor is None:
+        db.connect()
+    if db.in_transaction:
+        yield
+        return
+    db.in_transaction = True
+    try:
+        yield
+        db.conn.commit()
+    except BaseException:
+        db.conn.rollback()
+        raise
+    finally:
+        db.in_transaction = False
+
+
+def _statement_name(query):
+    """Nhãn ngắn cho span DB: loại câu lệnh và bảng đầu tiên, ví dụ 'select Book'."""
+    words = query.split()
+    if not words:
+        return ""
+    table = ""
+    for keyword in ("from", "into", "update", "table"):
+        lowered = [w.lower() for w in words]
+        if keyword in lowered and lowered.index(keyword) + 1 < len(words):
+            table = words[lowered.index(keyword) + 1].strip("`(,")
+            break
+    return f"{words[0].lower()} {table}".strip()
+
+
+def create_database():
+    """
+    Tạo kết nối DB theo biến môi trường DB_BACKEND.
+    DB_BACKEND=sqlite dùng bản SQLite cục bộ (load test, job offline), mặc định là MySQL.
+    """
+    if get_settings().db_backend == "sqlite":
+        from db.sqlite_database import SqliteDatabase
+        return SqliteDatabase()
+    return Database()
+
+
+@lru_cache(maxsize=1)
+def _has_aiomysql():
+    return importlib.util.find_spec("aiomysql") is not None
+
+
+def create_async_database():
+    """
+    Bản async của create_database cho tool chạy trên event loop.
+    MySQL dùng aiomysql nếu đã cài; SQLite (và MySQL khi chưa có aiomysql) chạy từng lệnh trên thread.
+    """
+    if get_settings().db_backend == "sqlite" or not _has_aiomysql():
+        return ThreadedDatabase(create_database())
+    return AsyncDatabase()
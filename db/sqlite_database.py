@@ -0,0 +1,122 @@
+import hashlib
+import os
+import sqlite3
+from contextlib import contextmanager
+
+import cancellation
+from db.database import _statement_name, _transaction
+from settings import get_settings
+from tracing import span
+
+# Schema tối thiểu giống các bảng MySQL mà tool đang dùng
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS BookCategory (
+    CategoryID INTEGER PRIMARY KEY,
+    CategoryName TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Book (
+    BookID INTEGER PRIMARY KEY,
+    BookName TEXT NOT NULL,
+    Content TEXT,
+    CategoryID INTEGER REFERENCES BookCategory(CategoryID)
+);
+CREATE INDEX IF NOT EXISTS idx_book_category ON Book(CategoryID);
+"""
+
+
+class SqliteDatabase:
+    """
+    Bản thay thế cục bộ cho Database (MySQL), cùng interface connect/execute_query/fetch/close.
+    Câu lệnh viết theo placeholder %s của mysql-connector được đổi sang ? của sqlite3.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_settings().db_sqlite_path
+        self.conn = None
+        self.cursor = None
+        self.in_transaction = False
+
+    def connect(self):
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        # SHA2(text, 256) của MySQL: so hash nội dung ngay trong câu truy vấn, không phải tải Content về
+        self.conn.create_function("SHA2", 2, _sha2, deterministic=True)
+        self.cursor = _Cursor(self.conn.cursor())
+
+    def execute_query(self, query, params=None):
+        if self.conn is None or self.cursor is None:
+            self.connect()
+        cancellation.check("db")
+        with span("db.execute", kind="db", statement=_statement_name(query)):
+            self.cursor.execute(query, params or ())
+        if not self.in_transaction and not query.strip().lower().startswith("select"):
+            self.conn.commit()
+
+    def execute_many(self, query, rows):
+        if self.conn is None or self.cursor is None:
+            self.connect()
+        cancellation.check("db")
+        with span("db.execute_many", kind="db", statement=_statement_name(query), rows=len(rows)):
+            self.cursor.executemany(query, rows)
+            if not self.in_transaction:
+                self.conn.commit()
+
+    def fetch(self, query, params=None):
+        if self.conn is None or self.cursor is None:
+            self.connect()
+        cancellation.check("db")
+        with span("db.fetch", kind="db", statement=_statement_name(query)) as record:
+            self.cursor.execute(query, params or ())
+            rows = self.cursor.fetchall()
+            record["rows"] = len(rows)
+        return rows
+
+    @contextmanager
+    def transaction(self):
+        """Gộp các lệnh ghi trong khối thành một transaction: commit khi xong, rollback nếu có lỗi."""
+        with _transaction(self):
+            yield self
+
+    def close(self):
+        if self.cursor:
+            self.cursor.close()
+        if self.conn:
+            self.conn.close()
+
+
+def _sha2(text, bits):
+    if text is None or bits != 256:
+        return None
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+
+class _Cursor:
+    """Bọc cursor sqlite3 để nhận câu lệnh dùng placeholder %s."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        return self._cursor.execute(query.replace("%s", "?"), params)
+
+    def executemany(self, query, seq_of_params):
+        return self._cursor.executemany(query.replace("%s", "?"), seq_of_params)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
@@ -0,0 +1,52 @@
+"""
+Thời hạn (deadline) của một lượt chat, truyền qua config của LangGraph: configurable["deadline"] (epoch giây).
+
+Node, tool và LLM scheduler đọc deadline từ config đang chạy (contextvar của LangChain, metadata của run)
+để bỏ qua bước không kịp chạy và thu ngắn timeout mỗi lượt gọi model theo thời gian còn lại.
+"""
+import time
+from typing import Optional
+
+from langchain_core.runnables.config import var_child_runnable_config
+
+from settings import get_settings
+from tracing import metrics
+
+DEADLINE_KEY = "deadline"
+
+
+class TurnTimeout(TimeoutError):
+    """Lượt chat đã hết thời gian cho phép."""
+
+
+def with_deadline(config: dict, budget_s: Optional[float] = None) -> dict:
+    """Bản sao config có deadline = bây giờ + budget_s (mặc định TURN_BUDGET_S), dùng khi bắt đầu một lượt chat."""
+    budget_s = get_settings().turn_budget_s if budget_s is None else budget_s
+    configurable = dict(config.get("configurable") or {})
+    configurable[DEADLINE_KEY] = time.time() + budget_s
+    return {**config, "configurable": configurable}
+
+
+def current_deadline(run_manager=None) -> Optional[float]:
+    """Deadline của lượt chat đang chạy (None nếu không có)."""
+    metadata = getattr(run_manager, "metadata", None) or {}
+    if metadata.get(DEADLINE_KEY):
+        return float(metadata[DEADLINE_KEY])
+    config = var_child_runnable_config.get() or {}
+    deadline = (config.get("configurable") or {}).get(DEADLINE_KEY)
+    return float(deadline) if deadline else None
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Số giây còn lại tới deadline (None nếu không có deadline)."""
+    return None if deadline is None else deadline - time.time()
+
+
+def check(stage: str, deadline: Optional[float] = None) -> None:
+    """Ném TurnTimeout nếu lượt chat đã hết thời gian, stage dùng làm nhãn metric."""
+    deadline = current_deadline() if deadline is None else deadline
+    left = remaining(deadline)
+    if left is not None and left <= 0:
+        metrics.inc("agent_deadline_exceeded_total", help="Số bước bị bỏ qua/dừng vì lượt chat hết thời gian",
+                    stage=stage)
+        raise TurnTimeout(f"Hết thời gian xử lý lượt chat ({stage})")
@@ -1,63 +1,154 @@
-import os
-
-from dotenv import load_dotenv
-from langchain_core.messages import ToolMessage, SystemMessage
-from langchain_core.runnables import RunnableConfig
-from langchain_google_genai import ChatGoogleGenerativeAI
+import asyncio
+import gc
+import threading
+from functools import lru_cache
+from typing import Optional
+
+from langchain_core.messages import AIMessage, ToolMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.config import run_in_executor
 from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
 from langgraph.graph import StateGraph, END
 
+import cancellation
 from agent_state import AgentState
+from deadline import TurnTimeout, check
+from llm import create_chat_model
 from system_prompt import system_prompt
-from tools.book_search import search_by_topic
-from tools.check_cv import check_cv
-from tools.extract_file import extract_file
-from tools.question_generator import question_generator_tool
-from tools.summary import summary
-
-# Load .env file
-load_dotenv()
+from profiling import thread_profile
+from router import next_after_route, route_intent
+from settings import get_settings
+from tracing import metrics, span, record_usage, payload_size
+from tools.registry import TOOLS
 
-# Get values
-api_key = os.getenv("GEMINI_API_KEY")
 graph = StateGraph(AgentState)
 
-model = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",  # Model ngôn ngữ lớn"
-    temperature=0.5,  # Mức độ sáng tạo của model, từ 0 tới 1.
-    max_tokens=None,  # Giới hạn token của Input, Output. Thường nên để tối đa 32K.
-    timeout=None,
-    max_retries=3,
-    google_api_key=api_key  # API key đã lấy ở trên
-)
-
-tools = [extract_file, search_by_topic, summary, check_cv, question_generator_tool]
+# Schema tool nạp sẵn, phần cài đặt chỉ import ở lần gọi đầu tiên (xem tools/registry.py)
+tools = TOOLS
 tools_by_name = {tool.name: tool for tool in tools}
 
-agent = model.bind_tools(tools)
+
+@lru_cache(maxsize=1)
+def get_agent():
+    """Tạo model và bind tools ở lần dùng đầu tiên, tránh import stack Gemini lúc khởi động."""
+    model = create_chat_model(
+        model="gemini-2.5-flash",  # Model ngôn ngữ lớn"
+        temperature=0.5,  # Mức độ sáng tạo của model, từ 0 tới 1.
+        max_tokens=None,  # Giới hạn token của Input, Output. Thường nên để tối đa 32K.
+        timeout=None,  # LLM_TIMEOUT_S, mỗi request (kể cả stream) thu ngắn theo deadline của lượt chat
+        max_retries=3,
+    )
+    return model.bind_tools(tools)
+
+
+async def aget_agent():
+    """get_agent cho node async: lần tạo đầu tiên (import stack Gemini) chạy trên thread, không chặn event loop."""
+    if get_agent.cache_info().currsize:
+        return get_agent()
+    return await asyncio.to_thread(get_agent)
+
+
+_prewarm_started = False
+
+
+def prewarm() -> None:
+    """Khởi tạo agent trên thread nền sau khi UI đã hiển thị, để lượt chat đầu không phải chờ import."""
+    global _prewarm_started
+    if _prewarm_started:
+        return
+    _prewarm_started = True
+    threading.Thread(target=_prewarm, name="graph-prewarm", daemon=True).start()
+
+
+def _prewarm() -> None:
+    get_agent()
+    # Stack Gemini vừa import cũng sống suốt process, như phần cuối module này
+    gc.freeze()
 
 
 # Define our tool node
 def call_tools(state: AgentState):
     outputs = []
 
-    for tool_call in state["messages"][-1].tool_calls:
-        if tool_call["name"] not in tools_by_name:
-            continue
+    with span("call_tools", kind="node"), thread_profile():
+        for tool_call in state["messages"][-1].tool_calls:
+            if tool_call["name"] not in tools_by_name:
+                continue
+
+            skipped = _skip_tool(tool_call)
+            if skipped is not None:
+                outputs.append(skipped)
+                continue
+
+            with span(tool_call["name"], kind="tool", input_bytes=payload_size(tool_call["args"])) as record:
+                tool_result = tools_by_name[tool_call["name"]].invoke(tool_call["args"])
+                record["output_bytes"] = payload_size(getattr(tool_result, "content", tool_result))
+
+            outputs.append(
+                ToolMessage(
+                    content=tool_result,
+                    name=tool_call["name"],
+                    tool_call_id=tool_call["id"],
+                )
+            )
 
-        tool_result = tools_by_name[tool_call["name"]].invoke(tool_call["args"])
+    return _tool_outputs(outputs)
 
-        outputs.append(
-            ToolMessage(
-                content=tool_result,
-                name=tool_call["name"],
-                tool_call_id=tool_call["id"],
-            )
-        )
+
+async def acall_tools(state: AgentState, config: RunnableConfig):
+    """Bản async của call_tools (astream_events): tool có bản async chạy thẳng trên event loop (tools/registry.py)."""
+    if not get_settings().async_tools:
+        return await run_in_executor(config, call_tools, state)
+    outputs = []
+
+    with span("call_tools", kind="node"):
+        for tool_call in state["messages"][-1].tool_calls:
+            if tool_call["name"] not in tools_by_name:
+                continue
+
+            skipped = _skip_tool(tool_call)
+            if skipped is not None:
+                outputs.append(skipped)
+                continue
+
+            with span(tool_call["name"], kind="tool", input_bytes=payload_size(tool_call["args"])) as record:
+                tool_result = await tools_by_name[tool_call["name"]].ainvoke(tool_call["args"])
+                record["output_bytes"] = payload_size(getattr(tool_result, "content", tool_result))
+
+            outputs.append(ToolMessage(content=tool_result, name=tool_call["name"], tool_call_id=tool_call["id"]))
+
+    return _tool_outputs(outputs)
+
+
+def _skip_tool(tool_call) -> Optional[ToolMessage]:
+    """Kiểm tra trước mỗi tool: lượt bị hủy thì ném TurnCancelled, hết thời gian thì trả ToolMessage báo bỏ qua."""
+    # Lượt chat đã bị hủy: dừng cả lượt, không chạy các tool còn lại
+    cancellation.check("tool")
+    try:
+        check("tool")
+    except TurnTimeout:
+        # status="error": tool không chạy, _tool_outputs không coi là kết quả return_direct
+        return ToolMessage(content="Hết thời gian xử lý lượt chat, tool này không được chạy.",
+                           name=tool_call["name"], tool_call_id=tool_call["id"], status="error")
+    return None
+
+
+def _tool_outputs(outputs):
+    # Mọi tool vừa chạy đều return_direct: kết quả tool đã là câu trả lời (app hiển thị từ on_tool_end),
+    # kết thúc lượt mà không gọi lại LLM. AIMessage ngắn giữ lịch sử hội thoại kết thúc bằng lượt của model.
+    # Có tool bị bỏ qua vì hết thời gian thì quay lại call_model (trả TURN_TIMEOUT_ANSWER khi deadline đã qua).
+    if outputs and all(tools_by_name[m.name].return_direct and m.status != "error" for m in outputs):
+        metrics.inc("agent_llm_calls_saved_total", help="Số lượt gọi LLM bỏ qua được", reason="return_direct")
+        names = ", ".join(m.name for m in outputs)
+        outputs.append(AIMessage(content=f"(Đã gửi kết quả của {names} cho người dùng)"))
 
     return {"messages": outputs}
 
 
+TURN_TIMEOUT_ANSWER = "Xin lỗi, yêu cầu này mất quá nhiều thời gian để xử lý. Bạn vui lòng thử lại sau."
+
+
 # Define call_model
 def call_model(
         state: AgentState,
@@ -69,12 +160,43 @@ def call_model(
         list_input.append(msg)
 
     # Invoke the model with the system prompt and the messages
-    response = agent.invoke(list_input, config)
+    with span("call_model", kind="node", input_bytes=sum(payload_size(m.content) for m in list_input)) as record, \
+            thread_profile():
+        cancellation.check("model")
+        try:
+            check("model")
+            response = get_agent().invoke(list_input, config)
+        except TurnTimeout:
+            # Hết thời gian của lượt chat: kết thúc lượt bằng câu trả lời ngắn thay vì treo
+            record["timeout"] = True
+            response = AIMessage(content=TURN_TIMEOUT_ANSWER)
+        record_usage(record, response)
+        record["output_bytes"] = payload_size(response.content)
 
     # We return a list, because this will get added to the existing messages state using the add_messages reducer
     return {"messages": [response]}
 
 
+async def acall_model(state: AgentState, config: RunnableConfig):
+    """Bản async của call_model: model.ainvoke trên event loop thay vì chiếm một thread của executor."""
+    if not get_settings().async_tools:
+        return await run_in_executor(config, call_model, state, config)
+    list_input = [SystemMessage(content=system_prompt), *state["messages"]]
+
+    with span("call_model", kind="node", input_bytes=sum(payload_size(m.content) for m in list_input)) as record:
+        cancellation.check("model")
+        try:
+            check("model")
+            response = await (await aget_agent()).ainvoke(list_input, config)
+        except TurnTimeout:
+            record["timeout"] = True
+            response = AIMessage(content=TURN_TIMEOUT_ANSWER)
+        record_usage(record, response)
+        record["output_bytes"] = payload_size(response.content)
+
+    return {"messages": [response]}
+
+
 # Define the conditional edge that determines whether to continue or not
 def should_continue(state: AgentState):
     messages = state["messages"]
@@ -87,12 +209,27 @@ def should_continue(state: AgentState):
     return "continue"
 
 
-graph.add_node("ask_question", call_model)
-graph.add_node("call_tools", call_tools)
+# After tools: return_direct tools end the turn, otherwise go back to the model
+def after_tools(state: AgentState):
+    if isinstance(state["messages"][-1], AIMessage):
+        return "end"
+    return "continue"
+
 
-graph.set_entry_point("ask_question")
+graph.add_node("route_intent", route_intent)
+# invoke/stream dùng bản sync, ainvoke/astream_events (app.py) dùng bản async
+graph.add_node("ask_question", RunnableLambda(call_model, acall_model, name="call_model"))
+graph.add_node("call_tools", RunnableLambda(call_tools, acall_tools, name="call_tools"))
+
+graph.set_entry_point("route_intent")
+graph.add_conditional_edges("route_intent", next_after_route, {"tools": "call_tools", "model": "ask_question"})
 graph.add_conditional_edges("ask_question", should_continue, {"continue": "call_tools", "end": END})
-graph.add_edge("call_tools", "ask_question")
+graph.add_conditional_edges("call_tools", after_tools, {"continue": "ask_question", "end": END})
 
-memory = MemorySaver()
+# State chỉ chứa FileRef (hash, path, size, ...) của file upload, không chứa bytes
+memory = MemorySaver(serde=JsonPlusSerializer(allowed_msgpack_modules=[("agent_state", "FileRef")]))
 graph_builder = graph.compile(checkpointer=memory)
+
+# Đối tượng nạp lúc khởi động (module langchain/langgraph/pydantic, schema tool, graph) sống suốt process:
+# chuyển sang thế hệ permanent để GC thế hệ 2 không duyệt lại chúng (mỗi lần dừng 40-50 ms trên event loop)
+gc.freeze()
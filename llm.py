@@ -0,0 +1,73 @@
+from typing import Callable, Optional
+
+from langchain_core.language_models import BaseChatModel
+
+from settings import get_settings
+
+# Factory thay thế (fake LLM cho load test / job offline). None = dùng Gemini thật.
+_chat_model_factory: Optional[Callable[..., BaseChatModel]] = None
+
+
+def set_chat_model_factory(factory: Optional[Callable[..., BaseChatModel]]) -> None:
+    """
+    Thay factory tạo chat model cho toàn bộ process (graph và các tool).
+    Phải gọi trước lượt chat đầu tiên vì graph chỉ tạo model một lần (lazy).
+
+    :param factory: callable nhận cùng tham số với create_chat_model, None để trả về Gemini
+    """
+    global _chat_model_factory
+    _chat_model_factory = factory
+
+
+def create_chat_model(
+        model: str = "gemini-2.5-flash",
+        temperature: float = 0.5,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_retries: int = 3,
+        priority: str = "interactive",
+) -> BaseChatModel:
+    """
+    Tạo chat model dùng chung cho graph và các tool.
+    Mọi lượt gọi đi qua scheduler chung của process (llm_scheduler.py), trừ khi tắt bằng LLM_SCHEDULER=0.
+
+    :param model: tên model Gemini
+    :param temperature: mức độ sáng tạo của model, từ 0 tới 1
+    :param max_tokens: giới hạn token output
+    :param timeout: timeout mỗi request (giây), None = LLM_TIMEOUT_S; trong lượt chat còn bị giới hạn
+        bởi thời gian còn lại tới deadline (xem deadline.py)
+    :param max_retries: số lần retry khi lỗi (do scheduler thực hiện, có backoff chung)
+    :param priority: "interactive" (lượt chat), "batch" (xử lý nhiều file một lúc) hoặc "background" (job offline)
+    :return: chat model
+    """
+    scheduled = get_settings().llm_scheduler
+    timeout = get_settings().llm_timeout_s if timeout is None else timeout
+    # Khi có scheduler, model bên dưới không tự retry để các lần retry không cộng dồn
+    client_retries = 0 if scheduled else max_retries
+
+    if _chat_model_factory is not None:
+        chat_model = _chat_model_factory(
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            max_retries=client_retries,
+        )
+    else:
+        # Import muộn: stack Google GenAI nặng, không cần cho cold start của Streamlit
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        chat_model = ChatGoogleGenerativeAI(
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            max_retries=client_retries,
+            google_api_key=get_settings().gemini_api_key
+        )
+
+    if not scheduled:
+        return chat_model
+    from llm_scheduler import schedule
+
+    return schedule(chat_model, priority=priority, max_retries=max_retries)
@@ -0,0 +1,671 @@
+"""
+Scheduler dùng chung cho mọi lượt gọi chat model trong process (graph, tool, job nền).
+
+- Giới hạn tốc độ bằng token bucket: số request/phút và số token/phút (LLM_RPM, LLM_TPM, 0 = không giới hạn).
+  Token được trừ trước theo ước lượng prompt, sau khi gọi xong điều chỉnh theo usage thực tế.
+- Ưu tiên: interactive (lượt chat) > batch (chấm nhiều CV) > background (job offline như tóm tắt thư viện).
+- Công bằng giữa các session: request chờ được xếp hàng theo thread_id, cùng mức ưu tiên thì lần lượt round-robin
+  (một session gửi nhiều request không chặn các session khác).
+- Retry tập trung: model bên dưới không tự retry (max_retries=0); lỗi quota/quá tải làm cả scheduler
+  tạm dừng theo backoff mũ, mọi nơi gọi cùng chờ thay vì mỗi nơi retry riêng làm tăng tải.
+- Deadline của lượt chat (deadline.py): request không chờ quá thời gian còn lại, timeout mỗi lượt gọi
+  thu ngắn dần theo thời gian còn lại của lượt chat.
+- Hủy lượt chat (cancellation.py): request của lượt đã bị hủy rời hàng đợi, lượt gọi đang chờ kết quả dừng ngay.
+- Hedging (tùy chọn, LLM_HEDGING=1): request chạy lâu hơn p95 gần đây thì gửi thêm một bản sao
+  (nếu scheduler còn quota và không có ai chờ), lấy kết quả nào về trước.
+- Metric: độ dài hàng đợi, thời gian chờ, số lần retry/backoff/hedge.
+
+Model được bọc bằng schedule(model, priority) trong llm.create_chat_model: lớp con của đúng lớp model gốc
+nên bind_tools / with_structured_output vẫn dùng được như bình thường.
+"""
+import asyncio
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import ContextVar, copy_context
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Optional, Type
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables.config import var_child_runnable_config
+
+from cancellation import CancelToken, TurnCancelled, current_token
+from deadline import TurnTimeout, check, current_deadline, remaining
+from settings import get_settings
+from tools.text_utils import estimate_tokens
+from tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BATCH, BACKGROUND)
+
+# Backoff khi bị giới hạn quota / server quá tải: BACKOFF_BASE_S * 2^(lần lỗi liên tiếp - 1), tối đa BACKOFF_MAX_S
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+# Chu kỳ kiểm tra lại hàng đợi của request async
+ASYNC_POLL_S = 0.05
+# Request đang chờ trong hàng đợi kiểm tra token hủy ít nhất mỗi CANCEL_POLL_S giây
+CANCEL_POLL_S = 0.25
+# Hedging: cần ít nhất HEDGE_MIN_SAMPLES lượt gọi gần đây để tính p95, không hedge sớm hơn HEDGE_MIN_DELAY_S
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY_S = 0.5
+LATENCY_WINDOW = 200
+# Thread chạy lượt gọi model khi cần timeout theo deadline hoặc hedging
+CALL_WORKERS = 32
+
+# Đang chạy bên trong một lượt gọi đã được xếp lịch (ví dụ _agenerate mặc định gọi lại _generate): không xếp lịch lần nữa
+_scheduled_call: ContextVar[bool] = ContextVar("scheduled_llm_call", default=False)
+
+_RETRYABLE_CODES = {429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                    "DeadlineExceeded", "RateLimitError"}
+
+
+class TokenBucket:
+    """Bucket nạp đều per_minute đơn vị mỗi phút, dung lượng tối đa bằng per_minute. per_minute <= 0 là không giới hạn."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Số giây cần chờ để đủ amount (yêu cầu lớn hơn dung lượng thì chỉ cần bucket đầy)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        """Trừ amount (có thể âm để hoàn lại, hoặc làm bucket âm khi usage thực tế vượt ước lượng)."""
+        if self.rate > 0:
+            self.level = min(self.capacity, self.level - amount)
+
+
+class Ticket:
+    __slots__ = ("priority", "session", "tokens", "seq", "enqueued")
+
+    def __init__(self, priority: str, session: str, tokens: int, seq: int):
+        self.priority = priority
+        self.session = session
+        self.tokens = tokens
+        self.seq = seq
+        self.enqueued = time.monotonic()
+
+
+class LLMScheduler:
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self._cond = threading.Condition()
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        # priority -> (session -> hàng đợi FIFO); thứ tự session trong OrderedDict là thứ tự round-robin
+        self._queues: Dict[str, "OrderedDict[str, Deque[Ticket]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._failures = 0
+
+    # ---------- hàng đợi ----------
+
+    def _enqueue(self, priority: str, session: str, tokens: int) -> Ticket:
+        ticket = Ticket(priority, session, tokens, next(self._seq))
+        with self._cond:
+            self._queues[priority].setdefault(session, deque()).append(ticket)
+            self._report_depth(priority)
+        return ticket
+
+    def _head(self) -> Optional[Ticket]:
+        for priority in PRIORITIES:
+            sessions = self._queues[priority]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    def _remove(self, ticket: Ticket) -> None:
+        sessions = self._queues[ticket.priority]
+        queue = sessions.get(ticket.session)
+        if queue is None or ticket not in queue:
+            return
+        was_head = queue[0] is ticket
+        queue.remove(ticket)
+        if not queue:
+            del sessions[ticket.session]
+        elif was_head and next(iter(sessions)) == ticket.session:
+            # Session vừa được phục vụ xuống cuối vòng round-robin
+            sessions.move_to_end(ticket.session)
+        self._report_depth(ticket.priority)
+        self._cond.notify_all()
+
+    def _try_take(self, ticket: Ticket) -> Optional[float]:
+        """Gọi khi đang giữ lock. None nếu ticket được đi (đã trừ bucket), ngược lại là số giây nên chờ thêm."""
+        if self._head() is not ticket:
+            return ASYNC_POLL_S
+        now = time.monotonic()
+        wait = max(
+            self._paused_until - now,
+            self._requests.wait_time(1, now),
+            self._tokens.wait_time(ticket.tokens, now),
+        )
+        if wait > 0:
+            return wait
+        self._requests.take(1)
+        self._tokens.take(ticket.tokens)
+        self._remove(ticket)
+        metrics.observe("llm_scheduler_wait_seconds", now - ticket.enqueued,
+                        help="Thời gian request LLM chờ trong scheduler", priority=ticket.priority)
+        return None
+
+    def _report_depth(self, priority: str) -> None:
+        depth = sum(len(queue) for queue in self._queues[priority].values())
+        metrics.set_gauge("llm_scheduler_queue_depth", depth, help="Số request LLM đang chờ", priority=priority)
+
+    def acquire(self, priority: str, session: str, tokens: int, deadline: Optional[float] = None,
+                token: Optional[CancelToken] = None) -> None:
+        """
+        Chờ (chặn thread) tới lượt của request.
+        Ném TurnTimeout nếu tới deadline mà chưa tới lượt, TurnCancelled nếu lượt chat bị hủy khi đang chờ.
+        """
+        ticket = self._enqueue(priority, session, tokens)
+        with self._cond:
+            try:
+                while True:
+                    is_head = self._head() is ticket
+                    wait = self._try_take(ticket)
+                    if wait is None:
+                        return
+                    # Không phải đầu hàng đợi: chờ notify khi hàng đợi thay đổi
+                    timeout = wait if is_head else None
+                    if deadline is not None:
+                        check("llm_queue", deadline)
+                        timeout = min(timeout or float("inf"), remaining(deadline))
+                    if token is not None:
+                        token.check("llm_queue")
+                        timeout = min(timeout or float("inf"), CANCEL_POLL_S)
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._remove(ticket)
+                raise
+
+    async def aacquire(self, priority: str, session: str, tokens: int, deadline: Optional[float] = None,
+                       token: Optional[CancelToken] = None) -> None:
+        """Bản async của acquire: không chặn event loop, hủy task thì rời hàng đợi."""
+        ticket = self._enqueue(priority, session, tokens)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(ticket)
+                if wait is None:
+                    return
+                if deadline is not None:
+                    check("llm_queue", deadline)
+                if token is not None:
+                    token.check("llm_queue")
+                await asyncio.sleep(min(wait, ASYNC_POLL_S))
+        except BaseException:
+            with self._cond:
+                self._remove(ticket)
+            raise
+
+    def try_acquire_now(self, tokens: int) -> bool:
+        """Lấy quota ngay nếu không ai đang chờ và bucket còn đủ (dùng cho request hedge, không bao giờ chờ)."""
+        with self._cond:
+            now = time.monotonic()
+            if self._head() is not None or self._paused_until > now:
+                return False
+            if self._requests.wait_time(1, now) > 0 or self._tokens.wait_time(tokens, now) > 0:
+                return False
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            return True
+
+    # ---------- kết quả ----------
+
+    def settle(self, estimated_tokens: int, used_tokens: Optional[int]) -> None:
+        """Lượt gọi thành công: điều chỉnh bucket token theo usage thực tế, giảm mức backoff."""
+        with self._cond:
+            self._failures = max(0, self._failures - 1)
+        self.adjust_tokens(estimated_tokens, used_tokens)
+
+    def adjust_tokens(self, estimated_tokens: int, used_tokens: Optional[int]) -> None:
+        if used_tokens is None:
+            return
+        with self._cond:
+            self._tokens.take(used_tokens - estimated_tokens)
+
+    def backoff(self, error: BaseException) -> float:
+        """Lỗi quota/quá tải: tạm dừng toàn bộ scheduler. Trả về thời gian tạm dừng (giây)."""
+        with self._cond:
+            self._failures += 1
+            delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (self._failures - 1)) * random.uniform(0.5, 1.0)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._cond.notify_all()
+        metrics.inc("llm_scheduler_backoff_total", help="Số lần scheduler tạm dừng vì lỗi quota/quá tải",
+                    error=type(error).__name__)
+        logger.warning(f"LLM lỗi {type(error).__name__}, tạm dừng scheduler {delay:.1f}s")
+        return delay
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return sum(len(queue) for sessions in self._queues.values() for queue in sessions.values())
+
+
+@lru_cache(maxsize=1)
+def get_scheduler() -> LLMScheduler:
+    settings = get_settings()
+    return LLMScheduler(settings.llm_requests_per_minute, settings.llm_tokens_per_minute)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Lỗi quota (429) hoặc lỗi tạm thời phía server, đáng retry sau backoff."""
+    if isinstance(error, TurnTimeout):
+        return False
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if callable(code):
+        code = None
+    if isinstance(code, int) and code in _RETRYABLE_CODES:
+        return True
+    if type(error).__name__ in _RETRYABLE_NAMES:
+        return True
+    text = str(error)
+    return "RESOURCE_EXHAUSTED" in text or text.startswith("429")
+
+
+def _session(run_manager) -> str:
+    """thread_id của lượt chat (LangGraph đưa vào metadata của run), không có thì 'default'."""
+    metadata = getattr(run_manager, "metadata", None) or {}
+    if metadata.get("thread_id"):
+        return str(metadata["thread_id"])
+    config = var_child_runnable_config.get() or {}
+    return str((config.get("configurable") or {}).get("thread_id") or "default")
+
+
+def _estimate(messages) -> int:
+    return sum(_estimate_content(m.content) for m in messages)
+
+
+def _estimate_content(content) -> int:
+    if isinstance(content, str):
+        return estimate_tokens(content)
+    # Content dạng list (nhiều phần, dòng kết quả tool): ước lượng từng phần, không str() cả list
+    return sum(estimate_tokens(part if isinstance(part, str) else str(part)) for part in content)
+
+
+def _used_tokens(message) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens")
+
+
+class LatencyTracker:
+    """Thời gian các lượt gọi thành công gần đây theo model, để tính độ trễ hedge (p95)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def add(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """p95 gần đây (không nhỏ hơn HEDGE_MIN_DELAY_S), None nếu chưa đủ mẫu."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY_S, samples[int(len(samples) * 0.95) - 1])
+
+
+latencies = LatencyTracker()
+
+
+@lru_cache(maxsize=1)
+def _call_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=CALL_WORKERS, thread_name_prefix="llm-call")
+
+
+def _model_key(model) -> str:
+    return str(getattr(model, "model", None) or type(model).__name__)
+
+
+def _hedge_delay(model) -> Optional[float]:
+    return latencies.hedge_delay(_model_key(model)) if get_settings().llm_hedging else None
+
+
+def _wait_timeout(deadline: Optional[float], hedge_at: Optional[float]) -> Optional[float]:
+    """Thời gian chờ tới mốc gần nhất: deadline của lượt chat hoặc lúc gửi bản hedge."""
+    timeouts = [t for t in (remaining(deadline), hedge_at and hedge_at - time.monotonic()) if t is not None]
+    return max(min(timeouts), 0) if timeouts else None
+
+
+def _request_kwargs(model, kwargs: dict, deadline: Optional[float]) -> dict:
+    """kwargs của một lần gửi request: timeout của request không vượt quá thời gian còn lại của lượt chat."""
+    left = remaining(deadline)
+    if left is None or "timeout" not in type(model).model_fields:
+        return kwargs
+    timeout = kwargs.get("timeout") or getattr(model, "timeout", None)
+    return {**kwargs, "timeout": max(min(timeout, left) if timeout else left, 0.001)}
+
+
+def _hedge(tokens: int) -> bool:
+    """Có được gửi bản hedge không: chỉ khi scheduler còn quota ngay và không có request nào đang chờ."""
+    if not get_scheduler().try_acquire_now(tokens):
+        metrics.inc("llm_hedges_total", help="Số request hedge", result="skipped")
+        return False
+    metrics.inc("llm_hedges_total", help="Số request hedge", result="sent")
+    return True
+
+
+def _invoke(model, invoke: Callable[[], Any], tokens: int, deadline: Optional[float],
+            token: Optional[CancelToken] = None) -> Any:
+    """
+    Chạy một lượt gọi model. Không có deadline, token hủy và không hedge thì gọi thẳng trên thread hiện tại;
+    ngược lại chạy trên pool để chờ có timeout (thời gian còn lại của lượt chat), dừng chờ khi lượt chat bị hủy
+    và gửi bản hedge khi cần.
+    Lượt gọi bị bỏ dở vẫn chạy nốt trên pool (không hủy được thread), kết quả bị bỏ qua.
+    """
+    hedge_delay = _hedge_delay(model)
+    started = time.monotonic()
+    if deadline is None and token is None and hedge_delay is None:
+        result = invoke()
+        latencies.add(_model_key(model), time.monotonic() - started)
+        return result
+
+    context = copy_context()
+    primary = _call_pool().submit(context.copy().run, invoke)
+    pending = {primary}
+    stop = token.future() if token is not None else None
+    hedge_at = started + hedge_delay if hedge_delay is not None else None
+    error = None
+    while pending:
+        done, pending = wait(pending | {stop} if stop else pending, timeout=_wait_timeout(deadline, hedge_at),
+                             return_when=FIRST_COMPLETED)
+        if stop in done:
+            token.check("llm_call")
+        pending.discard(stop)
+        for future in done:
+            if future.exception() is None:
+                latencies.add(_model_key(model), time.monotonic() - started)
+                if future is not primary:
+                    metrics.inc("llm_hedges_total", help="Số request hedge", result="won")
+                return future.result()
+            error = future.exception()
+        if done:
+            continue
+        if deadline is not None:
+            check("llm_call", deadline)
+        if hedge_at is not None and time.monotonic() >= hedge_at:
+            hedge_at = None
+            if _hedge(tokens):
+                pending.add(_call_pool().submit(context.copy().run, invoke))
+    raise error
+
+
+async def _ainvoke(model, invoke: Callable[[], Any], tokens: int, deadline: Optional[float],
+                   token: Optional[CancelToken] = None) -> Any:
+    """Bản async của _invoke: timeout theo deadline bằng asyncio.wait, bản hedge là một task khác, bên thua bị hủy."""
+    hedge_delay = _hedge_delay(model)
+    started = time.monotonic()
+    primary = asyncio.ensure_future(invoke())
+    pending = {primary}
+    stop = asyncio.wrap_future(token.future()) if token is not None else None
+    hedge_at = started + hedge_delay if hedge_delay is not None else None
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending | {stop} if stop else pending,
+                                               timeout=_wait_timeout(deadline, hedge_at),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if stop in done:
+                token.check("llm_call")
+            pending.discard(stop)
+            for task in done:
+                if task.exception() is None:
+                    latencies.add(_model_key(model), time.monotonic() - started)
+                    if task is not primary:
+                        metrics.inc("llm_hedges_total", help="Số request hedge", result="won")
+                    return task.result()
+                error = task.exception()
+            if done:
+                continue
+            if deadline is not None:
+                check("llm_call", deadline)
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                hedge_at = None
+                if _hedge(tokens):
+                    pending.add(asyncio.ensure_future(invoke()))
+        raise error
+    finally:
+        # Không hủy stop: future của token dùng chung cho cả lượt chat
+        for task in pending:
+            task.cancel()
+
+
+def _next_chunk(chunks, deadline: Optional[float], token: Optional[CancelToken]) -> Any:
+    """
+    Chunk tiếp theo của stream (None khi hết). Có deadline hoặc token hủy thì đọc trên pool để chờ có timeout:
+    không chờ quá deadline của lượt chat, dừng chờ khi lượt chat bị hủy.
+    """
+    if deadline is None and token is None:
+        return next(chunks, None)
+    future = _call_pool().submit(copy_context().run, next, chunks, None)
+    stop = token.future() if token is not None else None
+    while True:
+        done, _ = wait({future, stop} if stop else {future}, timeout=_wait_timeout(deadline, None),
+                       return_when=FIRST_COMPLETED)
+        if future in done:
+            return future.result()
+        if stop in done:
+            token.check("llm_stream")
+        if deadline is not None:
+            check("llm_stream", deadline)
+
+
+async def _anext_chunk(chunks, deadline: Optional[float], token: Optional[CancelToken]) -> Any:
+    """Bản async của _next_chunk: chờ bằng asyncio.wait, hết deadline hoặc bị hủy thì hủy lượt đọc đang chờ."""
+    if deadline is None and token is None:
+        return await anext(chunks, None)
+    task = asyncio.ensure_future(anext(chunks, None))
+    stop = asyncio.wrap_future(token.future()) if token is not None else None
+    try:
+        while True:
+            done, _ = await asyncio.wait({task, stop} if stop else {task}, timeout=_wait_timeout(deadline, None),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                return task.result()
+            if stop in done:
+                token.check("llm_stream")
+            if deadline is not None:
+                check("llm_stream", deadline)
+    finally:
+        task.cancel()
+
+
+def _call(model, messages, run_manager, invoke: Callable[[], Any], used: Callable[[Any], Optional[int]]) -> Any:
+    scheduler = get_scheduler()
+    priority, session, tokens = model.llm_priority, _session(run_manager), _estimate(messages)
+    deadline, token = current_deadline(run_manager), current_token()
+    for attempt in range(model.llm_max_retries + 1):
+        if deadline is not None:
+            check("llm", deadline)
+        if token is not None:
+            token.check("llm")
+        scheduler.acquire(priority, session, tokens, deadline, token)
+        marker = _scheduled_call.set(True)
+        try:
+            result = _invoke(model, invoke, tokens, deadline, token)
+        except TurnCancelled:
+            metrics.inc("llm_scheduler_requests_total", help="Số request LLM qua scheduler",
+                        priority=priority, result="cancelled")
+            raise
+        except Exception as e:
+            if attempt >= model.llm_max_retries or not is_retryable(e):
+                metrics.inc("llm_scheduler_requests_total", help="Số request LLM qua scheduler",
+                            priority=priority, result="timeout" if isinstance(e, TurnTimeout) else "error")
+                raise
+            scheduler.backoff(e)
+            metrics.inc("llm_scheduler_retries_total", help="Số lần scheduler gửi lại request LLM", priority=priority)
+            continue
+        finally:
+            _scheduled_call.reset(marker)
+        scheduler.settle(tokens, used(result))
+        metrics.inc("llm_scheduler_requests_total", help="Số request LLM qua scheduler", priority=priority, result="ok")
+        return result
+
+
+async def _acall(model, messages, run_manager, invoke, used) -> Any:
+    scheduler = get_scheduler()
+    priority, session, tokens = model.llm_priority, _session(run_manager), _estimate(messages)
+    deadline, token = current_deadline(run_manager), current_token()
+    for attempt in range(model.llm_max_retries + 1):
+        if deadline is not None:
+            check("llm", deadline)
+        if token is not None:
+            token.check("llm")
+        await scheduler.aacquire(priority, session, tokens, deadline, token)
+        marker = _scheduled_call.set(True)
+        try:
+            result = await _ainvoke(model, invoke, tokens, deadline, token)
+        except (TurnCancelled, asyncio.CancelledError):
+            metrics.inc("llm_scheduler_requests_total", help="Số request LLM qua scheduler",
+                        priority=priority, result="cancelled")
+            raise
+        except Exception as e:
+            if attempt >= model.llm_max_retries or not is_retryable(e):
+                metrics.inc("llm_scheduler_requests_total", help="Số request LLM qua scheduler",
+                            priority=priority, result="timeout" if isinstance(e, TurnTimeout) else "error")
+                raise
+            scheduler.backoff(e)
+            metrics.inc("llm_scheduler_retries_total", help="Số lần scheduler gửi lại request LLM", priority=priority)
+            continue
+        finally:
+            _scheduled_call.reset(marker)
+        scheduler.settle(tokens, used(result))
+        metrics.inc("llm_scheduler_requests_total", help="Số request LLM qua scheduler", priority=priority, result="ok")
+        return result
+
+
+def _generation_tokens(result) -> Optional[int]:
+    return _used_tokens(result.generations[0].message) if result.generations else None
+
+
+@lru_cache(maxsize=None)
+def _scheduled_class(base: Type[BaseChatModel]) -> Type[BaseChatModel]:
+    """
+    Lớp con của lớp model gốc, mọi lượt gọi _generate/_agenerate/_stream/_astream đi qua scheduler.
+    Chỉ ghi đè các hàm mà lớp gốc tự cài đặt (hàm mặc định của BaseChatModel gọi lại các hàm đã ghi đè).
+    """
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if _scheduled_call.get():
+            return base._generate(self, messages, stop, run_manager, **kwargs)
+        deadline = current_deadline(run_manager)
+        return _call(self, messages, run_manager,
+                     lambda: base._generate(self, messages, stop, run_manager,
+                                            **_request_kwargs(self, kwargs, deadline)),
+                     _generation_tokens)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if _scheduled_call.get():
+            return await base._agenerate(self, messages, stop, run_manager, **kwargs)
+        deadline = current_deadline(run_manager)
+        return await _acall(self, messages, run_manager,
+                            lambda: base._agenerate(self, messages, stop, run_manager,
+                                                    **_request_kwargs(self, kwargs, deadline)),
+                            _generation_tokens)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if _scheduled_call.get():
+            yield from base._stream(self, messages, stop, run_manager, **kwargs)
+            return
+        # Chỉ retry/hedge được khi chưa nhận chunk nào: chunk đầu tiên lấy qua scheduler (mỗi lần gửi là một stream
+        # riêng, bên về trước được dùng), các chunk sau vẫn không chờ quá deadline của lượt chat
+        deadline, token = current_deadline(run_manager), current_token()
+
+        def first_chunk():
+            chunks = base._stream(self, messages, stop, run_manager, **_request_kwargs(self, kwargs, deadline))
+            return chunks, next(chunks, None)
+
+        chunks, chunk = _call(self, messages, run_manager, first_chunk, lambda result: None)
+        total = None
+        while chunk is not None:
+            total = _used_tokens(chunk.message) or total
+            yield chunk
+            chunk = _next_chunk(chunks, deadline, token)
+        get_scheduler().adjust_tokens(_estimate(messages), total)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if _scheduled_call.get():
+            async for chunk in base._astream(self, messages, stop, run_manager, **kwargs):
+                yield chunk
+            return
+        deadline, token = current_deadline(run_manager), current_token()
+
+        async def first_chunk():
+            chunks = base._astream(self, messages, stop, run_manager, **_request_kwargs(self, kwargs, deadline))
+            return chunks, await anext(chunks, None)
+
+        chunks, chunk = await _acall(self, messages, run_manager, first_chunk, lambda result: None)
+        total = None
+        while chunk is not None:
+            total = _used_tokens(chunk.message) or total
+            yield chunk
+            chunk = await _anext_chunk(chunks, deadline, token)
+        get_scheduler().adjust_tokens(_estimate(messages), total)
+
+    async def ainvoke(self, input, config=None, *, stop=None, **kwargs):
+        try:
+            return await base.ainvoke(self, input, config, stop=stop, **kwargs)
+        except Exception:
+            # BaseChatModel.agenerate gom lỗi bằng asyncio.gather(return_exceptions=True) nhưng chỉ coi Exception là lỗi:
+            # TurnCancelled (BaseException) bị biến thành AttributeError. Lượt chat đã bị hủy thì ném lại TurnCancelled
+            token = current_token()
+            if token is not None:
+                token.check("llm")
+            raise
+
+    namespace = {
+        "__module__": __name__,
+        "__annotations__": {"llm_priority": str, "llm_max_retries": int},
+        "llm_priority": INTERACTIVE,
+        "llm_max_retries": 3,
+        "_generate": _generate,
+        "ainvoke": ainvoke,
+    }
+    if base._agenerate is not BaseChatModel._agenerate:
+        namespace["_agenerate"] = _agenerate
+    if base._stream is not BaseChatModel._stream:
+        namespace["_stream"] = _stream
+    if base._astream is not BaseChatModel._astream:
+        namespace["_astream"] = _astream
+    return type(f"Scheduled{base.__name__}", (base,), namespace)
+
+
+def schedule(model: BaseChatModel, priority: str = INTERACTIVE, max_retries: int = 3) -> BaseChatModel:
+    """
+    Bản sao của model với mọi lượt gọi đi qua scheduler dùng chung.
+
+    :param priority: INTERACTIVE, BATCH hoặc BACKGROUND
+    :param max_retries: số lần scheduler gửi lại khi lỗi quota/quá tải (model gốc nên tạo với max_retries=0)
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority không hợp lệ: {priority}")
+    cls = _scheduled_class(type(model))
+    scheduled = cls.__new__(cls)
+    # Giống BaseModel.__copy__: giữ nguyên client/thuộc tính private đã khởi tạo của model gốc
+    object.__setattr__(scheduled, "__dict__", {**model.__dict__, "llm_priority": priority, "llm_max_retries": max_retries})
+    object.__setattr__(scheduled, "__pydantic_fields_set__", set(model.__pydantic_fields_set__))
+    object.__setattr__(scheduled, "__pydantic_extra__", model.__pydantic_extra__)
+    object.__setattr__(scheduled, "__pydantic_private__", model.__pydantic_private__)
+    return scheduled
@@ -0,0 +1,251 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import List, Optional
+
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = "profiles"
+PROFILE_MODES = ("sampling", "cprofile")
+# Frame lá của thread pool đang rảnh (chờ job trong SimpleQueue), bỏ qua khi lấy mẫu
+IDLE_LEAF_FRAMES = ("_worker (concurrent/futures/thread.py",)
+
+
+def profile_mode_from_env() -> str:
+    """Chế độ profiling mặc định từ biến môi trường PROFILE_TURNS (sampling | cprofile), rỗng = tắt."""
+    mode = get_settings().profile_turns
+    return mode if mode in PROFILE_MODES else ""
+
+
+class ProfileResult:
+    """Kết quả một lượt profiling: đường dẫn file đã lưu và bảng hàm tốn thời gian nhất."""
+
+    def __init__(self, mode: str, label: str):
+        self.mode = mode
+        self.label = label
+        self.files: List[str] = []
+        self.top: List[dict] = []
+        self.elapsed: float = 0.0
+
+
+class _SamplingProfiler:
+    """
+    Profiler lấy mẫu stack của mọi thread (kể cả thread executor chạy node/tool) theo chu kỳ.
+    Kết quả ghi theo định dạng folded stack, dùng trực tiếp với flamegraph.pl hoặc speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                leaf = f"{code.co_name} ({_short_path(code.co_filename)}"
+                if leaf.startswith(IDLE_LEAF_FRAMES):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int) -> List[dict]:
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        scale = self.interval * 1000
+        return [
+            {
+                "function": frame,
+                "self_ms": round(own[frame] * scale, 1),
+                "total_ms": round(total[frame] * scale, 1),
+                "self_samples": own[frame],
+            }
+            for frame, _ in own.most_common(limit)
+        ]
+
+
+class _DeterministicProfiler:
+    """
+    cProfile cho thread gọi turn, cộng thêm profile từng node chạy trong thread executor
+    (đăng ký qua thread_profile()); các kết quả được gộp bằng pstats.
+    """
+
+    def __init__(self):
+        self.main = cProfile.Profile()
+        self.thread_id = threading.get_ident()
+        self.thread_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self.main.enable()
+
+    def stop(self) -> None:
+        self.main.disable()
+
+    def add(self, profile: cProfile.Profile) -> None:
+        with self._lock:
+            self.thread_profiles.append(profile)
+
+    def stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self.main)
+        with self._lock:
+            for profile in self.thread_profiles:
+                stats.add(profile)
+        return stats
+
+    def top(self, limit: int) -> List[dict]:
+        stats = self.stats()
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+        return [
+            {
+                "function": f"{name} ({_short_path(path)}:{line})",
+                "self_ms": round(own_time * 1000, 1),
+                "total_ms": round(cumulative * 1000, 1),
+                "calls": calls,
+            }
+            for (path, line, name), (_, calls, own_time, cumulative, _) in rows
+        ]
+
+
+_active_deterministic: ContextVar[Optional[_DeterministicProfiler]] = ContextVar("active_profiler", default=None)
+
+
+def thread_profile():
+    """
+    Profile phần thân một node khi đang có phiên cProfile; khi profiling tắt trả về nullcontext.
+    Cần thiết vì cProfile chỉ đo thread đã enable nó, còn node chạy trong thread executor.
+    """
+    session = _active_deterministic.get()
+    if session is None or session.thread_id == threading.get_ident():
+        return nullcontext()
+    return _profile_current_thread(session)
+
+
+@contextmanager
+def _profile_current_thread(session: _DeterministicProfiler):
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        session.add(profile)
+
+
+def profile_turn(mode: str, label: str = "turn", top_n: int = 25, output_dir: str = PROFILE_DIR):
+    """
+    Bọc một lượt chat trong profiler. mode rỗng trả về nullcontext nên không tốn chi phí khi tắt.
+
+    :param mode: 'sampling' (mọi thread, xuất folded stack) hoặc 'cprofile' (deterministic, xuất .prof)
+    :param label: nhãn dùng trong tên file
+    :param top_n: số hàm nóng nhất ghi vào bảng tổng hợp
+    :param output_dir: thư mục lưu profile
+    :return: context manager, yield ProfileResult (được điền sau khi kết thúc)
+    """
+    if not mode:
+        return nullcontext()
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Chế độ profiling không hợp lệ: {mode}")
+    return _profile_turn(mode, label, top_n, output_dir)
+
+
+@contextmanager
+def _profile_turn(mode: str, label: str, top_n: int, output_dir: str):
+    result = ProfileResult(mode, label)
+    profiler = _SamplingProfiler() if mode == "sampling" else _DeterministicProfiler()
+    token = _active_deterministic.set(profiler) if mode == "cprofile" else None
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        yield result
+    finally:
+        profiler.stop()
+        result.elapsed = time.perf_counter() - start
+        if token is not None:
+            _active_deterministic.reset(token)
+        try:
+            _save(profiler, result, top_n, output_dir)
+        except OSError as e:
+            logger.warning(f"Không lưu được profile: {str(e)}")
+
+
+def _save(profiler, result: ProfileResult, top_n: int, output_dir: str) -> None:
+    os.makedirs(output_dir, exist_ok=True)
+    base = os.path.join(output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{_slug(result.label)}_{result.mode}")
+
+    if isinstance(profiler, _SamplingProfiler):
+        path = base + ".folded"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(profiler.folded())
+    else:
+        path = base + ".prof"
+        profiler.stats().dump_stats(path)
+    result.files.append(path)
+
+    result.top = profiler.top(top_n)
+    top_path = base + "_top.txt"
+    with open(top_path, "w", encoding="utf-8") as f:
+        f.write(format_top(result))
+    result.files.append(top_path)
+    logger.info(f"Đã lưu profile: {', '.join(result.files)}")
+
+
+def format_top(result: ProfileResult) -> str:
+    out = io.StringIO()
+    out.write(f"# {result.label} ({result.mode}) - {result.elapsed:.3f}s\n")
+    out.write(f"{'self_ms':>10} {'total_ms':>10}  function\n")
+    for row in result.top:
+        out.write(f"{row['self_ms']:>10} {row['total_ms']:>10}  {row['function']}\n")
+    return out.getvalue()
+
+
+def _short_path(path: str) -> str:
+    parts = path.replace("\\", "/").split("/")
+    if "site-packages" in parts:
+        parts = parts[parts.index("site-packages") + 1:]
+    return "/".join(parts[-3:])
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", text)[:40] or "turn"
@@ -0,0 +1,239 @@
+"""
+Định tuyến ý định bằng luật cục bộ, chạy trước call_model.
+
+Khi tin nhắn rõ ràng (có file đính kèm + "tóm tắt", "tạo 10 câu trắc nghiệm về ...", "tìm sách về ...")
+và đủ tham số, node route_intent sinh luôn tool call, bỏ qua lượt gọi LLM để lập kế hoạch.
+Không chắc chắn (không khớp luật, khớp nhiều luật, thiếu tham số, câu phủ định "đừng tóm tắt ...",
+chủ đề trỏ về tin nhắn trước "... về chủ đề này", còn yêu cầu thêm mà tool không nhận như "..., mỗi câu 4 đáp án"
+hay "tóm tắt chương 2") thì để call_model quyết định như cũ.
+"""
+import logging
+import re
+import uuid
+from typing import Callable, List, NamedTuple, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from settings import get_settings
+from tools.text_utils import strip_accents
+from tracing import metrics, span
+
+logger = logging.getLogger(__name__)
+
+FILE_NOTE_PATTERN = re.compile(r"\s*\[File đính kèm: (.+?), loại [^\]]*\]")
+
+_SUMMARY = re.compile(r"\btom tat\b|\btom luoc\b|\bsummar")
+_EXTRACT = re.compile(r"^\W*(?:(?:hay |giup (?:toi |minh )?)?(?:doc|trich xuat|lay noi dung|xem|mo)\b.{0,40})?\W*$")
+_QUIZ = re.compile(
+    r"\b(?:tao|soan|ra|lam|sinh)\b.{0,20}?\b(?P<count>\d{1,2})\s*cau(?:\s*hoi)?\s*"
+    r"(?P<kind>trac nghiem|tu luan)\s*(?:ve|chu de|cho)\s+(?P<topic>.+)$"
+)
+_QUIZ_BOOK = re.compile(r"^(?:noi dung\s+)?(?:cuon\s+|quyen\s+)?sach\s+(?P<title>.+?)(?:\s*,?\s*chuong\s+(?P<chapter>\d+))?$")
+# Yêu cầu thêm sau chủ đề ("... và giải thích đáp án", "..., mỗi câu 4 đáp án", "... bằng tiếng Anh"):
+# tool không nhận các ràng buộc này, để call_model xử lý thay vì nhét vào chủ đề
+_EXTRA_CLAUSE = re.compile(r"[,;:()]|\b(?:va|moi|bang|kem|gom|voi|co dap an|dap an|giai thich|trong do|danh cho|"
+                           r"cho|theo|muc do|do kho|khong qua|it nhat|toi da|thoi gian|nhung|sau do)\b")
+# Tóm tắt một phần của file ("tóm tắt chương 2", "tóm tắt phần đầu"): tool summary luôn tóm tắt cả file
+_SECTION = re.compile(r"\b(?:chuong|muc|trang|tiet|chapter|section|page)\b|"
+                      r"\b(?:phan|bai|doan|part)\s+(?:\d+|[ivx]+\b|dau|cuoi|giua|thu|mot|hai|ba|bon|nay|do|tren)")
+_SEARCH = re.compile(r"^\W*(?:hay |giup (?:toi |minh )?)?(?:tim|tim kiem|goi y|liet ke)\s+(?:cac |nhung )?sach\s+"
+                     r"(?:ve|chu de|the loai|thuoc|linh vuc)\s+(?P<topic>.+)$")
+_SIMILAR = re.compile(r"\bsach\s+(?:nao\s+|khac\s+)?(?:tuong tu|giong|cung loai)\s*(?:nhu|voi)?\s*(?:cuon|quyen)?\s*"
+                      r"(?:sach\s+)?(?P<title>.+?)(?:\s+(?:khong|vay|nhi))?\W*$")
+
+
+# Phủ định đứng ngay trước động từ của yêu cầu: "đừng tóm tắt", "không muốn tạo", "chưa cần tìm"
+_NEGATIONS = {"không", "đừng", "chưa", "chẳng", "chả", "khỏi"}
+_NEGATIONS_PLAIN = {"khong", "ko", "dung", "chua", "chang"}
+_NEGATED_VERBS = {"tao", "soan", "ra", "lam", "sinh", "tom", "doc", "trich", "lay", "xem", "mo", "tim", "goi",
+                  "liet", "muon", "can", "nen", "phai"}
+# Tiểu từ cuối câu không thuộc chủ đề: "... về hàm số nhé", "... về tế bào giúp mình"
+_PARTICLES = {"nhé", "nha", "nhá", "nhe", "giúp", "giùm", "dùm", "hộ", "đi", "với", "ạ", "luôn", "được", "không"}
+_PARTICLES_PLAIN = {"nhe", "nha", "giup", "gium", "dum", "di", "luon", "duoc", "khong", "ko"}
+_PARTICLE_OBJECTS = {"tôi", "mình", "em", "tớ", "bạn", "toi", "minh", "to", "ban"}
+# Chủ đề trỏ về tin nhắn/file trước đó: "chủ đề này", "nội dung trên", "cuốn đó"
+_DEMONSTRATIVES = {"này", "đó", "trên", "ấy", "kia", "đấy", "nọ"}
+_DEMONSTRATIVES_PLAIN = {"nay", "tren", "ay", "kia", "day"}
+_GENERIC_TOPICS = {"chu de", "noi dung", "tai lieu", "file", "bai", "bai hoc", "sach", "cuon sach", "no"}
+
+
+def _unaccented(text: str) -> bool:
+    """Tin nhắn gõ không dấu: chỉ khi đó mới so khớp các từ không dấu dễ nhầm (dung/dùng, nay/nay)."""
+    return strip_accents(text) == text.lower()
+
+
+def _negated(text: str) -> bool:
+    """Có từ phủ định đứng trong 2 từ trước một động từ yêu cầu (tạo, tóm tắt, tìm, muốn, cần, ...)."""
+    words = re.findall(r"\w+", text.lower())
+    negations = _NEGATIONS | (_NEGATIONS_PLAIN if _unaccented(text) else set())
+    for i, word in enumerate(words):
+        if word in negations and any(strip_accents(w) in _NEGATED_VERBS for w in words[i + 1:i + 3]):
+            return True
+    return False
+
+
+def _topic(value: str) -> str:
+    """
+    Chủ đề đã bỏ tiểu từ cuối câu. Trả về "" nếu chủ đề trỏ về tin nhắn trước ("chủ đề này", "nội dung trên")
+    để call_model (có lịch sử hội thoại) quyết định.
+    """
+    plain = _unaccented(value)
+    particles = _PARTICLES | (_PARTICLES_PLAIN if plain else set())
+    words = _clean(value).split()
+    while len(words) > 1:
+        last = words[-1].lower().strip(" .,!?;:")
+        before = words[-2].lower().strip(" .,!?;:")
+        if last in particles or (last in _PARTICLE_OBJECTS and (before in particles or before == "cho")):
+            words.pop()
+        else:
+            break
+    topic = _clean(" ".join(words))
+    demonstratives = _DEMONSTRATIVES | (_DEMONSTRATIVES_PLAIN if plain else set())
+    if not topic or topic.split()[-1].lower() in demonstratives or strip_accents(topic) in _GENERIC_TOPICS:
+        return ""
+    return topic
+
+
+class Route(NamedTuple):
+    tool: str
+    args: dict
+    rule: str
+
+
+def _clean(value: str) -> str:
+    return value.strip().strip(" .,!?;:\"'“”")
+
+
+def _original(text: str, normalized: str, match: re.Match, group: str) -> str:
+    """Lấy nhóm regex từ chuỗi gốc (giữ dấu, chữ hoa) khi strip_accents giữ nguyên độ dài."""
+    if len(text) == len(normalized):
+        return _clean(text[match.start(group):match.end(group)])
+    return _clean(match.group(group))
+
+
+def _file_rules(text: str, normalized: str, file_name: Optional[str]) -> Optional[Route]:
+    if not file_name:
+        return None
+    if _SUMMARY.search(normalized):
+        if _SECTION.search(normalized):
+            return None
+        return Route("summary", {"message": text, "file_name": file_name}, "file+summary")
+    if _EXTRACT.match(normalized):
+        return Route("extract_file", {"message": text, "file_name": file_name}, "file+extract")
+    return None
+
+
+def _quiz_rule(text: str, normalized: str, file_name: Optional[str]) -> Optional[Route]:
+    match = _QUIZ.search(normalized)
+    if not match or file_name:
+        return None
+    count = int(match.group("count"))
+    if not 1 <= count <= 50:
+        return None
+    args = {
+        "loai_bode": "trắc nghiệm" if match.group("kind") == "trac nghiem" else "tự luận",
+        "so_cau": count,
+    }
+    topic = _topic(_original(text, normalized, match, "topic"))
+    book = _QUIZ_BOOK.match(strip_accents(topic))
+    if _EXTRA_CLAUSE.search(book.group("title") if book else strip_accents(topic)):
+        return None
+    if book:
+        from tools.title_index import get_title_index
+
+        title = get_title_index().best_match(book.group("title"))
+        if title is None:
+            return None
+        args["ten_sach"] = title.book_name
+        if book.group("chapter"):
+            args["chuong"] = int(book.group("chapter"))
+    elif not topic:
+        return None
+    else:
+        args["chu_de"] = topic
+    return Route("question_generator_tool", args, "quiz")
+
+
+def _search_rule(text: str, normalized: str, file_name: Optional[str]) -> Optional[Route]:
+    match = _SEARCH.match(normalized)
+    if not match:
+        return None
+    from tools.category_cache import get_category_cache
+
+    topic = _topic(_original(text, normalized, match, "topic"))
+    if not topic or not get_category_cache().resolve(topic):
+        return None
+    return Route("search_by_topic", {"topic": topic}, "search")
+
+
+def _similar_rule(text: str, normalized: str, file_name: Optional[str]) -> Optional[Route]:
+    match = _SIMILAR.search(normalized)
+    if not match:
+        return None
+    from tools.title_index import get_title_index
+
+    title = get_title_index().best_match(_original(text, normalized, match, "title"))
+    if title is None:
+        return None
+    return Route("similar_books", {"book_id": title.book_id, "ten_sach": title.book_name}, "similar")
+
+
+RULES: List[Callable[[str, str, Optional[str]], Optional[Route]]] = [
+    _file_rules,
+    _quiz_rule,
+    _similar_rule,
+    _search_rule,
+]
+
+
+def classify(message: str) -> Optional[Route]:
+    """
+    Chọn tool cho tin nhắn user bằng luật. Trả về None nếu không chắc chắn
+    (không luật nào khớp đủ tham số, hoặc nhiều hơn một luật khớp).
+    """
+    file_match = FILE_NOTE_PATTERN.search(message)
+    file_name = file_match.group(1) if file_match else None
+    text = FILE_NOTE_PATTERN.sub("", message).strip()
+    normalized = strip_accents(text)
+    if _negated(text):
+        return None
+
+    routes = []
+    for rule in RULES:
+        try:
+            route = rule(text, normalized, file_name)
+        except Exception as e:
+            # Lỗi tra title index / category cache: để LLM quyết định
+            logger.warning(f"Luật định tuyến {rule.__name__} lỗi: {e}")
+            route = None
+        if route is not None:
+            routes.append(route)
+    return routes[0] if len(routes) == 1 else None
+
+
+def route_intent(state) -> dict:
+    """
+    Node đầu tiên của graph: nếu tin nhắn mới nhất của user khớp chắc chắn một luật,
+    thêm AIMessage chứa tool call để đi thẳng tới call_tools (tiết kiệm một lượt gọi LLM).
+    """
+    last = state["messages"][-1]
+    if not get_settings().intent_router or not isinstance(last, HumanMessage):
+        return {"messages": []}
+
+    with span("route_intent", kind="node") as record:
+        route = classify(str(last.content))
+        record["route"] = route.rule if route else "llm"
+
+    metrics.inc("agent_router_decisions_total", help="Số lượt định tuyến theo luật", route=route.rule if route else "llm")
+    if route is None:
+        return {"messages": []}
+
+    metrics.inc("agent_llm_calls_saved_total", help="Số lượt gọi LLM bỏ qua được", reason="router")
+    tool_call = {"name": route.tool, "args": route.args, "id": f"route_{uuid.uuid4().hex}"}
+    return {"messages": [AIMessage(content="", tool_calls=[tool_call])]}
+
+
+def next_after_route(state) -> str:
+    """Cạnh điều kiện sau route_intent: có tool call thì chạy tool, không thì hỏi LLM."""
+    last = state["messages"][-1]
+    return "tools" if getattr(last, "tool_calls", None) else "model"
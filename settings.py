@@ -0,0 +1,77 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Cấu hình đọc từ .env / biến môi trường, chỉ nạp một lần cho cả process."""
+    gemini_api_key: Optional[str]
+    tavily_api_key: Optional[str]
+    db_backend: str
+    db_host: Optional[str]
+    db_user: Optional[str]
+    db_password: Optional[str]
+    db_name: Optional[str]
+    db_port: int
+    db_sqlite_path: str
+    neighbour_index_path: str
+    cache_dir: str
+    trace_file: Optional[str]
+    metrics_port: Optional[int]
+    profile_turns: str
+    intent_router: bool
+    ocr_languages: str
+    llm_scheduler: bool
+    llm_requests_per_minute: float
+    llm_tokens_per_minute: float
+    llm_timeout_s: float
+    llm_hedging: bool
+    turn_budget_s: float
+    worker_processes: int
+    worker_max_jobs: int
+    worker_max_rss_mb: float
+    worker_queue_size: int
+    async_tools: bool
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """
+    Nạp .env đúng một lần rồi trả về Settings dùng chung.
+    Gọi get_settings.cache_clear() nếu cần đọc lại biến môi trường (ví dụ trong script benchmark).
+    """
+    load_dotenv()
+    metrics_port = os.getenv("METRICS_PORT")
+    return Settings(
+        gemini_api_key=os.getenv("GEMINI_API_KEY"),
+        tavily_api_key=os.getenv("TAVILY_API_KEY"),
+        db_backend=os.getenv("DB_BACKEND", "mysql").lower(),
+        db_host=os.getenv("DB_HOST"),
+        db_user=os.getenv("DB_USER"),
+        db_password=os.getenv("DB_PASSWORD"),
+        db_name=os.getenv("DB_NAME"),
+        db_port=int(os.getenv("DB_PORT", 3306)),
+        db_sqlite_path=os.getenv("DB_SQLITE_PATH", os.path.join("data", "library.db")),
+        neighbour_index_path=os.getenv("NEIGHBOUR_INDEX_PATH", os.path.join("data", "neighbours.npz")),
+        cache_dir=os.getenv("CACHE_DIR", "cache"),
+        trace_file=os.getenv("TRACE_FILE") or None,
+        metrics_port=int(metrics_port) if metrics_port else None,
+        profile_turns=os.getenv("PROFILE_TURNS", "").strip().lower(),
+        intent_router=os.getenv("INTENT_ROUTER", "1").strip().lower() not in ("0", "false", "no", "off"),
+        ocr_languages=os.getenv("OCR_LANGUAGES", "vie+eng"),
+        llm_scheduler=os.getenv("LLM_SCHEDULER", "1").strip().lower() not in ("0", "false", "no", "off"),
+        llm_requests_per_minute=float(os.getenv("LLM_RPM", 1000)),
+        llm_tokens_per_minute=float(os.getenv("LLM_TPM", 1_000_000)),
+        llm_timeout_s=float(os.getenv("LLM_TIMEOUT_S", 60)),
+        llm_hedging=os.getenv("LLM_HEDGING", "0").strip().lower() in ("1", "true", "yes", "on"),
+        turn_budget_s=float(os.getenv("TURN_BUDGET_S", 90)),
+        worker_processes=int(os.getenv("WORKER_PROCESSES", 2)),
+        worker_max_jobs=int(os.getenv("WORKER_MAX_JOBS", 100)),
+        worker_max_rss_mb=float(os.getenv("WORKER_MAX_RSS_MB", 1024)),
+        worker_queue_size=int(os.getenv("WORKER_QUEUE_SIZE", 32)),
+        async_tools=os.getenv("ASYNC_TOOLS", "1").strip().lower() not in ("0", "false", "no", "off"),
+    )
@@ -1,32 +1,138 @@
 
-from db.database import Database
+from db.database import create_async_database, create_database
 
 from langchain_core.tools import Tool
-from langchain_core.tools import tool
 
-@tool(name_or_callable="search_by_topic", description="Tìm kiếm sách theo chủ đề (CategoryName). Input: topic (str). Output: list các sách.")
+from tools.category_cache import get_category_cache
+
+_BY_CONTENT = """
+    SELECT Book.BookID, Book.BookName, Book.Content, BookCategory.CategoryName
+    FROM Book
+    LEFT JOIN BookCategory ON Book.CategoryID = BookCategory.CategoryID
+    WHERE Book.Content LIKE %s OR Book.BookName LIKE %s
+"""
+_BY_ID = """
+    SELECT Book.BookID, Book.BookName, Book.Content, BookCategory.CategoryName
+    FROM Book
+    LEFT JOIN BookCategory ON Book.CategoryID = BookCategory.CategoryID
+    WHERE Book.BookID = %s
+"""
+_INFO_BY_ID = """
+    SELECT Book.BookID, Book.BookName, BookCategory.CategoryName
+    FROM Book
+    LEFT JOIN BookCategory ON Book.CategoryID = BookCategory.CategoryID
+    WHERE Book.BookID = %s
+"""
+_OUTLINE = """
+    SELECT ChapterIndex, MIN(ChapterTitle), MIN(ChunkIndex), MAX(ChunkIndex), SUM(TokenCount)
+    FROM BookChunk
+    WHERE BookID = %s
+    GROUP BY ChapterIndex
+    ORDER BY ChapterIndex
+"""
+_CHUNKS = """
+    SELECT ChunkIndex, ChapterIndex, ChapterTitle, Content, TokenCount
+    FROM BookChunk
+    WHERE BookID = %s AND ChunkIndex BETWEEN %s AND %s
+    ORDER BY ChunkIndex
+"""
+_CHAPTER = """
+    SELECT ChunkIndex, ChapterIndex, ChapterTitle, Content, TokenCount
+    FROM BookChunk
+    WHERE BookID = %s AND ChapterIndex = %s
+    ORDER BY ChunkIndex
+"""
+_SUMMARY = """
+    SELECT BookSummary.Summary
+    FROM BookSummary
+    JOIN Book ON Book.BookID = BookSummary.BookID
+    WHERE BookSummary.BookID = %s AND BookSummary.Length = %s
+      AND BookSummary.ContentHash = SHA2(COALESCE(Book.Content, ''), 256)
+"""
+_SUMMARY_BY_HASH = """
+    SELECT Summary
+    FROM BookSummary
+    WHERE ContentHash = %s AND Length = %s
+    LIMIT 1
+"""
+_SIMILAR = """
+    SELECT Book.BookID, Book.BookName, BookCategory.CategoryName, BookNeighbour.Score
+    FROM BookNeighbour
+    JOIN Book ON Book.BookID = BookNeighbour.NeighbourID
+    LEFT JOIN BookCategory ON Book.CategoryID = BookCategory.CategoryID
+    WHERE BookNeighbour.BookID = %s
+    ORDER BY BookNeighbour.NeighbourRank
+    LIMIT %s
+"""
+
+# Mỗi hàm tra cứu có bản sync (tool chạy trên thread, job offline) và bản async tiền tố "a" (tool trên event loop)
+
+
 def search_by_topic(topic):
     """
     Tìm kiếm sách theo chủ đề (CategoryName).
+    Chủ đề được chuyển thành CategoryID trong bộ nhớ (category cache), DB chỉ lọc Book.CategoryID IN (...).
 
     Args:
         topic (str): Chủ đề cần tìm.
 
     Returns:
-        list: Danh sách tuple (BookID, BookName, Content, CategoryName) có chủ đề chứa từ khóa topic.
+        list: Danh sách tuple (BookID, BookName, Content, CategoryName) thuộc các chủ đề khớp với topic.
     """
-    db = Database()
-    db.connect()
-    query = """
-        SELECT Book.BookID, Book.BookName, Book.Content, BookCategory.CategoryName
+    categories = get_category_cache()
+    category_ids = categories.resolve(topic)
+    if not category_ids:
+        return []
+
+    rows = _fetch(_books_in_categories(len(category_ids)), tuple(category_ids))
+    return _with_category_names(categories, rows)
+
+
+async def asearch_by_topic(topic):
+    """Bản async của search_by_topic cho event loop (category cache và truy vấn Book dùng DB async)."""
+    categories = get_category_cache()
+    category_ids = await categories.aresolve(topic)
+    if not category_ids:
+        return []
+
+    rows = await _afetch(_books_in_categories(len(category_ids)), tuple(category_ids))
+    return _with_category_names(categories, rows)
+
+
+def _books_in_categories(count):
+    placeholders = ", ".join(["%s"] * count)
+    return f"""
+        SELECT Book.BookID, Book.BookName, Book.Content, Book.CategoryID
         FROM Book
-        LEFT JOIN BookCategory ON Book.CategoryID = BookCategory.CategoryID
-        WHERE BookCategory.CategoryName LIKE %s
+        WHERE Book.CategoryID IN ({placeholders})
     """
-    db.cursor.execute(query, ("%" + topic + "%",))
-    results = db.cursor.fetchall()
-    db.close()
-    return results
+
+
+def _with_category_names(categories, rows):
+    return [
+        (book_id, book_name, content, categories.name(category_id))
+        for book_id, book_name, content, category_id in rows
+    ]
+
+
+def _fetch(query, params=None):
+    """Mở kết nối, chạy một truy vấn SELECT và đóng kết nối."""
+    db = create_database()
+    db.connect()
+    try:
+        return db.fetch(query, params)
+    finally:
+        db.close()
+
+
+async def _afetch(query, params=None):
+    """Bản async của _fetch (aiomysql, hoặc chạy trên thread với SQLite)."""
+    db = create_async_database()
+    await db.connect()
+    try:
+        return await db.fetch(query, params)
+    finally:
+        await db.close()
 
 def search_by_content(keyword):
     """
@@ -38,18 +144,168 @@ def search_by_content(keyword):
     Returns:
         list: Danh sách tuple (BookID, BookName, Content, CategoryName) có nội dung hoặc tên sách chứa từ khóa keyword.
     """
-    db = Database()
-    db.connect()
-    query = """
-        SELECT Book.BookID, Book.BookName, Book.Content, BookCategory.CategoryName
-        FROM Book
-        LEFT JOIN BookCategory ON Book.CategoryID = BookCategory.CategoryID
-        WHERE Book.Content LIKE %s OR Book.BookName LIKE %s
+    return _fetch(_BY_CONTENT, ("%" + keyword + "%", "%" + keyword + "%"))
+
+
+async def asearch_by_content(keyword):
+    """Bản async của search_by_content."""
+    return await _afetch(_BY_CONTENT, ("%" + keyword + "%", "%" + keyword + "%"))
+
+def get_book_by_id(book_id):
+    """
+    Lấy một sách theo khóa chính BookID.
+
+    Args:
+        book_id (int): Mã sách.
+
+    Returns:
+        tuple | None: (BookID, BookName, Content, CategoryName) hoặc None nếu không có.
+    """
+    results = _fetch(_BY_ID, (book_id,))
+    return results[0] if results else None
+
+
+async def aget_book_by_id(book_id):
+    """Bản async của get_book_by_id."""
+    results = await _afetch(_BY_ID, (book_id,))
+    return results[0] if results else None
+
+
+def get_book_info(book_id):
+    """
+    Như get_book_by_id nhưng không lấy Content (chỉ cần tên/thể loại, nội dung đọc theo chương từ BookChunk).
+
+    Returns:
+        tuple | None: (BookID, BookName, CategoryName) hoặc None nếu không có.
+    """
+    results = _fetch(_INFO_BY_ID, (book_id,))
+    return results[0] if results else None
+
+
+async def aget_book_info(book_id):
+    """Bản async của get_book_info."""
+    results = await _afetch(_INFO_BY_ID, (book_id,))
+    return results[0] if results else None
+
+
+def get_book_outline(book_id):
+    """
+    Mục lục sách đã được chia chunk (xem catalog/ingest.py).
+
+    Args:
+        book_id (int): Mã sách.
+
+    Returns:
+        list: Danh sách tuple (ChapterIndex, ChapterTitle, chunk đầu, chunk cuối, tổng token) theo thứ tự chương.
+    """
+    return _fetch(_OUTLINE, (book_id,))
+
+
+async def aget_book_outline(book_id):
+    """Bản async của get_book_outline."""
+    return await _afetch(_OUTLINE, (book_id,))
+
+
+def get_book_chunks(book_id, start, end=None):
+    """
+    Lấy các chunk liên tiếp của một sách.
+
+    Args:
+        book_id (int): Mã sách.
+        start (int): Chunk đầu tiên (tính từ 0).
+        end (int): Chunk cuối cùng, tính cả chunk này. Mặc định bằng start.
+
+    Returns:
+        list: Danh sách tuple (ChunkIndex, ChapterIndex, ChapterTitle, Content, TokenCount).
     """
-    db.cursor.execute(query, ("%" + keyword + "%", "%" + keyword + "%"))
-    results = db.cursor.fetchall()
-    db.close()
-    return results
+    return _fetch(_CHUNKS, (book_id, start, start if end is None else end))
+
+
+async def aget_book_chunks(book_id, start, end=None):
+    """Bản async của get_book_chunks."""
+    return await _afetch(_CHUNKS, (book_id, start, start if end is None else end))
+
+
+def get_book_chapter(book_id, chapter_index):
+    """
+    Lấy toàn bộ chunk của một chương.
+
+    Args:
+        book_id (int): Mã sách.
+        chapter_index (int): Số thứ tự chương (0 là phần mở đầu trước chương đầu tiên).
+
+    Returns:
+        list: Danh sách tuple (ChunkIndex, ChapterIndex, ChapterTitle, Content, TokenCount).
+    """
+    return _fetch(_CHAPTER, (book_id, chapter_index))
+
+
+async def aget_book_chapter(book_id, chapter_index):
+    """Bản async của get_book_chapter."""
+    return await _afetch(_CHAPTER, (book_id, chapter_index))
+
+
+def get_book_summary(book_id, length):
+    """
+    Lấy bản tóm tắt đã tạo sẵn của một sách (xem catalog/summarize.py).
+    Bản tóm tắt chỉ được dùng khi ContentHash còn khớp hash của Book.Content hiện tại (so trong DB),
+    sách đã sửa mà job chưa chạy lại thì coi như chưa có.
+
+    Args:
+        book_id (int): Mã sách.
+        length (str): Độ dài tóm tắt ('short', 'medium' hoặc 'long').
+
+    Returns:
+        str | None: Nội dung tóm tắt hoặc None nếu chưa có / đã cũ.
+    """
+    results = _fetch(_SUMMARY, (book_id, length))
+    return results[0][0] if results else None
+
+
+async def aget_book_summary(book_id, length):
+    """Bản async của get_book_summary."""
+    results = await _afetch(_SUMMARY, (book_id, length))
+    return results[0][0] if results else None
+
+
+def get_summary_by_hash(content_hash, length):
+    """
+    Lấy bản tóm tắt đã tạo sẵn theo hash nội dung sách (sha256 của Book.Content).
+
+    Args:
+        content_hash (str): Hash nội dung.
+        length (str): Độ dài tóm tắt ('short', 'medium' hoặc 'long').
+
+    Returns:
+        str | None: Nội dung tóm tắt hoặc None nếu không có sách nào trùng nội dung.
+    """
+    results = _fetch(_SUMMARY_BY_HASH, (content_hash, length))
+    return results[0][0] if results else None
+
+
+async def aget_summary_by_hash(content_hash, length):
+    """Bản async của get_summary_by_hash."""
+    results = await _afetch(_SUMMARY_BY_HASH, (content_hash, length))
+    return results[0][0] if results else None
+
+
+def get_similar_books(book_id, limit=5):
+    """
+    Lấy các sách tương tự đã tính sẵn (xem catalog/neighbours.py).
+
+    Args:
+        book_id (int): Mã sách.
+        limit (int): Số sách tối đa.
+
+    Returns:
+        list: Danh sách tuple (BookID, BookName, CategoryName, Score) theo độ tương tự giảm dần.
+    """
+    return _fetch(_SIMILAR, (book_id, limit))
+
+
+async def aget_similar_books(book_id, limit=5):
+    """Bản async của get_similar_books."""
+    return await _afetch(_SIMILAR, (book_id, limit))
 
 
 # Khởi tạo 2 tool cho LangGraph
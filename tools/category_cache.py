@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import Levenshtein
+
+from db.database import create_async_database, create_database
+from tools.text_utils import fold_text
+from tracing import record_cache, span
+
+logger = logging.getLogger(__name__)
+
+# Sau TTL sẽ kiểm tra fingerprint của bảng BookCategory, chỉ nạp lại khi bảng thay đổi
+CATEGORY_TTL = 300
+# Ngưỡng độ giống (Levenshtein ratio) khi không khớp trực tiếp
+FUZZY_THRESHOLD = 0.8
+
+# Từ đồng nghĩa / cách gọi tắt (đã bỏ dấu) -> tên chủ đề (đã bỏ dấu)
+TOPIC_SYNONYMS: Dict[str, List[str]] = {
+    "toan": ["toan hoc"],
+    "math": ["toan hoc"],
+    "ly": ["vat ly"],
+    "li": ["vat ly"],
+    "vat li": ["vat ly"],
+    "physics": ["vat ly"],
+    "hoa": ["hoa hoc"],
+    "chemistry": ["hoa hoc"],
+    "sinh": ["sinh hoc"],
+    "biology": ["sinh hoc"],
+    "van": ["ngu van"],
+    "van hoc": ["ngu van"],
+    "su": ["lich su"],
+    "history": ["lich su"],
+    "dia": ["dia ly"],
+    "dia li": ["dia ly"],
+    "tin": ["tin hoc"],
+    "cntt": ["tin hoc", "cong nghe thong tin"],
+    "lap trinh": ["tin hoc"],
+    "it": ["tin hoc", "cong nghe thong tin"],
+    "anh": ["tieng anh"],
+    "english": ["tieng anh"],
+    "kinh doanh": ["kinh te"],
+}
+
+_FINGERPRINT_QUERY = "SELECT COUNT(*), MAX(CategoryID), SUM(LENGTH(CategoryName)) FROM BookCategory"
+_CATEGORIES_QUERY = "SELECT CategoryID, CategoryName FROM BookCategory"
+
+
+class CategoryCache:
+    """
+    Bảng BookCategory (nhỏ, hầu như không đổi) giữ trong bộ nhớ.
+    Chuyển chuỗi chủ đề của người dùng thành danh sách CategoryID để truy vấn Book bằng IN trên cột có index.
+    """
+
+    def __init__(self, ttl: float = CATEGORY_TTL):
+        self.ttl = ttl
+        self._names: Dict[int, str] = {}
+        self._folded: Dict[int, str] = {}
+        self._fingerprint: Optional[Tuple] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """Buộc kiểm tra lại ở lần dùng tiếp theo (gọi sau khi sửa bảng BookCategory)."""
+        with self._lock:
+            self._fingerprint = None
+            self._checked_at = 0.0
+
+    def _fresh(self) -> bool:
+        fresh = self._fingerprint is not None and time.monotonic() - self._checked_at < self.ttl
+        record_cache("category", fresh)
+        return fresh
+
+    def _load(self, fingerprint: Tuple, rows) -> None:
+        self._names = {category_id: name for category_id, name in rows}
+        self._folded = {category_id: fold_text(name) for category_id, name in rows}
+        self._fingerprint = fingerprint
+        logger.info(f"Đã nạp {len(rows)} chủ đề vào category cache")
+
+    def ensure_fresh(self) -> None:
+        with self._lock:
+            if self._fresh():
+                return
+
+            db = create_database()
+            try:
+                db.connect()
+                fingerprint = tuple(db.fetch(_FINGERPRINT_QUERY)[0])
+                if fingerprint != self._fingerprint:
+                    with span("category_cache.load", kind="cache"):
+                        rows = db.fetch(_CATEGORIES_QUERY)
+                    self._load(fingerprint, rows)
+            finally:
+                db.close()
+            self._checked_at = time.monotonic()
+
+    async def aensure_fresh(self) -> None:
+        """
+        Bản async của ensure_fresh (DB async). Không giữ lock qua các lệnh await:
+        hai lượt cùng thấy cache hết hạn thì cùng kiểm tra fingerprint, kết quả như nhau.
+        """
+        if self._fresh():
+            return
+
+        db = create_async_database()
+        try:
+            await db.connect()
+            fingerprint = tuple((await db.fetch(_FINGERPRINT_QUERY))[0])
+            rows = None
+            if fingerprint != self._fingerprint:
+                with span("category_cache.load", kind="cache"):
+                    rows = await db.fetch(_CATEGORIES_QUERY)
+        finally:
+            await db.close()
+        with self._lock:
+            if rows is not None:
+                self._load(fingerprint, rows)
+            self._checked_at = time.monotonic()
+
+    def name(self, category_id: int) -> Optional[str]:
+        return self._names.get(category_id)
+
+    def resolve(self, topic: str) -> List[int]:
+        """
+        Tìm các CategoryID ứng với chủ đề người dùng nhập (không phân biệt dấu, có từ đồng nghĩa, fuzzy).
+
+        :param topic: chủ đề, ví dụ "toán", "Vật Lý", "lap trinh"
+        :return: danh sách CategoryID, rỗng nếu không có chủ đề phù hợp
+        """
+        self.ensure_fresh()
+        return self._match(topic)
+
+    async def aresolve(self, topic: str) -> List[int]:
+        """Bản async của resolve."""
+        await self.aensure_fresh()
+        return self._match(topic)
+
+    def _match(self, topic: str) -> List[int]:
+        folded = fold_text(topic)
+        if not folded:
+            return []
+
+        # Từ viết tắt ngắn ("ly", "su") chỉ dùng theo bảng đồng nghĩa, tránh khớp nhầm "dia ly"
+        terms = set(TOPIC_SYNONYMS.get(folded, [folded]))
+        categories = list(self._folded.items())
+
+        # Giống LIKE %topic% cũ, thêm chiều ngược lại: chủ đề nằm trong câu người dùng ("sach toan hoc lop 10")
+        ids = [
+            category_id for category_id, name in categories
+            if any(term in name or f" {name} " in f" {term} " for term in terms)
+        ]
+        if ids:
+            return ids
+
+        scored = [
+            (max(Levenshtein.ratio(term, name) for term in terms), category_id)
+            for category_id, name in categories
+        ]
+        best = max(scored, default=(0.0, None))
+        return [best[1]] if best[0] >= FUZZY_THRESHOLD else []
+
+
+_category_cache = CategoryCache()
+
+
+def get_category_cache() -> CategoryCache:
+    return _category_cache
@@ -1,42 +1,53 @@
-import os
-
-from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
-from langchain_core.tools import tool
-from langchain_google_genai import ChatGoogleGenerativeAI
-from pydantic import BaseModel, Field
 
-# Load .env file
-load_dotenv()
+from llm import create_chat_model
+from tools.cv_parser import parse_cv
+from tracing import span, record_usage
+
 
-# Get values
-api_key = os.getenv("GEMINI_API_KEY")
+def check_cv(cv: str, jd: str, config: RunnableConfig):
+    if cv is None or jd is None:
+        return ""
 
+    with span("check_cv.llm", kind="llm") as record:
+        response = _check_model().invoke(_messages(cv, jd), config)
+        record_usage(record, response)
 
-class SummaryInput(BaseModel):
-    cv: str = Field(description="")
-    jd: str = Field(description="")
+    return response.content
 
 
-@tool("check_cv", args_schema=SummaryInput,
-      description="Kiểm tra cv", return_direct=True)
-def check_cv(cv: str, jd: str, config: RunnableConfig):
+async def acheck_cv(cv: str, jd: str, config: RunnableConfig):
+    """Bản async của check_cv cho event loop (model.ainvoke)."""
     if cv is None or jd is None:
         return ""
 
-    model = ChatGoogleGenerativeAI(
+    with span("check_cv.llm", kind="llm") as record:
+        response = await _check_model().ainvoke(_messages(cv, jd), config)
+        record_usage(record, response)
+
+    return response.content
+
+
+def _check_model():
+    return create_chat_model(
         model="gemini-2.5-flash",  # Model ngôn ngữ lớn"
         temperature=0.5,  # Mức độ sáng tạo của model, từ 0 tới 1.
         max_tokens=None,  # Giới hạn token của Input, Output. Thường nên để tối đa 32K.
         timeout=None,
         max_retries=3,
-        google_api_key=api_key  # API key đã lấy ở trên
     )
 
-    response = model.invoke([SystemMessage(content=""" Bạn là nhân viên tuyển dụng của một công ty công nghệ.
+
+def _messages(cv: str, jd: str):
+    return [SystemMessage(content=""" Bạn là nhân viên tuyển dụng của một công ty công nghệ.
                             Nhiệm vụ của bạn là từ các chỉ tiêu chính của JD và trọng số cho từng chỉ tiêu, hãy đánh giá CV của ứng viên, đưa ra kết quả và độ phù hợp.
-                       """), HumanMessage(content=f"Nội dung JD: {jd}"), HumanMessage(content=f"Nội dung CV: {cv}")],
-                            config)
+                       """), HumanMessage(content=f"Nội dung JD: {jd}"), HumanMessage(content=f"Nội dung CV: {_cv_content(cv)}")]
+
 
-    return response
+def _cv_content(cv: str) -> str:
+    """Hồ sơ rút gọn (tools/cv_parser.py) nếu tách được mục kinh nghiệm của CV, nếu không thì giữ toàn văn."""
+    profile = parse_cv(cv)
+    if not profile.confident:
+        return cv
+    return profile.compact()
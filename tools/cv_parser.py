@@ -0,0 +1,374 @@
+"""
+Phân tích CV cục bộ (không gọi LLM): tách mục, kỹ năng, số năm kinh nghiệm, học vấn.
+Kết quả cache theo hash nội dung file trong thư mục cache, và được dùng để
+- lọc sớm CV rõ ràng không phù hợp bằng so khớp kỹ năng/số năm với rubric của JD;
+- gửi cho LLM bản tóm lược có cấu trúc thay vì toàn văn CV.
+"""
+import hashlib
+import re
+import unicodedata
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from settings import get_settings
+from tools.text_utils import estimate_tokens, fold_text, strip_accents
+from tracing import record_cache, span
+
+# Đổi khi thay logic phân tích để bỏ cache cũ
+PARSER_VERSION = 4
+# Giới hạn token của phần kinh nghiệm/dự án gửi cho LLM
+MAX_PROFILE_TOKENS = 1500
+# Lọc sớm: CV có ít hơn tỉ lệ này kỹ năng JD yêu cầu (khi JD yêu cầu từ MIN_REQUIRED_SKILLS kỹ năng)
+MIN_SKILL_COVERAGE = 0.2
+MIN_REQUIRED_SKILLS = 3
+# Lọc sớm: số năm kinh nghiệm thấp hơn tỉ lệ này so với yêu cầu
+MIN_EXPERIENCE_RATIO = 0.5
+# Văn bản CV ngắn hơn mức này (PDF scan, trích xuất lỗi) thì không loại sớm theo kỹ năng
+MIN_PARSE_TOKENS = 100
+
+# Tiêu đề mục (đã fold) -> tên mục chuẩn
+SECTION_HEADINGS = {
+    "kinh nghiem": "experience", "kinh nghiem lam viec": "experience", "qua trinh cong tac": "experience",
+    "kinh nghiem nghe nghiep": "experience", "qua trinh lam viec": "experience",
+    "experience": "experience", "work experience": "experience", "employment history": "experience",
+    "professional experience": "experience", "work history": "experience", "relevant experience": "experience",
+    "career history": "experience", "employment": "experience", "experiences": "experience",
+    "working experience": "experience", "professional background": "experience",
+    "hoc van": "education", "trinh do hoc van": "education", "education": "education",
+    "education and training": "education", "academic background": "education", "qua trinh hoc tap": "education",
+    "ky nang": "skills", "skills": "skills", "technical skills": "skills", "ky nang chuyen mon": "skills",
+    "core competencies": "skills", "skills and abilities": "skills",
+    "du an": "projects", "projects": "projects", "personal projects": "projects", "key projects": "projects",
+    "chung chi": "certifications", "certifications": "certifications", "certificates": "certifications",
+    "muc tieu": "summary", "muc tieu nghe nghiep": "summary", "summary": "summary",
+    "objective": "summary", "profile": "summary", "about me": "summary", "gioi thieu": "summary",
+    "professional summary": "summary", "career objective": "summary",
+    "additional information": "other", "thong tin them": "other", "awards": "other", "giai thuong": "other",
+    "hoat dong": "other", "activities": "other", "so thich": "other", "interests": "other",
+}
+
+# Từ vựng kỹ năng (dạng đã fold). Cụm nhiều từ được so khớp theo n-gram.
+SKILLS = {
+    "python", "java", "javascript", "typescript", "c++", "c#", "go", "golang", "rust", "kotlin", "swift",
+    "objective c", "php", "ruby", "scala", "dart", "sql", "nosql", "html", "css", "bash",
+    "react", "react native", "angular", "vue", "next js", "node js", "express", "django", "flask", "fastapi",
+    "spring", "spring boot", ".net", "asp net", "laravel", "flutter", "swiftui", "uikit", "xcode", "android",
+    "ios", "mysql", "postgresql", "mongodb", "redis", "oracle", "sql server", "elasticsearch", "kafka",
+    "rabbitmq", "docker", "kubernetes", "aws", "azure", "gcp", "linux", "git", "ci cd", "jenkins", "terraform",
+    "microservices", "rest", "graphql", "grpc", "machine learning", "deep learning", "nlp", "pytorch",
+    "tensorflow", "pandas", "numpy", "spark", "hadoop", "airflow", "power bi", "tableau", "excel",
+    "figma", "photoshop", "agile", "scrum", "jira", "unit test", "tdd", "oop", "design patterns",
+    "langchain", "llm", "tieng anh", "english", "toeic", "ielts", "tieng nhat", "japanese", "jlpt",
+}
+# Biến thể -> tên chuẩn
+SKILL_ALIASES = {
+    "nodejs": "node js", "node": "node js", "reactjs": "react", "vuejs": "vue", "nextjs": "next js",
+    "postgres": "postgresql", "k8s": "kubernetes", "golang": "go", "cicd": "ci cd", "js": "javascript",
+    "ts": "typescript", "objc": "objective c", "springboot": "spring boot", "dotnet": ".net", "restful": "rest",
+}
+_MAX_SKILL_WORDS = max(len(skill.split()) for skill in SKILLS)
+# Kỹ năng trùng từ thường ("Gò Vấp" -> go, "nghỉ ngơi (rest)", "excel at"): chỉ nhận khi văn bản gốc
+# viết đúng kiểu tên công nghệ (phân biệt hoa thường, có ngữ cảnh)
+AMBIGUOUS_SKILLS = {
+    "go": re.compile(r"\b(?:Go|GO)\b(?!\s+V(?:ấ|a)p)|\b[Gg]olang\b"),
+    "rest": re.compile(r"\bREST(?:ful)?\b|\b[Rr]est(?:ful\b|\s*[Aa][Pp][Ii]s?\b)"),
+    "express": re.compile(r"\bExpress(?:\.?js)?\b|\bexpress\.?js\b"),
+    "spring": re.compile(r"\bSpring\b(?!\s+(?:19|20)\d{2})"),
+    "swift": re.compile(r"\bSwift(?:UI)?\b"),
+    "ruby": re.compile(r"\bRuby\b"),
+    "rust": re.compile(r"\bRust\b"),
+    "dart": re.compile(r"\bDart\b"),
+    "oracle": re.compile(r"\bOracle\b"),
+    "excel": re.compile(r"\b(?:Excel|EXCEL)\b"),
+}
+
+DEGREE_KEYWORDS = ("dai hoc", "cu nhan", "ky su", "thac si", "tien si", "cao dang", "bachelor", "master",
+                   "phd", "university", "college", "engineer degree")
+
+# "3 năm", "5+ years"; "nam" không dấu chỉ khi đi kèm "kinh nghiệm" (không nhầm số nhà "20 Nam Kỳ Khởi Nghĩa")
+_YEARS_PATTERN = re.compile(
+    r"(?<![\w.,])(?<!tháng )(\d+(?:[.,]\d+)?)\s*\+?\s*(?:năm|nam(?=\s+(?:kinh nghiem|kn)\b)|years?|yrs?)\b"
+)
+# Tháng dạng tên (Jan, January, Sept, ...) -> số tháng
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+_MONTH = r"(?:(\d{1,2})\s*[/.-]\s*|thang\s*(\d{1,2})\s*,?\s*(?:nam\s*)?|\b(%s)[a-z]*\.?\s*,?\s*)?" % "|".join(
+    sorted(MONTHS, key=len, reverse=True))
+_RANGE_PATTERN = re.compile(
+    _MONTH + r"((?:19|20)\d{2})\s*(?:-|–|—|to|den|until)\s*"
+    r"(?:" + _MONTH + r"((?:19|20)\d{2})|(nay|hien tai|present|now|current|today))"
+)
+_EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+_PHONE_PATTERN = re.compile(r"(?:\+?84|0)(?:[\s.-]?\d){9,10}")
+
+
+class CVProfile(BaseModel):
+    name: str = ""
+    email: str = ""
+    phone: str = ""
+    skills: List[str] = Field(default_factory=list)
+    # Các khoảng thời gian (năm bắt đầu, năm kết thúc hoặc None = "đến nay") trong mục kinh nghiệm,
+    # hoặc cả CV nếu không có mục kinh nghiệm. Cache chỉ lưu khoảng, số năm tính khi đọc (khoảng "đến nay" tăng dần)
+    date_ranges: List[Tuple[float, Optional[float]]] = Field(default_factory=list)
+    # Số năm lớn nhất dạng "N năm"/"N years", dùng khi không có khoảng thời gian
+    mentioned_years: float = 0.0
+    education: List[str] = Field(default_factory=list)
+    sections: Dict[str, str] = Field(default_factory=dict)
+    source_tokens: int = 0
+
+    @property
+    def years_experience(self) -> float:
+        """Số năm kinh nghiệm tính tới tháng hiện tại."""
+        return total_years(self.date_ranges) if self.date_ranges else self.mentioned_years
+
+    @property
+    def years_from_ranges(self) -> bool:
+        """Số năm tính từ các khoảng thời gian trong mục kinh nghiệm (không phải ước lượng từ "N năm" hay cả CV)."""
+        return bool(self.date_ranges) and "experience" in self.sections
+
+    @property
+    def confident(self) -> bool:
+        """
+        Tách được mục kinh nghiệm: bản tóm lược dùng được thay cho toàn văn.
+        Không tách được (tiêu đề lạ, PDF trích xuất lỗi) thì gửi toàn văn CV và không loại sớm.
+        """
+        return "experience" in self.sections and self.source_tokens >= MIN_PARSE_TOKENS
+
+    def compact(self, max_tokens: int = MAX_PROFILE_TOKENS) -> str:
+        """Bản tóm lược gửi cho LLM: thông tin có cấu trúc + các mục của CV (cắt theo max_tokens)."""
+        lines = [
+            f"Ứng viên: {self.name or 'không rõ'}",
+            f"Số năm kinh nghiệm (ước lượng): {self.years_experience:g}",
+            f"Kỹ năng: {', '.join(self.skills) or 'không rõ'}",
+            f"Học vấn: {'; '.join(self.education) or 'không rõ'}",
+        ]
+        budget = max_tokens * 4
+        preferred = ["summary", "skills", "experience", "projects", "certifications"]
+        # Mục khác (thông tin thêm, giải thưởng, ...) gửi sau, học vấn đã tóm ở trên
+        others = [name for name in self.sections if name not in preferred and name != "education"]
+        for section in preferred + others:
+            text = self.sections.get(section)
+            if text and budget > 0:
+                lines.append(f"[{section}]\n{text[:budget]}")
+                budget -= len(text)
+        return "\n".join(lines)
+
+
+class RubricMatch(BaseModel):
+    required_skills: List[str]
+    matched_skills: List[str]
+    required_years: float
+    coverage: float
+    score: float
+    rejected: bool
+    reason: str = ""
+
+
+def extract_skills(text: str) -> List[str]:
+    """
+    Kỹ năng trong từ vựng SKILLS xuất hiện trong văn bản (so khớp n-gram trên chuỗi đã fold).
+    Kỹ năng trùng từ thường (AMBIGUOUS_SKILLS) còn phải khớp mẫu phân biệt hoa thường trên văn bản gốc.
+    """
+    words = _skill_tokens(text)
+    found = set()
+    for size in range(1, _MAX_SKILL_WORDS + 1):
+        for i in range(len(words) - size + 1):
+            gram = " ".join(words[i:i + size])
+            gram = SKILL_ALIASES.get(gram, gram)
+            if gram in SKILLS:
+                found.add(gram)
+    raw = unicodedata.normalize("NFC", text or "")
+    return sorted(skill for skill in found if skill not in AMBIGUOUS_SKILLS or AMBIGUOUS_SKILLS[skill].search(raw))
+
+
+def _skill_tokens(text: str) -> List[str]:
+    # fold_text bỏ ký tự đặc biệt nên giữ lại riêng các kỹ năng như c++, c#, .net
+    lowered = (text or "").lower()
+    specials = [token for token in ("c++", "c#", ".net") if token in lowered]
+    return fold_text(lowered.replace("c++", " ").replace("c#", " ").replace(".net", " ")).split() + specials
+
+
+def extract_years(text: str) -> float:
+    """
+    Số năm kinh nghiệm: tổng các khoảng thời gian (đã gộp chồng lấn) trong mục kinh nghiệm,
+    hoặc số lớn nhất dạng "N năm"/"N years" nếu không có khoảng thời gian.
+    """
+    ranges = date_ranges(text)
+    return total_years(ranges) if ranges else max(_mentioned_years(text), default=0.0)
+
+
+def date_ranges(text: str) -> List[Tuple[float, Optional[float]]]:
+    """Các khoảng thời gian "03/2019 - 2021", "Jan 2020 - nay" dạng (năm bắt đầu, năm kết thúc hoặc None = đến nay)."""
+    ranges: List[Tuple[float, Optional[float]]] = []
+    for match in _RANGE_PATTERN.finditer(strip_accents(text)):
+        (start_num, start_day_month, start_name, start_year,
+         end_num, end_day_month, end_name, end_year, ongoing) = match.groups()
+        start = int(start_year) + ((_month(start_num or start_day_month, start_name) or 1) - 1) / 12
+        if ongoing:
+            ranges.append((start, None))
+        else:
+            end = int(end_year) + ((_month(end_num or end_day_month, end_name) or 12) - 1) / 12
+            if start <= end:
+                ranges.append((start, end))
+    return ranges
+
+
+def total_years(ranges: List[Tuple[float, Optional[float]]], today: Optional[date] = None) -> float:
+    """Tổng số năm của các khoảng (gộp chồng lấn), khoảng "đến nay" tính tới tháng hiện tại."""
+    today = today or date.today()
+    now = today.year + (today.month - 1) / 12
+    intervals = [(start, now if end is None else end) for start, end in ranges]
+    intervals = sorted((start, end) for start, end in intervals if start <= end <= today.year + 1)
+    if not intervals:
+        return 0.0
+    total, current_start, current_end = 0.0, None, None
+    for start, end in intervals:
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    total += current_end - current_start
+    return round(total, 1)
+
+
+def _month(number, name) -> int:
+    """Số tháng 1-12 từ "03"/"3" hoặc "mar"/"march", 0 nếu không có hoặc không hợp lệ."""
+    if name:
+        return MONTHS[name]
+    if number and 1 <= int(number) <= 12:
+        return int(number)
+    return 0
+
+
+def _mentioned_years(text: str) -> List[float]:
+    """Các số năm dạng "3 năm", "2.5 years", "5+ yrs", "3 nam kinh nghiem"."""
+    lowered = unicodedata.normalize("NFC", (text or "").lower())
+    lowered = lowered.replace("kinh nghiệm", "kinh nghiem")
+    years = [float(value.replace(",", ".")) for value in _YEARS_PATTERN.findall(lowered)]
+    return [value for value in years if value <= 45]
+
+
+def split_sections(text: str) -> Dict[str, str]:
+    """Tách CV theo dòng tiêu đề mục (SECTION_HEADINGS). Phần trước tiêu đề đầu tiên là "header"."""
+    sections: Dict[str, List[str]] = {"header": []}
+    current = "header"
+    for line in (text or "").splitlines():
+        heading = fold_text(line).rstrip(" :")
+        if heading in SECTION_HEADINGS and len(line) < 60:
+            current = SECTION_HEADINGS[heading]
+            sections.setdefault(current, [])
+            continue
+        sections[current].append(line)
+    return {name: "\n".join(lines).strip() for name, lines in sections.items() if "".join(lines).strip()}
+
+
+def parse_cv_text(text: str) -> CVProfile:
+    """Phân tích văn bản CV (deterministic, không gọi LLM)."""
+    sections = split_sections(text)
+    header_lines = [line.strip() for line in sections.get("header", "").splitlines() if line.strip()]
+    education_text = sections.get("education") or text
+    education = [
+        line.strip() for line in education_text.splitlines()
+        if any(keyword in fold_text(line) for keyword in DEGREE_KEYWORDS)
+    ][:5]
+    email = _EMAIL_PATTERN.search(text or "")
+    phone = _PHONE_PATTERN.search(text or "")
+    experience_text = sections.get("experience") or text
+    return CVProfile(
+        name=header_lines[0][:80] if header_lines else "",
+        email=email.group(0) if email else "",
+        phone=phone.group(0) if phone else "",
+        skills=extract_skills(text),
+        date_ranges=date_ranges(experience_text),
+        mentioned_years=max(_mentioned_years(experience_text), default=0.0),
+        education=education,
+        sections={name: body for name, body in sections.items() if name != "header"},
+        source_tokens=estimate_tokens(text),
+    )
+
+
+def _profile_path(digest: str) -> Path:
+    return Path(get_settings().cache_dir) / "cv_profiles" / f"v{PARSER_VERSION}-{digest}.json"
+
+
+def _cached_profile(digest: str, load_text) -> CVProfile:
+    path = _profile_path(digest)
+    if path.exists():
+        record_cache("cv_profile", True)
+        return CVProfile.model_validate_json(path.read_text(encoding="utf-8"))
+    record_cache("cv_profile", False)
+    with span("cv_parser.parse", kind="extract"):
+        profile = parse_cv_text(load_text())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(profile.model_dump_json(), encoding="utf-8")
+    return profile
+
+
+def parse_cv_file(file_path: str, read_text) -> CVProfile:
+    """
+    Phân tích CV từ file, cache theo sha256 nội dung file (file trùng nội dung không phải đọc PDF lại).
+
+    :param read_text: hàm đọc văn bản của file (vd. convert_pdf_to_text), chỉ gọi khi cache chưa có
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return _cached_profile(digest.hexdigest(), lambda: read_text(file_path))
+
+
+def parse_cv(text: str) -> CVProfile:
+    """Phân tích CV đã ở dạng văn bản, cache theo sha256 của văn bản."""
+    return _cached_profile(hashlib.sha256((text or "").encode("utf-8")).hexdigest(), lambda: text)
+
+
+def match_rubric(profile: CVProfile, requirements: List[Tuple[str, float]]) -> RubricMatch:
+    """
+    So khớp kỹ năng/số năm của CV với các yêu cầu của rubric (không gọi LLM).
+
+    :param requirements: [(nội dung yêu cầu, trọng số)] của từng tiêu chí
+    :return: điểm thang 100 theo trọng số, và có loại sớm hay không
+    """
+    have = set(profile.skills)
+    score, required, matched, required_years = 0.0, set(), set(), 0.0
+    total_weight = sum(weight for _, weight in requirements) or 1
+    for text, weight in requirements:
+        skills = set(extract_skills(text))
+        years = _mentioned_years(text)
+        required |= skills
+        matched |= skills & have
+        if years:
+            required_years = max(required_years, max(years))
+        if skills:
+            part = len(skills & have) / len(skills)
+        elif years:
+            part = min(profile.years_experience / max(years), 1.0)
+        else:
+            part = 0.5  # tiêu chí không so khớp được bằng từ khóa
+        score += weight * part
+
+    coverage = len(matched) / len(required) if required else 1.0
+    reasons = []
+    # Chỉ loại sớm khi phân tích đáng tin: tách được mục kinh nghiệm, số năm tính từ các khoảng thời gian trong đó
+    if profile.confident and len(required) >= MIN_REQUIRED_SKILLS and coverage < MIN_SKILL_COVERAGE:
+        reasons.append(f"chỉ có {len(matched)}/{len(required)} kỹ năng yêu cầu")
+    if (profile.confident and profile.years_from_ranges and required_years
+            and profile.years_experience < required_years * MIN_EXPERIENCE_RATIO):
+        reasons.append(f"{profile.years_experience:g}/{required_years:g} năm kinh nghiệm")
+    return RubricMatch(
+        required_skills=sorted(required),
+        matched_skills=sorted(matched),
+        required_years=required_years,
+        coverage=round(coverage, 2),
+        score=round(score / total_weight * 100, 1),
+        rejected=bool(reasons),
+        reason="; ".join(reasons),
+    )
+
@@ -0,0 +1,328 @@
+"""
+Sàng lọc hàng loạt CV theo một JD.
+
+JD chỉ được phân tích một lần thành rubric (tiêu chí + trọng số), rubric được cache theo hash của JD
+(trong bộ nhớ và trong thư mục cache). Mỗi CV được phân tích cục bộ (tools/cv_parser.py, cache theo hash file),
+CV không đạt so khớp kỹ năng/số năm bị loại sớm không tốn lượt gọi model; CV còn lại chỉ cần một lần gọi
+model nhỏ với hồ sơ rút gọn và rubric, model chấm điểm từng tiêu chí, điểm tổng tính bằng Python.
+
+Ví dụ:
+    python -m tools.cv_screening --jd jd.txt --dir uploads --concurrency 8
+    python -m tools.cv_screening --jd jd.txt --no-prefilter
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from langchain_core.runnables import RunnableConfig
+from pydantic import BaseModel, Field
+
+import cancellation
+from llm import create_chat_model
+from settings import get_settings
+from tools.cv_parser import CVProfile, RubricMatch, match_rubric, parse_cv_file
+from tools.text_utils import estimate_tokens
+from tracing import payload_size, record_cache, span
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FOLDER = "uploads"
+# Model phân tích JD (một lần) và model chấm từng CV (nhiều lần, rẻ hơn)
+RUBRIC_MODEL = "gemini-2.5-flash"
+SCORING_MODEL = "gemini-2.5-flash-lite"
+# Số CV chấm song song
+CONCURRENCY = 4
+# Cắt CV quá dài trước khi chấm
+MAX_CV_TOKENS = 6000
+CV_EXTENSIONS = (".pdf", ".txt")
+
+
+class Criterion(BaseModel):
+    name: str = Field(description="Tên tiêu chí ngắn gọn, ví dụ 'Kinh nghiệm iOS'")
+    weight: float = Field(description="Trọng số của tiêu chí, tổng các trọng số bằng 1")
+    requirement: str = Field(description="Yêu cầu cụ thể của JD cho tiêu chí này, một câu")
+
+
+class Rubric(BaseModel):
+    position: str = Field(description="Tên vị trí tuyển dụng")
+    criteria: List[Criterion] = Field(description="Các tiêu chí đánh giá chính của JD (4-8 tiêu chí)")
+
+
+class CriterionScore(BaseModel):
+    name: str = Field(description="Tên tiêu chí, giữ nguyên như trong rubric")
+    score: int = Field(description="Điểm từ 0 đến 10")
+    evidence: str = Field(description="Bằng chứng trong CV, tối đa 15 từ")
+
+
+class CVAssessment(BaseModel):
+    candidate: str = Field(description="Tên ứng viên")
+    scores: List[CriterionScore] = Field(description="Điểm cho từng tiêu chí của rubric")
+    verdict: str = Field(description="Nhận xét chung, tối đa 25 từ")
+
+
+class ScreeningResult(NamedTuple):
+    file_name: str
+    candidate: str
+    total: float
+    scores: Dict[str, int]
+    verdict: str
+    prefiltered: bool = False
+    error: Optional[str] = None
+
+
+_rubrics: Dict[str, Rubric] = {}
+# Khóa theo JD: cùng JD chỉ gọi model một lần, JD khác nhau phân tích song song
+_rubric_locks: Dict[str, threading.Lock] = {}
+_rubrics_lock = threading.Lock()
+
+
+def _rubric_path(digest: str) -> Path:
+    return Path(get_settings().cache_dir) / "rubrics" / f"{digest}.json"
+
+
+def get_rubric(jd: str, config: Optional[RunnableConfig] = None) -> Rubric:
+    """
+    Rubric (tiêu chí + trọng số) của JD. Chỉ gọi model khi JD chưa có trong cache.
+    Trọng số được chuẩn hóa để tổng bằng 1.
+    """
+    digest = hashlib.sha256(" ".join(jd.split()).encode("utf-8")).hexdigest()
+    with _rubrics_lock:
+        lock = _rubric_locks.setdefault(digest, threading.Lock())
+    with lock:
+        rubric = _rubrics.get(digest)
+        if rubric is None and _rubric_path(digest).exists():
+            rubric = _rubrics[digest] = Rubric.model_validate_json(_rubric_path(digest).read_text(encoding="utf-8"))
+        record_cache("cv_rubric", rubric is not None)
+        if rubric is not None:
+            return rubric
+
+        model = create_chat_model(model=RUBRIC_MODEL, temperature=0, max_retries=3).with_structured_output(Rubric)
+        prompt = ("Bạn là nhân viên tuyển dụng của một công ty công nghệ. "
+                  "Hãy rút ra các chỉ tiêu chính của JD sau và trọng số cho từng chỉ tiêu.\n\n"
+                  f"Nội dung JD: {jd}")
+        with span("cv_screening.rubric.llm", kind="llm", input_bytes=payload_size(prompt)):
+            rubric = model.invoke(prompt, config)
+
+        total = sum(max(c.weight, 0) for c in rubric.criteria) or 1
+        for criterion in rubric.criteria:
+            criterion.weight = max(criterion.weight, 0) / total
+
+        path = _rubric_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(rubric.model_dump_json(indent=2), encoding="utf-8")
+        _rubrics[digest] = rubric
+        return rubric
+
+
+def _rubric_prompt(rubric: Rubric) -> str:
+    lines = [f"- {c.name} (trọng số {c.weight:.2f}): {c.requirement}" for c in rubric.criteria]
+    return f"Vị trí: {rubric.position}\nTiêu chí:\n" + "\n".join(lines)
+
+
+def _scoring_model():
+    return create_chat_model(
+        model=SCORING_MODEL, temperature=0, max_tokens=1024, max_retries=3, priority="batch"
+    ).with_structured_output(CVAssessment)
+
+
+def rubric_requirements(rubric: Rubric):
+    return [(f"{c.name}: {c.requirement}", c.weight) for c in rubric.criteria]
+
+
+def score_cv(cv_text: str, rubric: Rubric, config: Optional[RunnableConfig] = None, model=None) -> CVAssessment:
+    """Chấm một CV (toàn văn hoặc hồ sơ rút gọn) theo rubric có sẵn (một lần gọi model, không gửi lại JD)."""
+    model = model or _scoring_model()
+    if estimate_tokens(cv_text) > MAX_CV_TOKENS:
+        cv_text = cv_text[:MAX_CV_TOKENS * 4]
+    prompt = ("Chấm CV theo rubric, mỗi tiêu chí 0-10, chỉ dựa trên nội dung CV.\n\n"
+              f"{_rubric_prompt(rubric)}\n\nNội dung CV:\n{cv_text}")
+    with span("cv_screening.score.llm", kind="llm", input_bytes=payload_size(prompt)):
+        assessment = model.invoke(prompt, config)
+    # with_structured_output trả None khi model không gọi tool (không có kết quả chấm)
+    if assessment is None:
+        raise ValueError("Model không trả về kết quả chấm CV")
+    return assessment
+
+
+def criterion_scores(assessment: CVAssessment, rubric: Rubric) -> Dict[str, int]:
+    """
+    Điểm (0-10) theo tên tiêu chí của rubric. Ghép theo tên; nếu model đổi tên tiêu chí
+    nhưng trả đủ số tiêu chí thì ghép theo thứ tự.
+    """
+    by_name = {s.name.strip().lower(): min(max(s.score, 0), 10) for s in assessment.scores}
+    names = [c.name for c in rubric.criteria]
+    if not any(name.strip().lower() in by_name for name in names) and len(assessment.scores) == len(names):
+        return {name: min(max(s.score, 0), 10) for name, s in zip(names, assessment.scores)}
+    return {name: by_name[name.strip().lower()] for name in names if name.strip().lower() in by_name}
+
+
+def weighted_total(scores: Dict[str, int], rubric: Rubric) -> float:
+    """Điểm tổng thang 100, tiêu chí model bỏ sót tính 0 điểm."""
+    return round(sum(c.weight * scores.get(c.name, 0) * 10 for c in rubric.criteria), 1)
+
+
+def read_cv(file_path: str) -> str:
+    if file_path.lower().endswith(".pdf"):
+        from tools.extract_file import convert_pdf_to_text
+
+        return convert_pdf_to_text(file_path)
+    with open(file_path, encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def list_cv_files(folder: str = UPLOAD_FOLDER, file_names: Optional[List[str]] = None) -> List[str]:
+    if file_names:
+        return [os.path.join(folder, name) for name in file_names]
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(CV_EXTENSIONS)
+    )
+
+
+def _profile_prompt(profile: CVProfile, match: RubricMatch) -> str:
+    return (f"{profile.compact()}\n"
+            f"Kỹ năng khớp JD: {', '.join(match.matched_skills) or 'không có'} "
+            f"({len(match.matched_skills)}/{len(match.required_skills)})")
+
+
+def screen_cvs(jd: str, files: List[str], concurrency: int = CONCURRENCY,
+               config: Optional[RunnableConfig] = None, prefilter: bool = True):
+    """
+    Chấm nhiều CV theo cùng một JD, tối đa concurrency CV cùng lúc.
+
+    :param prefilter: loại sớm CV không đạt so khớp kỹ năng/số năm, không gọi model cho các CV này
+    :return: (rubric, danh sách ScreeningResult xếp theo điểm giảm dần, CV bị loại sớm xếp sau)
+    """
+    rubric = get_rubric(jd, config)
+    requirements = rubric_requirements(rubric)
+    model = _scoring_model()
+    # Thread của pool không mang theo config của lượt chat: truyền token hủy vào từng job
+    token = cancellation.current_token()
+
+    def screen(file_path: str) -> ScreeningResult:
+        with cancellation.use(token):
+            cancellation.check("cv")
+            return screen_one(file_path)
+
+    def screen_one(file_path: str) -> ScreeningResult:
+        file_name = os.path.basename(file_path)
+        try:
+            profile = parse_cv_file(file_path, read_cv)
+            match = match_rubric(profile, requirements)
+            if prefilter and match.rejected:
+                return ScreeningResult(file_name, profile.name, match.score, {},
+                                       f"Loại sớm: {match.reason}", prefiltered=True)
+            # Không tách được mục kinh nghiệm: chấm trên toàn văn để không mất phần kinh nghiệm
+            cv_text = _profile_prompt(profile, match) if profile.confident else read_cv(file_path)
+            assessment = score_cv(cv_text, rubric, config, model)
+            scores = criterion_scores(assessment, rubric)
+            return ScreeningResult(file_name, assessment.candidate, weighted_total(scores, rubric), scores,
+                                   assessment.verdict)
+        except Exception as e:
+            logger.error(f"Lỗi khi chấm CV {file_name}: {e}")
+            return ScreeningResult(file_name, "", 0.0, {}, "", error=str(e))
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="cv") as executor:
+        if token is not None:
+            # Lượt chat bị hủy: bỏ các CV chưa bắt đầu chấm, CV đang chấm dừng ở lượt gọi model
+            token.on_cancel(lambda: executor.shutdown(wait=False, cancel_futures=True))
+        try:
+            results = list(executor.map(screen, files))
+        except Exception:
+            cancellation.check("cv", token)
+            raise
+    results.sort(key=lambda r: (r.error is None, not r.prefiltered, r.total), reverse=True)
+    return rubric, results
+
+
+def ranks(results: List[ScreeningResult]) -> List[str]:
+    """Hạng của từng dòng: chỉ CV được model chấm mới có hạng, CV bị loại sớm hoặc lỗi là '-' (bảng và CSV như nhau)."""
+    labels, rank = [], 0
+    for r in results:
+        if r.error or r.prefiltered:
+            labels.append("-")
+        else:
+            rank += 1
+            labels.append(str(rank))
+    return labels
+
+
+def format_ranking(rubric: Rubric, results: List[ScreeningResult]) -> str:
+    """Bảng xếp hạng dạng markdown."""
+    names = [c.name for c in rubric.criteria]
+    header = "| # | File | Ứng viên | Điểm | " + " | ".join(names) + " | Nhận xét |"
+    lines = [f"**{rubric.position}** - {len(results)} CV", "", header, "|" + "---|" * (len(names) + 5)]
+    for rank, r in zip(ranks(results), results):
+        if r.error:
+            lines.append(f"| {rank} | {r.file_name} | | lỗi | " + " | ".join("" for _ in names) + f" | {r.error} |")
+            continue
+        cells = " | ".join(str(r.scores.get(name, "-")) for name in names)
+        lines.append(f"| {rank} | {r.file_name} | {r.candidate} | {r.total} | {cells} | {r.verdict} |")
+    return "\n".join(lines)
+
+
+def save_ranking_csv(rubric: Rubric, results: List[ScreeningResult]) -> str:
+    output_dir = Path("output")
+    output_dir.mkdir(exist_ok=True)
+    path = output_dir / f"sang_loc_cv_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    names = [c.name for c in rubric.criteria]
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Hạng", "File", "Ứng viên", "Điểm"] + names + ["Nhận xét", "Lỗi"])
+        for rank, r in zip(ranks(results), results):
+            writer.writerow([rank, r.file_name, r.candidate, r.total]
+                            + [r.scores.get(name, "") for name in names] + [r.verdict, r.error or ""])
+    return str(path)
+
+
+def screen_cvs_tool(jd: str, config: RunnableConfig, file_names: Optional[List[str]] = None) -> str:
+    try:
+        files = list_cv_files(UPLOAD_FOLDER, file_names)
+        if not files:
+            return "Không có CV nào trong thư mục uploads"
+        rubric, results = screen_cvs(jd, files, CONCURRENCY, config)
+        csv_path = save_ranking_csv(rubric, results)
+        return format_ranking(rubric, results) + f"\n\nFile kết quả: {csv_path}"
+    except Exception as e:
+        return f"Lỗi khi sàng lọc CV: {str(e)}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Sàng lọc hàng loạt CV theo một JD")
+    parser.add_argument("--jd", required=True, help="file văn bản chứa JD")
+    parser.add_argument("--dir", default=UPLOAD_FOLDER, help="thư mục chứa CV (.pdf, .txt)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--no-prefilter", action="store_true", help="chấm bằng model cả CV không đạt so khớp từ khóa")
+    parser.add_argument("--fake-llm", action="store_true", help="dùng model giả (benchmarks.fake_llm)")
+    parser.add_argument("--json", action="store_true", help="in kết quả dạng JSON")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.fake_llm:
+        from benchmarks.fake_llm import fake_chat_model_factory
+        from llm import set_chat_model_factory
+
+        set_chat_model_factory(fake_chat_model_factory(latency_median_ms=300))
+
+    with open(args.jd, encoding="utf-8") as f:
+        jd = f.read()
+    rubric, results = screen_cvs(jd, list_cv_files(args.dir), args.concurrency, prefilter=not args.no_prefilter)
+    if args.json:
+        print(json.dumps([r._asdict() for r in results], ensure_ascii=False, indent=2))
+    else:
+        print(format_ranking(rubric, results))
+        print(f"\nFile kết quả: {save_ranking_csv(rubric, results)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
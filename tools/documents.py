@@ -0,0 +1,404 @@
+"""
+Kho tài liệu upload: trích xuất text chạy nền ngay khi file được lưu,
+kết quả lưu trên đĩa theo sha256 nội dung file (upload lại cùng file không phải trích xuất lại).
+extract_file chỉ chờ job đang chạy (hoặc đọc kết quả có sẵn) thay vì bắt đầu trích xuất sau lượt gọi model đầu tiên.
+
+Tài liệu được lưu theo từng trang kèm mục lục (bookmark của PDF, hoặc dòng tiêu đề chương/bài dò trong text),
+extract_file chỉ trả về handle ("doc_<12 ký tự đầu sha256>") + mục lục, read_document đọc từng khoảng trang.
+Trên đĩa mỗi tài liệu gồm file text (các trang nối liền, ghi dần trong lúc trích xuất) và file chỉ mục JSON
+(offset byte, số token từng trang, mục lục): bộ nhớ không phụ thuộc kích thước file, read_document seek tới
+đúng các trang cần đọc.
+
+Việc parse/OCR chạy trong process worker (workers.py), thread của kho chỉ chờ và đọc lại file kết quả.
+Job mang token hủy của lượt chat tạo ra nó: lượt bị hủy thì job chưa chạy bị bỏ, job đang chạy dừng ở trang kế tiếp
+và không được giữ lại (lượt sau cần file này sẽ trích xuất lại).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ThreadPoolExecutor, wait
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cancellation
+from cancellation import CancelToken, TurnCancelled
+from catalog.chunking import HEADING_PATTERN
+from settings import get_settings
+from tools.images import IMAGE_EXTENSIONS
+from tools.text_utils import estimate_tokens
+from tracing import record_cache, span
+from workers import run_in_worker
+
+logger = logging.getLogger(__name__)
+
+# Số file trích xuất song song
+EXTRACT_WORKERS = 2
+# Số job gần nhất giữ trong bộ nhớ (kết quả cũ hơn đọc lại từ đĩa)
+MAX_JOBS = 64
+# Số chỉ mục tài liệu (offset, số token từng trang, mục lục; không chứa text) giữ trong bộ nhớ cho read_document
+MAX_OPEN_DOCUMENTS = 8
+# Phiên bản định dạng file lưu trên đĩa (đổi khi thêm trường, file cũ bị bỏ qua và trích xuất lại)
+FORMAT_VERSION = 4
+HANDLE_PREFIX = "doc_"
+
+
+class Heading(NamedTuple):
+    page: int  # trang bắt đầu, tính từ 1
+    level: int
+    title: str
+
+
+class Document(NamedTuple):
+    """Chỉ mục của tài liệu trong kho; text từng trang đọc từ text_path khi cần."""
+    digest: str
+    file_name: str
+    text_path: Path
+    # offsets[i]..offsets[i + 1]: byte của trang i + 1 trong text_path
+    offsets: List[int]
+    tokens: List[int]
+    headings: List[Heading]
+    has_text: bool
+
+    @property
+    def handle(self) -> str:
+        return HANDLE_PREFIX + self.digest[:12]
+
+    @property
+    def page_count(self) -> int:
+        return len(self.tokens)
+
+    @property
+    def text(self) -> str:
+        """Toàn bộ text (mỗi trang có text kết thúc bằng xuống dòng): chỉ dùng cho tài liệu cần đọc hết."""
+        return "".join(page + "\n" for page in self.read_pages(1, self.page_count) if page)
+
+    def page_tokens(self) -> List[int]:
+        return self.tokens
+
+    def page(self, number: int, max_chars: Optional[int] = None) -> str:
+        """Text của trang number (từ 1); max_chars: chỉ đọc phần đầu trang (trang quá dài)."""
+        start, end = self.offsets[number - 1], self.offsets[number]
+        if max_chars is not None:
+            # Mỗi ký tự UTF-8 tối đa 4 byte; ký tự bị cắt giữa chừng ở cuối được bỏ qua
+            end = min(end, start + max_chars * 4)
+        with open(self.text_path, "rb") as f:
+            f.seek(start)
+            text = f.read(end - start).decode("utf-8", errors="ignore")
+        return text if max_chars is None else text[:max_chars]
+
+    def read_pages(self, first: int, last: int) -> List[str]:
+        """Text các trang first..last (từ 1, tính cả hai đầu) trong một lần đọc."""
+        if first > last:
+            return []
+        with open(self.text_path, "rb") as f:
+            f.seek(self.offsets[first - 1])
+            data = f.read(self.offsets[last] - self.offsets[first - 1])
+        base = self.offsets[first - 1]
+        return [data[self.offsets[i] - base:self.offsets[i + 1] - base].decode("utf-8")
+                for i in range(first - 1, last)]
+
+    def section_pages(self, index: int) -> Tuple[int, int]:
+        """Khoảng trang (từ 1, tính cả hai đầu) của mục thứ index (từ 1) trong mục lục."""
+        heading = self.headings[index - 1]
+        end = self.page_count
+        for following in self.headings[index:]:
+            if following.level <= heading.level:
+                end = max(heading.page, following.page - 1)
+                break
+        return heading.page, end
+
+
+class PageWriter:
+    """Ghi từng trang vào file text của kho ngay khi trích xuất xong, chỉ giữ offset/số token và mục lục dò được."""
+
+    def __init__(self, file):
+        self._file = file
+        self.offsets = [0]
+        self.tokens: List[int] = []
+        self.has_text = False
+        self.detected_headings: List[Heading] = []
+
+    def add(self, page: str) -> None:
+        data = page.encode("utf-8")
+        self._file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        self.tokens.append(estimate_tokens(page))
+        self.has_text = self.has_text or bool(page.strip())
+        self.detected_headings.extend(page_headings(len(self.tokens), page))
+
+
+def _extract_pdf(file_path: str, add_page: Callable[[str], None]) -> List[Heading]:
+    from tools.extract_file import extract_pdf_pages
+
+    return [Heading(*bookmark) for bookmark in extract_pdf_pages(file_path, add_page)]
+
+
+def _extract_docx(file_path: str, add_page: Callable[[str], None]) -> List[Heading]:
+    from tools.text_extractors import read_docx_document
+
+    return [Heading(*heading) for heading in read_docx_document(file_path, add_page)]
+
+
+def _extract_txt(file_path: str, add_page: Callable[[str], None]) -> List[Heading]:
+    from tools.text_extractors import read_txt_document
+
+    return read_txt_document(file_path, add_page)
+
+
+def _extract_image(file_path: str, add_page: Callable[[str], None]) -> List[Heading]:
+    from tools.images import extract_image
+
+    pages, headings = extract_image(file_path)
+    for page in pages:
+        add_page(page)
+    return headings
+
+
+# Đuôi file -> hàm trích xuất: gửi text từng trang cho add_page, trả về mục lục có sẵn trong file.
+# Ném lỗi nếu file hỏng, lỗi không được lưu vào kho
+EXTRACTORS: Dict[str, Callable[[str, Callable[[str], None]], List[Heading]]] = {
+    ".pdf": _extract_pdf,
+    ".docx": _extract_docx,
+    ".txt": _extract_txt,
+    **{ext: _extract_image for ext in IMAGE_EXTENSIONS},
+}
+
+
+def page_headings(page_number: int, page: str) -> List[Heading]:
+    """Mục lục dò từ text khi file không có sẵn: các dòng "Chương 3", "Bài 12 - ...", "Chapter 2" của một trang."""
+    return [Heading(page_number, 1, " ".join(line.split())) for line in page.splitlines()
+            if len(line) <= 150 and HEADING_PATTERN.match(line)]
+
+
+def file_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentStore:
+    """Job trích xuất theo đường dẫn file (kèm mtime/size để nhận ra file bị ghi đè) và kết quả trên đĩa."""
+
+    def __init__(self, root: Optional[str] = None, workers: int = EXTRACT_WORKERS):
+        self.root = Path(root or os.path.join(get_settings().cache_dir, "documents"))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract")
+        self._jobs: "OrderedDict[str, Tuple[Tuple[int, int], Future]]" = OrderedDict()
+        self._documents: "OrderedDict[str, Document]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def supports(file_path: str) -> bool:
+        return os.path.splitext(file_path)[1].lower() in EXTRACTORS
+
+    def submit(self, file_path: str, token: Optional[CancelToken] = None) -> Future:
+        """
+        Bắt đầu trích xuất nền (không làm gì nếu file này đã có job với cùng mtime/size).
+        :param token: token hủy của lượt chat (mặc định: lượt đang chạy), job dừng khi token bị hủy
+        """
+        token = cancellation.current_token() if token is None else token
+        key = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job[0] == stamp and not _cancelled(job[1]):
+                self._jobs.move_to_end(key)
+                return job[1]
+            future = self._executor.submit(self._run, file_path, token)
+            self._jobs[key] = (stamp, future)
+            while len(self._jobs) > MAX_JOBS:
+                self._jobs.popitem(last=False)
+        if token is not None:
+            token.on_cancel(future.cancel)
+        return future
+
+    def get(self, file_path: str, timeout: Optional[float] = None) -> Document:
+        """
+        Kết quả trích xuất của file, chờ job nền nếu chưa xong (tự submit nếu chưa có job).
+        Lượt chat đang chạy bị hủy thì ném TurnCancelled ngay, không chờ job xong.
+        """
+        token = cancellation.current_token()
+        with span("document.wait", kind="extract", file=os.path.basename(file_path)) as record:
+            while True:
+                future = self.submit(file_path, token)
+                record["ready"] = future.done()
+                if token is not None:
+                    wait([future, token.future()], timeout, return_when=FIRST_COMPLETED)
+                    token.check("document")
+                try:
+                    document = future.result(timeout if token is None else 0)
+                    break
+                except (TurnCancelled, CancelledError):
+                    # Job do lượt chat khác (đã bị hủy) tạo ra: trích xuất lại cho lượt này
+                    cancellation.check("document", token)
+        self._remember(document)
+        return document
+
+    async def aget(self, file_path: str) -> Document:
+        """
+        Bản async của get cho tool chạy trên event loop: chờ job bằng asyncio.wait, không giữ thread nào.
+        Task bị cancel không hủy job (job có thể dùng chung với lượt chat khác).
+        """
+        token = cancellation.current_token()
+        with span("document.wait", kind="extract", file=os.path.basename(file_path)) as record:
+            while True:
+                future = self.submit(file_path, token)
+                record["ready"] = future.done()
+                await cancellation.wait_future(future, token)
+                cancellation.check("document", token)
+                try:
+                    document = future.result(0)
+                    break
+                except (TurnCancelled, CancelledError):
+                    cancellation.check("document", token)
+        self._remember(document)
+        return document
+
+    def open(self, handle: str) -> Optional[Document]:
+        """Tài liệu theo handle do extract_file trả về (None nếu không có trong kho)."""
+        prefix = _handle_prefix(handle)
+        if prefix is None:
+            return None
+        document = self._cached(prefix)
+        return document if document is not None else self._open_file(prefix)
+
+    async def aopen(self, handle: str) -> Optional[Document]:
+        """Bản async của open: tài liệu chưa có trong bộ nhớ thì đọc file của kho trên thread."""
+        prefix = _handle_prefix(handle)
+        if prefix is None:
+            return None
+        document = self._cached(prefix)
+        return document if document is not None else await asyncio.to_thread(self._open_file, prefix)
+
+    def _cached(self, prefix: str) -> Optional[Document]:
+        with self._lock:
+            for digest, document in self._documents.items():
+                if digest.startswith(prefix):
+                    self._documents.move_to_end(digest)
+                    return document
+        return None
+
+    def _open_file(self, prefix: str) -> Optional[Document]:
+        paths = sorted(self.root.glob(f"{prefix}*-v{FORMAT_VERSION}.json")) if self.root.exists() else []
+        if not paths:
+            return None
+        document = self._read(paths[0].name.split("-")[0], paths[0])
+        self._remember(document)
+        return document
+
+    def _remember(self, document: Document) -> None:
+        with self._lock:
+            self._documents[document.digest] = document
+            self._documents.move_to_end(document.digest)
+            while len(self._documents) > MAX_OPEN_DOCUMENTS:
+                self._documents.popitem(last=False)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / f"{digest}-v{FORMAT_VERSION}.json"
+
+    @staticmethod
+    def _read(digest: str, path: Path) -> Document:
+        """Đọc chỉ mục (không đọc text các trang)."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return Document(
+            digest,
+            data["file_name"],
+            _text_path(str(path)),
+            data["offsets"],
+            data["tokens"],
+            [Heading(*h) for h in data["headings"]],
+            data["has_text"],
+        )
+
+    def _run(self, file_path: str, token: Optional[CancelToken]) -> Document:
+        with cancellation.use(token):
+            cancellation.check("document")
+            return self._load_or_extract(file_path)
+
+    def _load_or_extract(self, file_path: str) -> Document:
+        digest = file_digest(file_path)
+        path = self._path(digest)
+        if path.exists():
+            record_cache("document", True)
+            return self._read(digest, path)
+
+        record_cache("document", False)
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Parse/OCR chạy trong process worker (workers.py), kết quả về qua file của kho tài liệu
+        document = self._read(digest, Path(run_in_worker(extract_document, file_path, str(path))))
+        logger.info(f"Đã trích xuất {document.file_name}: {document.page_count} trang, "
+                    f"{len(document.headings)} mục")
+        return document
+
+
+def extract_document(file_path: str, path: str) -> str:
+    """
+    Trích xuất file: text từng trang ghi dần vào file text cạnh path, chỉ mục (offset, số token, mục lục) ghi ra path,
+    trả về path. Chạy trong process worker nên chỉ nhận/trả đường dẫn, không gửi text qua pipe.
+    File chỉ mục được ghi sau cùng: có chỉ mục nghĩa là file text đã đầy đủ.
+    """
+    extractor = EXTRACTORS[os.path.splitext(file_path)[1].lower()]
+    text_path = _text_path(path)
+    suffix = f".{os.getpid()}.tmp"
+    try:
+        with open(f"{text_path}{suffix}", "wb") as f:
+            writer = PageWriter(f)
+            headings = extractor(file_path, writer.add) or writer.detected_headings
+    except BaseException:
+        # File hỏng / lượt chat bị hủy giữa chừng: không để lại file text dở
+        os.remove(f"{text_path}{suffix}")
+        raise
+    os.replace(f"{text_path}{suffix}", text_path)
+
+    with open(f"{path}{suffix}", "w", encoding="utf-8") as f:
+        json.dump({
+            "file_name": os.path.basename(file_path),
+            "offsets": writer.offsets,
+            "tokens": writer.tokens,
+            "headings": [list(h) for h in headings],
+            "has_text": writer.has_text,
+        }, f, ensure_ascii=False)
+    os.replace(f"{path}{suffix}", path)
+    return path
+
+
+def _text_path(path: str) -> Path:
+    """File text các trang của tài liệu, cạnh file chỉ mục <digest>-v<FORMAT_VERSION>.json."""
+    return Path(path).with_suffix(".txt")
+
+
+def _handle_prefix(handle: str) -> Optional[str]:
+    """Phần sha256 trong handle "doc_<hex>", None nếu handle không hợp lệ."""
+    prefix = handle.strip()[len(HANDLE_PREFIX):] if handle.strip().startswith(HANDLE_PREFIX) else ""
+    if len(prefix) < 8 or not all(c in "0123456789abcdef" for c in prefix):
+        return None
+    return prefix
+
+
+def _cancelled(future: Future) -> bool:
+    """Job bị hủy theo lượt chat không phải kết quả của file, lần submit sau trích xuất lại."""
+    return future.cancelled() or (future.done() and isinstance(future.exception(), TurnCancelled))
+
+
+@lru_cache(maxsize=1)
+def get_document_store() -> DocumentStore:
+    return DocumentStore()
+
+
+def preextract(file_path: str, token: Optional[CancelToken] = None) -> Optional[Future]:
+    """
+    Gọi ngay sau khi lưu file upload. Trả về None nếu loại file không cần trích xuất trước.
+    :param token: token hủy của lượt chat gửi kèm file, lượt bị hủy thì dừng trích xuất
+    """
+    store = get_document_store()
+    if not store.supports(file_path):
+        return None
+    return store.submit(file_path, token)
@@ -1,65 +1,115 @@
+import asyncio
+import logging
 import os
+import zipfile
+from typing import Callable, List, Optional, Tuple
+from xml.etree import ElementTree
 
 import PyPDF2
-from PIL import Image
 from PyPDF2 import PdfReader
-from langchain_core.tools import tool
-from pydantic import BaseModel, Field
 
-UPLOAD_FOLDER = "uploads"
+import cancellation
+from tools.images import IMAGE_EXTENSIONS, adescribe_images, describe_images
+from tools.io_steps import arun, run
+from tracing import span
 
+logger = logging.getLogger(__name__)
 
-class FileInput(BaseModel):
-    message: str = Field(description="")
-    file_name: str = Field(description="")
+UPLOAD_FOLDER = "uploads"
+DOCUMENT_EXTENSIONS = (".pdf", ".docx", ".txt")
 
 
-@tool("extract_file", args_schema=FileInput,
-      description="Trích xuất, lấy dữ liệu từ ảnh hoặc file sách do người dùng cung cấp", return_direct=True)
-def extract_file(message: str, file_name: str) -> str:
+def extract_file(message: str, file_name: str, file_names: Optional[List[str]] = None) -> str:
     """
-    Mục đích tool: trích xuất thông tin từ file ảnh hoặc pdf
+    Mục đích tool: trích xuất thông tin từ file ảnh, pdf, docx hoặc txt
     :param message:
-    :param file:
+    :param file_name: file user upload
+    :param file_names: các file upload cùng lúc (nhiều ảnh được OCR cùng một lô)
     :return:
     """
-    try:
-        """
-            file = {
-                   "name": str,
-                   "bytes": bytes,
-                   "type": str  # mime type
-            }
-        """
-        ext = os.path.splitext(file_name)[1].lower()
-        filepath = os.path.join(UPLOAD_FOLDER, file_name)
+    return run(_extract_file(file_name, file_names), _OPS)
+
+
+async def aextract_file(message: str, file_name: str, file_names: Optional[List[str]] = None) -> str:
+    """Bản async của extract_file cho event loop: chờ kho tài liệu / OCR bằng asyncio, không giữ thread."""
+    return await arun(_extract_file(file_name, file_names), _AOPS)
+
+
+def _extract_file(file_name: str, file_names: Optional[List[str]]):
+    names, images = _split_names(file_name, file_names)
 
+    parts = []
+    if images:
         # ========== IMAGE ==========
-        if ext in [".png", ".jpg", ".jpeg"]:
-            img = Image.open(filepath)
-            return f"Ảnh {file_name} có kích thước"
-
-        # ========== PDF ==========
-        elif ext == ".pdf":
-            reader = PdfReader(filepath)
-            num_pages = len(reader.pages)
-            text_preview = reader.pages[0].extract_text()[:300] if num_pages > 0 else ""
-
-            content = convert_pdf_to_text(filepath)
-            return f"Nội dung file: {content}"
-
-        # ========== DOCX ==========
-        # elif ext == ".docx":
-        #     doc = Document(io.BytesIO(file_bytes))
-        #     paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
-        #     text_preview = "\n".join(paragraphs[:3])
-        #     return f"Word {file_name} có {len(paragraphs)} đoạn văn.\nNội dung:\n{text_preview}"
-
-        else:
+        try:
+            parts.append((yield "images", [os.path.join(UPLOAD_FOLDER, name) for name in images]))
+        except Exception as e:
+            parts.append(f"Lỗi khi phân tích ảnh: {str(e)}")
+    for name in names:
+        if name not in images:
+            parts.append((yield from _extract_one(name)))
+    return "\n\n".join(parts)
+
+
+def _split_names(file_name: str, file_names: Optional[List[str]]) -> Tuple[List[str], List[str]]:
+    """(mọi file không trùng lặp, các file ảnh trong số đó)."""
+    names = [name for name in dict.fromkeys([file_name, *(file_names or [])]) if name]
+    return names, [name for name in names if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS]
+
+
+def _extract_one(file_name: str):
+    try:
+        # ========== PDF / DOCX / TXT ==========
+        if os.path.splitext(file_name)[1].lower() not in DOCUMENT_EXTENSIONS:
             return f"File {file_name} có loại chưa hỗ trợ"
 
+        # Thường đã được trích xuất nền từ lúc upload (tools/documents.py), ở đây chỉ chờ kết quả
+        document = yield "document", os.path.join(UPLOAD_FOLDER, file_name)
+        return (yield "describe", file_name, document)
+
     except Exception as e:
-        return f"Lỗi khi phân tích file: {str(e)}"
+        return _error_message(e)
+
+
+def _document(file_path: str):
+    from tools.documents import get_document_store
+
+    return get_document_store().get(file_path)
+
+
+async def _adocument(file_path: str):
+    from tools.documents import get_document_store
+
+    return await get_document_store().aget(file_path)
+
+
+def _describe(file_name: str, document) -> str:
+    from tools.read_document import describe_document
+
+    if not document.has_text:
+        if file_name.lower().endswith(".pdf"):
+            return "Không thể trích xuất văn bản từ file PDF. File có thể là hình ảnh hoặc bị mã hóa."
+        return f"File {file_name} không có nội dung văn bản."
+    # Chỉ trả handle + mục lục để state/checkpoint không chứa toàn bộ text của file lớn
+    return describe_document(document)
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, PyPDF2.errors.PdfReadError):
+        return "File PDF bị hỏng hoặc không hợp lệ."
+    if isinstance(error, (zipfile.BadZipFile, KeyError, ElementTree.ParseError)):
+        return "File Word bị hỏng hoặc không phải định dạng .docx."
+    return f"Lỗi khi phân tích file: {str(error)}"
+
+
+async def _adescribe(file_name: str, document) -> str:
+    # Tài liệu ngắn được đọc nguyên văn từ file của kho: đọc trên thread
+    return await asyncio.to_thread(_describe, file_name, document)
+
+
+# Các bước I/O của _extract_file: bản sync và bản async
+_OPS = {"images": describe_images, "document": _document, "describe": _describe}
+_AOPS = {"images": adescribe_images, "document": _adocument, "describe": _adescribe}
 
 
 def convert_pdf_to_text(file_path: str) -> str:
@@ -72,14 +122,10 @@ def convert_pdf_to_text(file_path: str) -> str:
         if not file_path.lower().endswith(".pdf"):
             return "File phải là PDF."
 
-        text = ""
-        with open(file_path, "rb") as f:
-            pdf_reader = PyPDF2.PdfReader(f)
+        # Parse trong process worker qua kho tài liệu (cache theo sha256), không chạy trên thread của UI
+        from tools.documents import get_document_store
 
-            for page in pdf_reader.pages:
-                extracted_text = page.extract_text()
-                if extracted_text:
-                    text += extracted_text + "\n"
+        text = get_document_store().get(file_path).text
 
         if not text.strip():
             return "Không thể trích xuất văn bản từ file PDF. File có thể là hình ảnh hoặc bị mã hóa."
@@ -90,3 +136,70 @@ def convert_pdf_to_text(file_path: str) -> str:
         return "File PDF bị hỏng hoặc không hợp lệ."
     except Exception as e:
         return f"Lỗi máy chủ: {str(e)}"
+
+
+def read_pdf_text(file_path: str) -> str:
+    """
+    Đọc toàn bộ text của file PDF, không bắt lỗi (PdfReadError, OSError được ném ra cho nơi gọi).
+    :param file_path: đường dẫn đến file PDF
+    :return: text của các trang, mỗi trang kết thúc bằng xuống dòng
+    """
+    pages, _ = read_pdf_document(file_path)
+    return "".join(page + "\n" for page in pages if page)
+
+
+def read_pdf_document(file_path: str) -> Tuple[List[str], List[Tuple[int, int, str]]]:
+    """
+    Đọc text từng trang và mục lục (bookmark) của file PDF, không bắt lỗi.
+    :param file_path: đường dẫn đến file PDF
+    :return: (text từng trang, trang không có text là chuỗi rỗng; danh sách (trang bắt đầu từ 1, cấp, tiêu đề))
+    """
+    pages: List[str] = []
+    bookmarks = extract_pdf_pages(file_path, pages.append)
+    return pages, bookmarks
+
+
+def extract_pdf_pages(file_path: str, add_page: Callable[[str], None]) -> List[Tuple[int, int, str]]:
+    """
+    Như read_pdf_document nhưng gửi text từng trang cho add_page ngay khi đọc xong (DocumentStore ghi ra đĩa),
+    không giữ các trang trong bộ nhớ.
+    :return: danh sách (trang bắt đầu từ 1, cấp, tiêu đề)
+    """
+    with span("pdf.extract", kind="extract", input_bytes=os.path.getsize(file_path)) as record:
+        with open(file_path, "rb") as f:
+            pdf_reader = PyPDF2.PdfReader(f)
+            page_count = output_bytes = 0
+            for page in pdf_reader.pages:
+                # Lượt chat bị hủy: dừng giữa các trang thay vì parse hết file
+                cancellation.check("pdf_page")
+                text = page.extract_text() or ""
+                add_page(text)
+                page_count += 1
+                output_bytes += len(text.encode("utf-8"))
+            bookmarks = _pdf_bookmarks(pdf_reader)
+
+        record["pages"] = page_count
+        record["output_bytes"] = output_bytes
+    return bookmarks
+
+
+def _pdf_bookmarks(pdf_reader: PdfReader) -> List[Tuple[int, int, str]]:
+    """Mục lục nhúng trong PDF; file không có hoặc mục lục hỏng thì trả về danh sách rỗng."""
+    bookmarks = []
+
+    def walk(items, level):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            try:
+                bookmarks.append((pdf_reader.get_destination_page_number(item) + 1, level, str(item.title).strip()))
+            except Exception:
+                continue
+
+    try:
+        walk(pdf_reader.outline, 1)
+    except Exception as e:
+        logger.warning(f"Không đọc được mục lục PDF: {e}")
+        return []
+    return [b for b in bookmarks if b[0] > 0 and b[2]]
@@ -0,0 +1,181 @@
+"""
+Xử lý ảnh upload (thường là ảnh chụp trang sách): đọc header, thu nhỏ về độ phân giải giới hạn, OCR cục bộ.
+
+- Header (kích thước, định dạng) đọc bằng Image.open, chưa giải mã pixel.
+- Ảnh thu nhỏ (cạnh dài <= MAX_SIDE) lưu trong cache/images theo sha256 nội dung file.
+- OCR (pytesseract, tùy chọn) chạy trên ảnh đã thu nhỏ, qua worker pool của DocumentStore:
+  trích xuất nền ngay lúc upload, kết quả cache theo sha256 như PDF.
+  Chưa cài pytesseract/tesseract thì extract_file chỉ trả về thông tin ảnh.
+"""
+import asyncio
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+import cancellation
+from settings import get_settings
+from tools.io_steps import arun, run
+from tracing import record_cache, span
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tiff", ".webp")
+# Cạnh dài tối đa của ảnh thu nhỏ, đủ cho OCR chữ in trên ảnh chụp cả trang
+MAX_SIDE = 2000
+JPEG_QUALITY = 90
+
+
+class OCRUnavailable(RuntimeError):
+    """Chưa cài pytesseract hoặc tesseract-ocr."""
+
+
+class ImageHeader(NamedTuple):
+    width: int
+    height: int
+    format: str
+    mode: str
+
+
+def read_header(path: str) -> ImageHeader:
+    """Kích thước, định dạng ảnh (Image.open chỉ đọc header, chưa giải mã ảnh)."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return ImageHeader(img.width, img.height, img.format or "", img.mode)
+
+
+def thumbnail_path(path: str, digest: Optional[str] = None, max_side: int = MAX_SIDE) -> str:
+    """Đường dẫn ảnh thu nhỏ (JPEG, cạnh dài <= max_side) trong cache, tạo nếu chưa có."""
+    from tools.documents import file_digest
+
+    digest = digest or file_digest(path)
+    target = Path(get_settings().cache_dir) / "images" / f"{digest}-{max_side}.jpg"
+    if target.exists():
+        record_cache("thumbnail", True)
+        return str(target)
+
+    record_cache("thumbnail", False)
+    from PIL import Image, ImageOps
+
+    with span("image.thumbnail", kind="extract", input_bytes=os.path.getsize(path)) as record:
+        with Image.open(path) as img:
+            if img.format == "JPEG":
+                # JPEG giải mã thẳng ở độ phân giải thấp hơn (DCT scaling), không cần đọc ảnh gốc đầy đủ
+                img.draft("RGB", (max_side, max_side))
+            image = ImageOps.exif_transpose(img)
+            image.thumbnail((max_side, max_side))
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_suffix(".tmp")
+            image.save(tmp_path, "JPEG", quality=JPEG_QUALITY)
+            os.replace(tmp_path, target)
+            record["width"], record["height"] = image.size
+    return str(target)
+
+
+@lru_cache(maxsize=1)
+def ocr_languages() -> Optional[str]:
+    """Ngôn ngữ OCR dùng được (theo OCR_LANGUAGES), None nếu chưa cài pytesseract/tesseract."""
+    try:
+        import pytesseract
+
+        available = set(pytesseract.get_languages(config=""))
+    except Exception as e:
+        logger.info(f"OCR không khả dụng: {e}")
+        return None
+    wanted = [lang for lang in get_settings().ocr_languages.split("+") if lang in available]
+    if not wanted:
+        logger.warning(f"Tesseract thiếu ngôn ngữ {get_settings().ocr_languages}, dùng {sorted(available)}")
+        wanted = ["eng"] if "eng" in available else sorted(available)[:1]
+    return "+".join(wanted) or None
+
+
+def extract_image(path: str) -> Tuple[List[str], list]:
+    """Extractor cho DocumentStore: text OCR của ảnh (một trang, không có mục lục)."""
+    languages = ocr_languages()
+    if languages is None:
+        raise OCRUnavailable("Chưa cài OCR (pytesseract + tesseract-ocr)")
+
+    import pytesseract
+    from PIL import Image
+
+    thumbnail = thumbnail_path(path)
+    cancellation.check("image")
+    with span("image.ocr", kind="extract", languages=languages) as record:
+        with Image.open(thumbnail) as image:
+            text = pytesseract.image_to_string(image, lang=languages)
+        record["output_bytes"] = len(text.encode("utf-8"))
+    return [text.strip()], []
+
+
+def describe_images(paths: List[str]) -> str:
+    """
+    Kết quả extract_file cho một hoặc nhiều ảnh: cả lô được đưa vào worker pool cùng lúc,
+    sau đó chờ lần lượt theo thứ tự.
+    """
+    return run(_describe_images(paths), _OPS)
+
+
+async def adescribe_images(paths: List[str]) -> str:
+    """Bản async của describe_images: đọc header trên thread, chờ OCR bằng DocumentStore.aget."""
+    return await arun(_describe_images(paths), _AOPS)
+
+
+def _describe_images(paths: List[str]):
+    from tools.documents import get_document_store
+
+    store = get_document_store()
+    for path in paths:
+        store.submit(path)
+    parts = []
+    with span("image.batch", kind="extract", images=len(paths)):
+        for path in paths:
+            cancellation.check("image")
+            name = os.path.basename(path)
+            try:
+                header = yield "header", path
+            except Exception as e:
+                parts.append(f"Ảnh {name}: không đọc được ảnh ({e})")
+                continue
+
+            try:
+                # Chờ job đã submit ở trên; lượt chat bị hủy thì dừng ngay (TurnCancelled không bị bắt ở đây)
+                parts.append(_describe(name, header, text=(yield "document", path).text))
+            except Exception as e:
+                parts.append(_describe(name, header, error=e))
+    return "\n\n".join(parts)
+
+
+def _document(path: str):
+    from tools.documents import get_document_store
+
+    return get_document_store().get(path)
+
+
+async def _aheader(path: str) -> ImageHeader:
+    return await asyncio.to_thread(read_header, path)
+
+
+async def _adocument(path: str):
+    from tools.documents import get_document_store
+
+    return await get_document_store().aget(path)
+
+
+# Các bước I/O của _describe_images: bản sync và bản async
+_OPS = {"header": read_header, "document": _document}
+_AOPS = {"header": _aheader, "document": _adocument}
+
+
+def _describe(name: str, header: ImageHeader, text: str = "", error: Optional[Exception] = None) -> str:
+    line = f"Ảnh {name}: {header.width}x{header.height}, {header.format}"
+    if isinstance(error, OCRUnavailable):
+        return f"{line}. Máy chủ chưa cài OCR nên không đọc được chữ trong ảnh."
+    if error is not None:
+        return f"{line}. Lỗi khi nhận dạng chữ: {error}"
+    text = text.strip()
+    return f"{line}\nChữ nhận dạng được:\n{text}" if text else f"{line}. Không tìm thấy chữ trong ảnh."
@@ -0,0 +1,60 @@
+"""
+Viết logic của tool một lần cho cả bản sync và bản async.
+
+Hàm logic là generator: mỗi khi cần I/O (DB, kho tài liệu, model) thì yield một bước ("tên", *tham số)
+và nhận lại kết quả, lỗi của bước được ném lại vào generator tại chỗ yield (try/except trong logic vẫn dùng được).
+run() thực hiện các bước bằng hàm sync, arun() bằng coroutine, theo bảng tên bước -> hàm của từng tool.
+Hàm trong bảng có thể là callable hoặc chuỗi "module:attr" (import ở lần dùng đầu, như target của tools/registry.py).
+
+    def _logic(book_id):
+        book = yield "book_by_id", book_id
+        return book[1] if book else None
+
+    def name(book_id):
+        return run(_logic(book_id), {"book_by_id": "tools.book_search:get_book_by_id"})
+
+    async def aname(book_id):
+        return await arun(_logic(book_id), {"book_by_id": "tools.book_search:aget_book_by_id"})
+"""
+import importlib
+from typing import Any, Callable, Dict, Generator, Tuple, Union
+
+Steps = Generator[Tuple[Any, ...], Any, Any]
+Ops = Dict[str, Union[str, Callable[..., Any]]]
+
+
+def _op(ops: Ops, name: str) -> Callable[..., Any]:
+    op = ops[name]
+    if isinstance(op, str):
+        module, attr = op.split(":")
+        op = getattr(importlib.import_module(module), attr)
+    return op
+
+
+def run(logic: Steps, ops: Ops) -> Any:
+    """Chạy generator logic, mỗi bước gọi hàm sync tương ứng trong ops."""
+    value, error = None, None
+    while True:
+        try:
+            name, *args = logic.throw(error) if error is not None else logic.send(value)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = _op(ops, name)(*args), None
+        except BaseException as e:
+            # Kể cả TurnCancelled/CancelledError: logic thấy lỗi tại chỗ yield, span/finally đóng đúng
+            value, error = None, e
+
+
+async def arun(logic: Steps, ops: Ops) -> Any:
+    """Như run, mỗi bước await coroutine tương ứng trong ops."""
+    value, error = None, None
+    while True:
+        try:
+            name, *args = logic.throw(error) if error is not None else logic.send(value)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = await _op(ops, name)(*args), None
+        except BaseException as e:
+            value, error = None, e
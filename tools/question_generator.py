@@ -1,9 +1,15 @@
+import asyncio
 import typing
 import os
 import logging
+from functools import lru_cache
 from typing import List, Optional, Dict, Any
 from pathlib import Path
-from langchain_core.tools import tool
+
+import cancellation
+from tracing import span, payload_size
+from tools.io_steps import arun, run
+from workers import arun_in_worker, run_in_worker
 
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO)
@@ -83,66 +89,26 @@ def create_question_set(request: dict) -> Dict[str, Any]:
         Dictionary chứa kết quả xử lý
     """
     try:
-        # Kiểm tra tham số thiếu
-        missing = get_missing_params(request)
-        if missing:
-            questions = []
-            for param in missing:
-                if param == 'loai_bode':
-                    questions.append('Bạn muốn tạo bộ đề loại nào? (trắc nghiệm/tự luận)')
-                elif param == 'so_cau':
-                    questions.append('Bạn muốn tạo bộ đề với bao nhiêu câu hỏi?')
-                else:
-                    questions.append(f'Vui lòng cung cấp thông tin cho tham số: {param}')
-            return {
-                'status': 'need_more_info', 
-                'missing_params': missing, 
-                'questions': questions
-            }
-        
-        # Validate dữ liệu đầu vào
-        validation_result = validate_request_params(request)
-        if not validation_result['valid']:
-            return {
-                'status': 'validation_error',
-                'errors': validation_result['errors'],
-                'warnings': validation_result.get('warnings', [])
-            }
-        
-        # Log warnings nếu có
-        if validation_result['warnings']:
-            for warning in validation_result['warnings']:
-                logger.warning(warning)
+        checked = _check_request(request)
+        if checked is not None:
+            return checked
         
         # Sinh câu hỏi bằng LLM Gemini
         logger.info("Bắt đầu sinh câu hỏi từ LLM...")
         questions = generate_questions_llm(request)
         
         if not questions:
-            return {
-                'status': 'error', 
-                'message': 'Không sinh được câu hỏi từ LLM. Vui lòng thử lại sau.'
-            }
+            return _NO_QUESTIONS.copy()
         
         # Tạo file docx
         try:
-            filename = f"bo_de_{request.get('chu_de', 'general').replace(' ', '_')}.docx"
-            export_questions_to_docx(questions, filename)
+            filename = _docx_name(request)
+            # python-docx chạy trong process worker, kết quả là file trong output/
+            run_in_worker(export_questions_to_docx, questions, filename)
             logger.info(f"Đã tạo file: {filename}")
-            
-            return {
-                'status': 'success', 
-                'questions': questions, 
-                'docx_file': filename,
-                'question_count': len(questions)
-            }
+            return _success(questions, filename)
         except Exception as e:
-            logger.error(f"Lỗi khi tạo file docx: {str(e)}")
-            return {
-                'status': 'partial_success',
-                'questions': questions,
-                'message': f'Đã sinh câu hỏi nhưng không thể tạo file docx: {str(e)}'
-            }
+            return _partial_success(questions, e)
             
     except Exception as e:
         logger.error(f"Lỗi trong create_question_set: {str(e)}")
@@ -151,6 +117,92 @@ def create_question_set(request: dict) -> Dict[str, Any]:
             'message': f'Đã xảy ra lỗi: {str(e)}'
         }
 
+async def acreate_question_set(request: dict) -> Dict[str, Any]:
+    """Bản async của create_question_set: gọi LLM bằng ainvoke, chờ process worker xuất docx bằng asyncio."""
+    try:
+        checked = _check_request(request)
+        if checked is not None:
+            return checked
+        
+        logger.info("Bắt đầu sinh câu hỏi từ LLM...")
+        questions = await agenerate_questions_llm(request)
+        
+        if not questions:
+            return _NO_QUESTIONS.copy()
+        
+        try:
+            filename = _docx_name(request)
+            await arun_in_worker(export_questions_to_docx, questions, filename)
+            logger.info(f"Đã tạo file: {filename}")
+            return _success(questions, filename)
+        except Exception as e:
+            return _partial_success(questions, e)
+            
+    except Exception as e:
+        logger.error(f"Lỗi trong acreate_question_set: {str(e)}")
+        return {
+            'status': 'error',
+            'message': f'Đã xảy ra lỗi: {str(e)}'
+        }
+
+_NO_QUESTIONS = {
+    'status': 'error', 
+    'message': 'Không sinh được câu hỏi từ LLM. Vui lòng thử lại sau.'
+}
+
+def _check_request(request: dict) -> Optional[Dict[str, Any]]:
+    """Kết quả trả về ngay khi yêu cầu thiếu tham số hoặc không hợp lệ, None nếu đủ điều kiện sinh câu hỏi."""
+    # Kiểm tra tham số thiếu
+    missing = get_missing_params(request)
+    if missing:
+        questions = []
+        for param in missing:
+            if param == 'loai_bode':
+                questions.append('Bạn muốn tạo bộ đề loại nào? (trắc nghiệm/tự luận)')
+            elif param == 'so_cau':
+                questions.append('Bạn muốn tạo bộ đề với bao nhiêu câu hỏi?')
+            else:
+                questions.append(f'Vui lòng cung cấp thông tin cho tham số: {param}')
+        return {
+            'status': 'need_more_info', 
+            'missing_params': missing, 
+            'questions': questions
+        }
+    
+    # Validate dữ liệu đầu vào
+    validation_result = validate_request_params(request)
+    if not validation_result['valid']:
+        return {
+            'status': 'validation_error',
+            'errors': validation_result['errors'],
+            'warnings': validation_result.get('warnings', [])
+        }
+    
+    # Log warnings nếu có
+    if validation_result['warnings']:
+        for warning in validation_result['warnings']:
+            logger.warning(warning)
+    return None
+
+def _docx_name(request: dict) -> str:
+    return f"bo_de_{request.get('chu_de', 'general').replace(' ', '_')}.docx"
+
+def _success(questions: List[Dict[str, Any]], filename: str) -> Dict[str, Any]:
+    return {
+        'status': 'success', 
+        'questions': questions, 
+        'docx_file': filename,
+        'question_count': len(questions)
+    }
+
+def _partial_success(questions: List[Dict[str, Any]], error: Exception) -> Dict[str, Any]:
+    logger.error(f"Lỗi khi tạo file docx: {str(error)}")
+    return {
+        'status': 'partial_success',
+        'questions': questions,
+        'message': f'Đã sinh câu hỏi nhưng không thể tạo file docx: {str(error)}'
+    }
+
 def generate_questions_llm(request: dict) -> List[Dict[str, Any]]:
     """
     Gọi LLM Gemini qua LangChain để sinh câu hỏi, sử dụng with_structured_output.
@@ -162,52 +214,77 @@ def generate_questions_llm(request: dict) -> List[Dict[str, Any]]:
         List các câu hỏi đã được sinh
     """
     try:
-        from langchain_google_genai import ChatGoogleGenerativeAI
-        from pydantic import BaseModel, Field
-        from typing import List, Optional
-        from dotenv import load_dotenv
-        
-        load_dotenv()
-        api_key = os.getenv("GEMINI_API_KEY")
-        
-        if not api_key:
-            logger.error("Không tìm thấy GEMINI_API_KEY trong environment variables")
+        prepared = _question_request(request)
+        if prepared is None:
             return []
+        model, prompt, loai_bode = prepared
         
-        # Định nghĩa schema cho câu hỏi
-        class Question(BaseModel):
-            question_type: str = Field(description="Loại câu hỏi: 'trắc nghiệm' hoặc 'tự luận'")
-            question: str = Field(description="Nội dung câu hỏi")
-            choices: Optional[List[str]] = Field(default=None, description="Các đáp án cho câu trắc nghiệm")
-            correct_answer: Optional[str] = Field(default=None, description="Đáp án đúng")
-            explanation: Optional[str] = Field(default=None, description="Giải thích đáp án")
-        
-        class QuestionSet(BaseModel):
-            questions: List[Question] = Field(description="Danh sách câu hỏi")
+        # Gọi LLM
+        logger.info("Đang gọi LLM để sinh câu hỏi...")
+        with span("question_generator.llm", kind="llm", input_bytes=payload_size(prompt)):
+            response = model.invoke(prompt)
+        return _to_questions(response, loai_bode)
         
-        # Khởi tạo model
-        model = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash-exp",
-            temperature=0.7,
-            max_tokens=None,
-            timeout=60,
-            max_retries=3,
-            google_api_key=api_key
-        ).with_structured_output(QuestionSet)
+    except ImportError as e:
+        logger.error(f"Lỗi import thư viện: {str(e)}")
+        return []
+    except Exception as e:
+        logger.error(f"Lỗi khi gọi LLM: {str(e)}")
+        return []
+
+async def agenerate_questions_llm(request: dict) -> List[Dict[str, Any]]:
+    """Bản async của generate_questions_llm (model.ainvoke, không chặn event loop)."""
+    try:
+        if not _question_model.cache_info().currsize:
+            # Lần đầu tạo model (schema pydantic, import stack Gemini) chạy trên thread
+            await asyncio.to_thread(_question_model)
+        prepared = _question_request(request)
+        if prepared is None:
+            return []
+        model, prompt, loai_bode = prepared
         
-        # Chuẩn bị thông tin
-        loai_bode = request.get('loai_bode', 'trắc nghiệm').lower().strip()
-        if loai_bode in ['trac nghiem']:
-            loai_bode = 'trắc nghiệm'
-        elif loai_bode in ['tu luan']:
-            loai_bode = 'tự luận'
-            
-        so_cau = int(request.get('so_cau', 5))
-        chu_de = request.get('chu_de', '').strip()
-        noi_dung_sach = request.get('noi_dung_sach', '').strip()
+        logger.info("Đang gọi LLM để sinh câu hỏi...")
+        with span("question_generator.llm", kind="llm", input_bytes=payload_size(prompt)):
+            response = await model.ainvoke(prompt)
+        return _to_questions(response, loai_bode)
         
-        # Tạo prompt chi tiết
-        prompt = f"""
+    except ImportError as e:
+        logger.error(f"Lỗi import thư viện: {str(e)}")
+        return []
+    except Exception as e:
+        logger.error(f"Lỗi khi gọi LLM: {str(e)}")
+        return []
+
+def _question_request(request: dict):
+    """
+    Model (structured output) và prompt cho yêu cầu tạo bộ đề.
+    
+    Returns:
+        (model, prompt, loai_bode), None nếu chưa cấu hình GEMINI_API_KEY
+    """
+    from settings import get_settings
+    
+    api_key = get_settings().gemini_api_key
+    
+    if not api_key:
+        logger.error("Không tìm thấy GEMINI_API_KEY trong environment variables")
+        return None
+    
+    model = _question_model()
+    
+    # Chuẩn bị thông tin
+    loai_bode = request.get('loai_bode', 'trắc nghiệm').lower().strip()
+    if loai_bode in ['trac nghiem']:
+        loai_bode = 'trắc nghiệm'
+    elif loai_bode in ['tu luan']:
+        loai_bode = 'tự luận'
+        
+    so_cau = int(request.get('so_cau', 5))
+    chu_de = request.get('chu_de', '').strip()
+    noi_dung_sach = request.get('noi_dung_sach', '').strip()
+    
+    # Tạo prompt chi tiết
+    prompt = f"""
 Bạn là một chuyên gia giáo dục, hãy tạo {so_cau} câu hỏi {loai_bode} chất lượng cao.
 
 Thông tin:
@@ -217,58 +294,75 @@ Thông tin:
 Yêu cầu:
 """
 
-        if loai_bode == 'trắc nghiệm':
-            prompt += """
+    if loai_bode == 'trắc nghiệm':
+        prompt += """
 - Mỗi câu hỏi có 4 đáp án (A, B, C, D)
 - Chỉ có 1 đáp án đúng
 - Các đáp án sai phải hợp lý, không quá dễ loại bỏ
 - Cung cấp giải thích ngắn gọn cho đáp án đúng
 - Câu hỏi phải rõ ràng, không gây nhầm lẫn
 """
-        else:
-            prompt += """
+    else:
+        prompt += """
 - Câu hỏi mở, yêu cầu tư duy và phân tích
 - Không cần đáp án cụ thể
 - Có thể cung cấp hướng dẫn trả lời
 - Câu hỏi phải khuyến khích suy nghĩ sâu
 """
 
-        prompt += """
+    prompt += """
 Đảm bảo:
 - Câu hỏi có độ khó phù hợp
 - Ngôn ngữ tiếng Việt chuẩn
 - Nội dung chính xác về mặt học thuật
 - Đa dạng về hình thức và góc độ tiếp cận
 """
+    return model, prompt, loai_bode
 
-        # Gọi LLM
-        logger.info("Đang gọi LLM để sinh câu hỏi...")
-        response = model.invoke(prompt)
-        
-        # Chuyển đổi kết quả
-        questions = []
-        for q in response.questions:
-            question_data = {
-                'question_type': loai_bode,
-                'question': q.question,
-                'explanation': q.explanation
-            }
-            
-            if loai_bode == 'trắc nghiệm':
-                question_data['choices'] = q.choices or []
-                question_data['correct_answer'] = q.correct_answer
-            
-            questions.append(question_data)
+@lru_cache(maxsize=1)
+def _question_model():
+    """Model structured output dùng chung cho mọi lượt (schema pydantic chỉ tạo một lần)."""
+    from llm import create_chat_model
+    from pydantic import BaseModel, Field
+    
+    # Định nghĩa schema cho câu hỏi
+    class Question(BaseModel):
+        question_type: str = Field(description="Loại câu hỏi: 'trắc nghiệm' hoặc 'tự luận'")
+        question: str = Field(description="Nội dung câu hỏi")
+        choices: Optional[List[str]] = Field(default=None, description="Các đáp án cho câu trắc nghiệm")
+        correct_answer: Optional[str] = Field(default=None, description="Đáp án đúng")
+        explanation: Optional[str] = Field(default=None, description="Giải thích đáp án")
+    
+    class QuestionSet(BaseModel):
+        questions: List[Question] = Field(description="Danh sách câu hỏi")
+    
+    # Khởi tạo model
+    return create_chat_model(
+        model="gemini-2.0-flash-exp",
+        temperature=0.7,
+        max_tokens=None,
+        timeout=60,
+        max_retries=3,
+    ).with_structured_output(QuestionSet)
+
+def _to_questions(response, loai_bode: str) -> List[Dict[str, Any]]:
+    # Chuyển đổi kết quả
+    questions = []
+    for q in response.questions:
+        question_data = {
+            'question_type': loai_bode,
+            'question': q.question,
+            'explanation': q.explanation
+        }
         
-        logger.info(f"Đã sinh thành công {len(questions)} câu hỏi")
-        return questions
+        if loai_bode == 'trắc nghiệm':
+            question_data['choices'] = q.choices or []
+            question_data['correct_answer'] = q.correct_answer
         
-    except ImportError as e:
-        logger.error(f"Lỗi import thư viện: {str(e)}")
-        return []
-    except Exception as e:
-        logger.error(f"Lỗi khi gọi LLM: {str(e)}")
-        return []
+        questions.append(question_data)
+    
+    logger.info(f"Đã sinh thành công {len(questions)} câu hỏi")
+    return questions
 
 def export_questions_to_docx(questions: List[Dict[str, Any]], filename: str) -> None:
     """
@@ -301,6 +395,7 @@ def export_questions_to_docx(questions: List[Dict[str, Any]], filename: str) ->
         
         # Thêm câu hỏi
         for idx, q in enumerate(questions, 1):
+            cancellation.check("docx_export")
             # Số thứ tự và câu hỏi
             question_para = doc.add_paragraph()
             question_para.add_run(f"Câu {idx}: ").bold = True
@@ -330,7 +425,8 @@ def export_questions_to_docx(questions: List[Dict[str, Any]], filename: str) ->
             # Thêm dòng trống giữa các câu
             doc.add_paragraph("")
         
-        # Lưu file
+        # Lưu file (lượt chat đã bị hủy thì không ghi file)
+        cancellation.check("docx_export")
         full_path = output_dir / filename
         doc.save(str(full_path))
         logger.info(f"Đã lưu file: {full_path}")
@@ -342,68 +438,95 @@ def export_questions_to_docx(questions: List[Dict[str, Any]], filename: str) ->
         logger.error(f"Lỗi khi xuất file docx: {str(e)}")
         raise
 
-def resolve_book_content(ten_sach: str, noi_dung_sach: str) -> tuple[str, str]:
+def resolve_book_content(ten_sach: str, noi_dung_sach: str, chuong: Optional[int] = None) -> tuple[str, str]:
     """
     Tự động tìm kiếm và lấy nội dung sách từ database nếu cần thiết.
+    Tên sách được tra trong title index (bộ nhớ, fuzzy, không phân biệt dấu),
+    chỉ truy vấn DB theo BookID khi đã xác định được sách.
     
     Args:
         ten_sach: Tên sách cần tìm
         noi_dung_sach: Nội dung sách hoặc có thể là tên sách
+        chuong: Chỉ lấy nội dung chương này (từ bảng BookChunk) thay vì cả cuốn
         
     Returns:
         tuple(actual_content, source_info): Nội dung thực và thông tin nguồn
     """
+    return run(_resolve_book_content(ten_sach, noi_dung_sach, chuong), _BOOK_OPS)
+
+async def aresolve_book_content(ten_sach: str, noi_dung_sach: str, chuong: Optional[int] = None) -> tuple[str, str]:
+    """Bản async của resolve_book_content (title index và bảng Book/BookChunk tra bằng DB async)."""
+    return await arun(_resolve_book_content(ten_sach, noi_dung_sach, chuong), _ABOOK_OPS)
+
+async def _aensure_book_ingested(book_id: int) -> None:
+    """Chia chunk lần đầu (ensure_ingested) chạy trên thread, không chặn event loop."""
+    from tools.read_book import ensure_book_ingested
+
+    await asyncio.to_thread(ensure_book_ingested, book_id)
+
+# Các bước I/O của _resolve_book_content (tools/io_steps.py): bản sync và bản async
+_BOOK_OPS = {
+    "title_index": "tools.title_index:get_title_index",
+    "search_by_content": "tools.book_search:search_by_content",
+    "book_info": "tools.book_search:get_book_info",
+    "book_by_id": "tools.book_search:get_book_by_id",
+    "ensure_ingested": "tools.read_book:ensure_book_ingested",
+    "chapter": "tools.book_search:get_book_chapter",
+}
+_ABOOK_OPS = {
+    "title_index": "tools.title_index:aget_title_index",
+    "search_by_content": "tools.book_search:asearch_by_content",
+    "book_info": "tools.book_search:aget_book_info",
+    "book_by_id": "tools.book_search:aget_book_by_id",
+    "ensure_ingested": _aensure_book_ingested,
+    "chapter": "tools.book_search:aget_book_chapter",
+}
+
+def _resolve_book_content(ten_sach: str, noi_dung_sach: str, chuong: Optional[int]):
+    """Logic của resolve_book_content, các bước I/O được yield cho run/arun."""
+    if not (ten_sach and ten_sach.strip()) and not (noi_dung_sach and noi_dung_sach.strip()):
+        # Chỉ có chủ đề: không cần title index (không quét catalogue khi index chưa nạp hoặc nạp lỗi)
+        return "", "Không có nội dung tham khảo"
+
     try:
-        from tools.book_search import search_by_content
-        
+        index = yield "title_index",
+
         # Trường hợp 1: Có tên sách rõ ràng
         if ten_sach and ten_sach.strip():
             logger.info(f"Tìm kiếm sách theo tên: {ten_sach}")
-            books = search_by_content(ten_sach.strip())
-            if books:
-                book_info = books[0]  # Lấy kết quả đầu tiên
-                content = book_info[2]  # Content column
-                book_name = book_info[1]  # BookName column
-                category = book_info[3]  # CategoryName column
-                logger.info(f"Tìm thấy sách: {book_name} (Thể loại: {category})")
-                return content, f"Sách: {book_name} (Thể loại: {category})"
-            else:
-                logger.warning(f"Không tìm thấy sách với tên: {ten_sach}")
-        
-        # Trường hợp 2: noi_dung_sach có thể là tên sách (ngắn, ít dấu chấm)
-        if noi_dung_sach and noi_dung_sach.strip():
-            content = noi_dung_sach.strip()
-            
-            # Heuristic để phát hiện có thể là tên sách:
-            # - Độ dài < 100 ký tự
-            # - Ít hơn 3 dấu chấm (không phải đoạn văn)
-            # - Không chứa nhiều ký tự xuống dòng
-            is_possibly_book_name = (
-                len(content) < 100 and
-                content.count('.') < 3 and
-                content.count('\n') < 3 and
-                not content.startswith(('Nội dung', 'Chương', 'Bài'))
-            )
-            
-            if is_possibly_book_name:
-                logger.info(f"Phát hiện có thể là tên sách: {content}")
-                books = search_by_content(content)
+            match = index.best_match(ten_sach.strip())
+            found = (yield from _book_content(match.book_id, chuong, match)) if match else None
+            if found is None:
+                # Tên không khớp chỉ mục: thử tìm theo từ khóa trong nội dung như trước
+                books = yield "search_by_content", ten_sach.strip()
                 if books:
-                    book_info = books[0]
-                    book_content = book_info[2]
-                    book_name = book_info[1]
-                    category = book_info[3]
+                    book_id, book_name, content, category = books[0]
                     logger.info(f"Tìm thấy sách: {book_name} (Thể loại: {category})")
-                    return book_content, f"Sách: {book_name} (Thể loại: {category})"
-                else:
-                    logger.info(f"Không tìm thấy sách, sử dụng như nội dung thông thường")
-            
+                    chapter = (yield from _chapter_content(book_id, chuong)) if chuong is not None else None
+                    if chapter is not None:
+                        return chapter, _source_info(book_name, category, chuong=chuong)
+                    return content, _source_info(book_name, category)
+            if found is not None:
+                return found
+            logger.warning(f"Không tìm thấy sách với tên: {ten_sach}")
+
+        # Trường hợp 2: noi_dung_sach có thể là tên sách
+        if noi_dung_sach and noi_dung_sach.strip():
+            content = noi_dung_sach.strip()
+
+            match = index.best_match(content)
+            if match:
+                logger.info(f"Phát hiện tên sách: {match.book_name} (độ khớp {match.score:.2f})")
+                found = yield from _book_content(match.book_id, chuong, match)
+                if found is not None:
+                    return found
+
             # Sử dụng như nội dung thông thường
             return content, "Nội dung tùy chỉnh"
-        
+
         # Trường hợp 3: Không có nội dung nào
         return "", "Không có nội dung tham khảo"
-        
+
     except ImportError:
         logger.error("Không thể import search_by_content từ book_search")
         return noi_dung_sach, "Nội dung tùy chỉnh (lỗi import)"
@@ -411,13 +534,50 @@ def resolve_book_content(ten_sach: str, noi_dung_sach: str) -> tuple[str, str]:
         logger.error(f"Lỗi khi tìm kiếm sách: {str(e)}")
         return noi_dung_sach, "Nội dung tùy chỉnh (lỗi tìm kiếm)"
 
-@tool
+def _book_content(book_id: int, chuong: Optional[int], match=None):
+    """
+    (nội dung, nguồn) của sách book_id, None nếu không có sách.
+    Có chuong thì chỉ đọc các chunk của chương đó, Book.Content chỉ được tải khi sách không có chương này.
+    """
+    if chuong is not None:
+        info = yield "book_info", book_id
+        if info is None:
+            return None
+        chapter = yield from _chapter_content(book_id, chuong)
+        if chapter is not None:
+            logger.info(f"Tìm thấy sách: {info[1]} (Thể loại: {info[2]}), chương {chuong}")
+            return chapter, _source_info(info[1], info[2], match, chuong)
+
+    book_info = yield "book_by_id", book_id
+    if book_info is None:
+        return None
+    logger.info(f"Tìm thấy sách: {book_info[1]} (Thể loại: {book_info[3]})")
+    return book_info[2], _source_info(book_info[1], book_info[3], match)
+
+def _source_info(book_name: str, category: str, match=None, chuong: Optional[int] = None) -> str:
+    source = f"Sách: {book_name} (Thể loại: {category})"
+    if chuong is not None:
+        source += f", chương {chuong}"
+    if match is not None:
+        source += f" - độ khớp tên {match.score:.2f}"
+    return source
+
+def _chapter_content(book_id: int, chuong: int):
+    """Nội dung một chương lấy từ BookChunk, None nếu sách không có chương đó."""
+    yield "ensure_ingested", book_id
+    chunks = yield "chapter", book_id, chuong
+    if not chunks:
+        logger.warning(f"Sách {book_id} không có chương {chuong}, dùng toàn bộ nội dung")
+        return None
+    return "\n\n".join(chunk[3] for chunk in chunks)
+
 def question_generator_tool(
     loai_bode: str,
     so_cau: int,
     chu_de: str = "",
     noi_dung_sach: str = "",
-    ten_sach: str = ""
+    ten_sach: str = "",
+    chuong: Optional[int] = None
 ) -> str:
     """
     Tạo bộ đề kiểm tra từ yêu cầu của người dùng.
@@ -429,6 +589,7 @@ def question_generator_tool(
         chu_de: Chủ đề của bộ đề (tùy chọn)
         noi_dung_sach: Nội dung sách hoặc tài liệu tham khảo (tùy chọn)
         ten_sach: Tên sách cần tìm trong database (tùy chọn)
+        chuong: Chỉ dùng nội dung chương này của sách ten_sach (tùy chọn)
     
     Returns:
         Chuỗi JSON chứa kết quả tạo bộ đề
@@ -437,57 +598,12 @@ def question_generator_tool(
     
     try:
         # Tự động tìm kiếm và lấy nội dung sách nếu cần
-        actual_content, source_info = resolve_book_content(ten_sach, noi_dung_sach)
-        
-        # Chuẩn bị request
-        request = {
-            "loai_bode": loai_bode,
-            "so_cau": so_cau,
-            "chu_de": chu_de,
-            "noi_dung_sach": actual_content,
-            "source_info": source_info  # Thêm thông tin nguồn
-        }
+        actual_content, source_info = resolve_book_content(ten_sach, noi_dung_sach, chuong)
         
         # Gọi hàm tạo bộ đề
-        result = create_question_set(request)
+        result = create_question_set(_question_set_request(loai_bode, so_cau, chu_de, actual_content, source_info))
         
-        # Tạo response thân thiện cho người dùng
-        if result['status'] == 'success':
-            response = {
-                "status": "thành công",
-                "message": f"Đã tạo thành công bộ đề {loai_bode} với {result['question_count']} câu hỏi.",
-                "source": source_info,
-                "file_path": f"output/{result['docx_file']}",
-                "questions_preview": [
-                    {
-                        "question": q.get('question', ''),
-                        "type": q.get('question_type', ''),
-                        "has_choices": bool(q.get('choices'))
-                    } for q in result['questions'][:3]  # Chỉ hiện 3 câu đầu
-                ]
-            }
-            
-        elif result['status'] == 'need_more_info':
-            response = {
-                "status": "cần thêm thông tin",
-                "message": "Cần cung cấp thêm thông tin:",
-                "missing_info": result['questions']
-            }
-            
-        elif result['status'] == 'validation_error':
-            response = {
-                "status": "lỗi validation",
-                "message": "Dữ liệu đầu vào không hợp lệ:",
-                "errors": result['errors']
-            }
-            
-        else:
-            response = {
-                "status": "lỗi",
-                "message": result.get('message', 'Đã xảy ra lỗi không xác định')
-            }
-        
-        return json.dumps(response, ensure_ascii=False, indent=2)
+        return json.dumps(_tool_response(result, loai_bode, source_info), ensure_ascii=False, indent=2)
         
     except Exception as e:
         logger.error(f"Lỗi trong question_generator_tool: {str(e)}")
@@ -496,3 +612,72 @@ def question_generator_tool(
             "message": f"Đã xảy ra lỗi: {str(e)}"
         }
         return json.dumps(error_response, ensure_ascii=False, indent=2)
+
+async def aquestion_generator_tool(
+    loai_bode: str,
+    so_cau: int,
+    chu_de: str = "",
+    noi_dung_sach: str = "",
+    ten_sach: str = "",
+    chuong: Optional[int] = None
+) -> str:
+    """Bản async của question_generator_tool cho event loop (DB async, model.ainvoke, chờ worker bằng asyncio)."""
+    import json
+    
+    try:
+        actual_content, source_info = await aresolve_book_content(ten_sach, noi_dung_sach, chuong)
+        result = await acreate_question_set(_question_set_request(loai_bode, so_cau, chu_de, actual_content, source_info))
+        return json.dumps(_tool_response(result, loai_bode, source_info), ensure_ascii=False, indent=2)
+        
+    except Exception as e:
+        logger.error(f"Lỗi trong aquestion_generator_tool: {str(e)}")
+        error_response = {
+            "status": "lỗi",
+            "message": f"Đã xảy ra lỗi: {str(e)}"
+        }
+        return json.dumps(error_response, ensure_ascii=False, indent=2)
+
+def _question_set_request(loai_bode: str, so_cau: int, chu_de: str, actual_content: str, source_info: str) -> dict:
+    return {
+        "loai_bode": loai_bode,
+        "so_cau": so_cau,
+        "chu_de": chu_de,
+        "noi_dung_sach": actual_content,
+        "source_info": source_info  # Thêm thông tin nguồn
+    }
+
+def _tool_response(result: Dict[str, Any], loai_bode: str, source_info: str) -> Dict[str, Any]:
+    """Response thân thiện cho người dùng từ kết quả create_question_set."""
+    if result['status'] == 'success':
+        return {
+            "status": "thành công",
+            "message": f"Đã tạo thành công bộ đề {loai_bode} với {result['question_count']} câu hỏi.",
+            "source": source_info,
+            "file_path": f"output/{result['docx_file']}",
+            "questions_preview": [
+                {
+                    "question": q.get('question', ''),
+                    "type": q.get('question_type', ''),
+                    "has_choices": bool(q.get('choices'))
+                } for q in result['questions'][:3]  # Chỉ hiện 3 câu đầu
+            ]
+        }
+        
+    elif result['status'] == 'need_more_info':
+        return {
+            "status": "cần thêm thông tin",
+            "message": "Cần cung cấp thêm thông tin:",
+            "missing_info": result['questions']
+        }
+        
+    elif result['status'] == 'validation_error':
+        return {
+            "status": "lỗi validation",
+            "message": "Dữ liệu đầu vào không hợp lệ:",
+            "errors": result['errors']
+        }
+        
+    return {
+        "status": "lỗi",
+        "message": result.get('message', 'Đã xảy ra lỗi không xác định')
+    }
@@ -0,0 +1,124 @@
+import asyncio
+from typing import Optional
+
+from catalog.ingest import ensure_ingested
+from db.database import create_database
+from tools.book_search import (
+    aget_book_chapter,
+    aget_book_chunks,
+    aget_book_outline,
+    get_book_chapter,
+    get_book_chunks,
+    get_book_outline,
+)
+from tools.title_index import TitleIndex, aget_title_index, get_title_index
+
+# Giới hạn token trả về mỗi lần đọc, phần còn lại đọc tiếp bằng chunk_start
+MAX_READ_TOKENS = 8000
+
+
+def resolve_book_id(ten_sach: str = "", book_id: Optional[int] = None, index: Optional[TitleIndex] = None):
+    """
+    Xác định sách theo mã hoặc tên (title index).
+
+    :param index: chỉ mục đã lấy sẵn (tool async lấy bằng aget_title_index), mặc định get_title_index()
+    :return: (book_id, book_name) hoặc (None, thông báo lỗi kèm gợi ý)
+    """
+    index = index or get_title_index()
+    if book_id is not None:
+        return book_id, index.name(book_id) or f"BookID {book_id}"
+
+    match = index.best_match(ten_sach or "")
+    if match:
+        return match.book_id, match.book_name
+
+    suggestions = index.lookup(ten_sach or "", limit=3)
+    if suggestions:
+        names = "; ".join(f"{m.book_name} (book_id={m.book_id})" for m in suggestions)
+        return None, f"Không xác định được sách '{ten_sach}'. Có thể bạn muốn: {names}"
+    return None, f"Không tìm thấy sách '{ten_sach}'"
+
+
+def format_chunks(book_name: str, chunks, max_tokens: int = MAX_READ_TOKENS) -> str:
+    parts, used = [], 0
+    for chunk_index, chapter_index, chapter_title, content, token_count in chunks:
+        if parts and used + token_count > max_tokens:
+            parts.append(f"[Còn tiếp: đọc tiếp từ chunk_start={chunk_index}]")
+            break
+        parts.append(f"--- {chapter_title} (chương {chapter_index}, chunk {chunk_index}) ---\n{content}")
+        used += token_count
+    return f"Sách: {book_name}\n\n" + "\n\n".join(parts)
+
+
+def read_book(ten_sach: str = "", book_id: Optional[int] = None, chuong: Optional[int] = None,
+              chunk_start: Optional[int] = None, chunk_end: Optional[int] = None) -> str:
+    """
+    Mục đích tool: đọc sách theo từng phần thay vì lấy toàn bộ Book.Content
+    """
+    try:
+        book_id, book_name = resolve_book_id(ten_sach, book_id)
+        if book_id is None:
+            return book_name
+
+        if not ensure_book_ingested(book_id):
+            return f"Không tìm thấy sách với book_id={book_id}"
+
+        if chuong is not None:
+            return _format_chapter(book_name, chuong, get_book_chapter(book_id, chuong))
+
+        if chunk_start is not None:
+            return _format_range(book_name, chunk_start, get_book_chunks(book_id, chunk_start, chunk_end))
+
+        return _format_outline(book_name, book_id, get_book_outline(book_id))
+
+    except Exception as e:
+        return f"Lỗi khi đọc sách: {str(e)}"
+
+
+async def aread_book(ten_sach: str = "", book_id: Optional[int] = None, chuong: Optional[int] = None,
+                     chunk_start: Optional[int] = None, chunk_end: Optional[int] = None) -> str:
+    """Bản async của read_book: đọc chunk bằng DB async, chia chunk lần đầu (ensure_ingested) chạy trên thread."""
+    try:
+        book_id, book_name = resolve_book_id(ten_sach, book_id, await aget_title_index())
+        if book_id is None:
+            return book_name
+
+        if not await asyncio.to_thread(ensure_book_ingested, book_id):
+            return f"Không tìm thấy sách với book_id={book_id}"
+
+        if chuong is not None:
+            return _format_chapter(book_name, chuong, await aget_book_chapter(book_id, chuong))
+
+        if chunk_start is not None:
+            return _format_range(book_name, chunk_start, await aget_book_chunks(book_id, chunk_start, chunk_end))
+
+        return _format_outline(book_name, book_id, await aget_book_outline(book_id))
+
+    except Exception as e:
+        return f"Lỗi khi đọc sách: {str(e)}"
+
+
+def ensure_book_ingested(book_id: int) -> bool:
+    """ensure_ingested trên một kết nối riêng (chia chunk ngay nếu job chưa xử lý sách này)."""
+    db = create_database()
+    try:
+        db.connect()
+        return ensure_ingested(db, book_id)
+    finally:
+        db.close()
+
+
+def _format_chapter(book_name: str, chuong: int, chunks) -> str:
+    return format_chunks(book_name, chunks) if chunks else f"Sách {book_name} không có chương {chuong}"
+
+
+def _format_range(book_name: str, chunk_start: int, chunks) -> str:
+    return format_chunks(book_name, chunks) if chunks else f"Sách {book_name} không có chunk {chunk_start}"
+
+
+def _format_outline(book_name: str, book_id: int, outline) -> str:
+    lines = [
+        f"- [{chapter_index}] {title} (chunk {first}-{last}, ~{tokens} token)"
+        for chapter_index, title, first, last, tokens in outline
+    ]
+    return f"Mục lục sách {book_name} (book_id={book_id}):\n" + "\n".join(lines)
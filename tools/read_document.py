@@ -0,0 +1,113 @@
+from typing import List, Optional
+
+from tools.documents import Document, get_document_store
+from tools.text_utils import estimate_tokens
+
+# Tài liệu nhỏ hơn mức này extract_file trả luôn toàn bộ nội dung (CV, file vài trang)
+INLINE_TOKENS = 3000
+# Số token tối đa trả về mỗi lần đọc, phần còn lại đọc ở lượt sau
+MAX_READ_TOKENS = 6000
+# Số mục lục tối đa đưa vào kết quả extract_file
+MAX_OUTLINE_ITEMS = 60
+# Tài liệu nhiều trang hơn mức này thì kích thước được gộp theo từng nhóm PAGE_GROUP trang
+MAX_LISTED_PAGES = 100
+PAGE_GROUP = 10
+
+
+def _page_sizes(tokens: List[int]) -> List[str]:
+    if len(tokens) <= MAX_LISTED_PAGES:
+        cells = [f"{number}:{count}" for number, count in enumerate(tokens, start=1)]
+        return [", ".join(cells[i:i + PAGE_GROUP]) for i in range(0, len(cells), PAGE_GROUP)]
+    lines = []
+    for start in range(0, len(tokens), PAGE_GROUP):
+        group = tokens[start:start + PAGE_GROUP]
+        lines.append(f"{start + 1}-{start + len(group)}: {sum(group)}")
+    return lines
+
+
+def describe_document(document: Document) -> str:
+    """
+    Kết quả extract_file: handle + số trang + mục lục + số token từng trang.
+    Tài liệu ngắn (<= INLINE_TOKENS) thì kèm luôn toàn bộ nội dung.
+    """
+    page_tokens = document.page_tokens()
+    total = sum(page_tokens)
+    header = f"Tài liệu: {document.file_name} (handle={document.handle}, {document.page_count} trang, ~{total} token)"
+    if total <= INLINE_TOKENS:
+        return f"{header}\nNội dung file: {document.text}"
+
+    parts = [header]
+    if document.headings:
+        parts.append("Mục lục:")
+        for index, heading in enumerate(document.headings[:MAX_OUTLINE_ITEMS], start=1):
+            first, last = document.section_pages(index)
+            indent = "  " * (heading.level - 1)
+            parts.append(f"{indent}- [{index}] {heading.title} (trang {first}-{last})")
+        if len(document.headings) > MAX_OUTLINE_ITEMS:
+            parts.append(f"... còn {len(document.headings) - MAX_OUTLINE_ITEMS} mục, đọc theo trang để xem tiếp")
+    else:
+        parts.append("Không tìm thấy mục lục trong tài liệu.")
+    parts.append("Số token từng trang (trang:token):")
+    parts.extend(_page_sizes(page_tokens))
+    parts.append(f"Dùng read_document với handle={document.handle} và tu_trang/den_trang hoặc muc để đọc nội dung.")
+    return "\n".join(parts)
+
+
+def format_pages(document: Document, first: int, last: int) -> str:
+    """
+    Nội dung các trang first..last (từ 1), dừng khi vượt MAX_READ_TOKENS và báo trang đọc tiếp.
+    Số token từng trang lấy từ chỉ mục, chỉ các trang được trả về mới được đọc từ đĩa.
+    """
+    parts, used = [], 0
+    for number in range(first, last + 1):
+        tokens = document.tokens[number - 1]
+        if parts and used + tokens > MAX_READ_TOKENS:
+            parts.append(f"[Còn tiếp: đọc tiếp với tu_trang={number}, den_trang={last}]")
+            break
+        if tokens > MAX_READ_TOKENS:
+            # Một trang quá dài (ví dụ PDF không chia trang): chỉ đọc phần đầu để không vượt ngân sách
+            content = document.page(number, MAX_READ_TOKENS * 4).strip() + " ..."
+        else:
+            content = document.page(number).strip()
+        parts.append(f"--- Trang {number} ---\n{content or '(trang không có text)'}")
+        used += tokens
+    return f"Tài liệu: {document.file_name}\n\n" + "\n\n".join(parts)
+
+
+def read_document(handle: str, tu_trang: Optional[int] = None, den_trang: Optional[int] = None,
+                  muc: Optional[int] = None) -> str:
+    """
+    Mục đích tool: đọc tài liệu upload theo từng phần thay vì đưa toàn bộ text vào hội thoại
+    """
+    try:
+        return _read(get_document_store().open(handle), handle, tu_trang, den_trang, muc)
+    except Exception as e:
+        return f"Lỗi khi đọc tài liệu: {str(e)}"
+
+
+async def aread_document(handle: str, tu_trang: Optional[int] = None, den_trang: Optional[int] = None,
+                         muc: Optional[int] = None) -> str:
+    """Bản async của read_document: tài liệu chưa có trong bộ nhớ thì đọc file của kho trên thread."""
+    try:
+        return _read(await get_document_store().aopen(handle), handle, tu_trang, den_trang, muc)
+    except Exception as e:
+        return f"Lỗi khi đọc tài liệu: {str(e)}"
+
+
+def _read(document: Optional[Document], handle: str, tu_trang: Optional[int], den_trang: Optional[int],
+          muc: Optional[int]) -> str:
+    if document is None:
+        return f"Không tìm thấy tài liệu với handle={handle}, hãy gọi extract_file để lấy handle"
+
+    page_count = document.page_count
+    if muc is not None:
+        if not 1 <= muc <= len(document.headings):
+            return f"Tài liệu {document.file_name} không có mục {muc} (có {len(document.headings)} mục)"
+        first, last = document.section_pages(muc)
+        return format_pages(document, first, last)
+
+    first = tu_trang or 1
+    last = den_trang or first
+    if not 1 <= first <= page_count or last < first:
+        return f"Khoảng trang không hợp lệ, tài liệu {document.file_name} có {page_count} trang"
+    return format_pages(document, first, min(last, page_count))
@@ -0,0 +1,180 @@
+import importlib
+import inspect
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.tools import BaseTool, StructuredTool
+from pydantic import PrivateAttr
+
+from settings import get_settings
+from tools.schemas import (
+    BookSearchInput,
+    CheckCVInput,
+    FileInput,
+    QuestionGeneratorInput,
+    ReadBookInput,
+    ReadDocumentInput,
+    ScreenCVInput,
+    SimilarBooksInput,
+    SummaryInput,
+)
+
+
+class LazyTool(StructuredTool):
+    """
+    Tool có sẵn name/description/args_schema (đủ để bind_tools),
+    còn module cài đặt (PyPDF2, python-docx, Gemini, MySQL, ...) chỉ được import ở lần gọi đầu tiên.
+    Registry là nơi duy nhất khai báo name/description/args_schema: module cài đặt chỉ có hàm thường, không dùng @tool.
+
+    target có dạng "module:attr", attr là hàm cùng tham số với args_schema.
+    async_target (tùy chọn) là coroutine cùng tham số, dùng khi graph chạy bằng ainvoke/astream_events:
+    tool chạy thẳng trên event loop thay vì chiếm một thread của executor. Không có thì chạy bản sync trên thread.
+    """
+
+    target: str
+    async_target: Optional[str] = None
+    _impl: Optional[Callable[..., Any]] = PrivateAttr(default=None)
+    _async_impl: Optional[Callable[..., Any]] = PrivateAttr(default=None)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def load(self) -> Callable[..., Any]:
+        """Import module cài đặt (một lần) và trả về hàm thực thi."""
+        if self._impl is None:
+            with self._lock:
+                if self._impl is None:
+                    self._impl = _resolve(self.target)
+        return self._impl
+
+    def load_async(self) -> Callable[..., Any]:
+        """Như load, cho async_target."""
+        if self._async_impl is None:
+            with self._lock:
+                if self._async_impl is None:
+                    self._async_impl = _resolve(self.async_target)
+        return self._async_impl
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._impl is not None
+
+    def _run(self, *args: Any, config: RunnableConfig, run_manager=None, **kwargs: Any) -> Any:
+        impl = self.load()
+        if _accepts_config(impl):
+            kwargs["config"] = config
+        return impl(*args, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        if self.async_target is None or not get_settings().async_tools:
+            # StructuredTool không có coroutine: chạy invoke trên thread của executor
+            return await super().ainvoke(input, config, **kwargs)
+        return await BaseTool.ainvoke(self, input, config, **kwargs)
+
+    async def _arun(self, *args: Any, config: RunnableConfig, run_manager=None, **kwargs: Any) -> Any:
+        if self.async_target is None:
+            return await run_in_executor(config, lambda: self._run(*args, config=config, **kwargs))
+        # Lần đầu import module cài đặt (có thể nặng) trên thread, không chặn event loop
+        impl = self._async_impl or await run_in_executor(config, self.load_async)
+        if _accepts_config(impl):
+            kwargs["config"] = config
+        return await impl(*args, **kwargs)
+
+
+def _resolve(target: str) -> Callable[..., Any]:
+    module_name, attr = target.split(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _accepts_config(func: Callable[..., Any]) -> bool:
+    parameter = inspect.signature(func).parameters.get("config")
+    return parameter is not None and parameter.annotation in (RunnableConfig, "RunnableConfig")
+
+
+def lazy_tool(name: str, description: str, args_schema, target: str, return_direct: bool = False,
+              async_target: Optional[str] = None) -> LazyTool:
+    return LazyTool(
+        name=name,
+        description=description,
+        args_schema=args_schema,
+        target=target,
+        return_direct=return_direct,
+        async_target=async_target,
+    )
+
+
+TOOLS: List[LazyTool] = [
+    lazy_tool(
+        "extract_file",
+        "Trích xuất, lấy dữ liệu từ ảnh hoặc file sách do người dùng cung cấp. "
+        "Với tài liệu dài chỉ trả về handle, mục lục và số token từng trang; đọc nội dung bằng read_document.",
+        FileInput,
+        "tools.extract_file:extract_file",
+        async_target="tools.extract_file:aextract_file",
+    ),
+    lazy_tool(
+        "read_document",
+        "Đọc một khoảng trang (tu_trang, den_trang) hoặc một mục (muc) của tài liệu upload, "
+        "theo handle do extract_file trả về.",
+        ReadDocumentInput,
+        "tools.read_document:read_document",
+        async_target="tools.read_document:aread_document",
+    ),
+    lazy_tool(
+        "search_by_topic",
+        "Tìm kiếm sách theo chủ đề (CategoryName). Input: topic (str). Output: list các sách.",
+        BookSearchInput,
+        "tools.book_search:search_by_topic",
+        async_target="tools.book_search:asearch_by_topic",
+    ),
+    lazy_tool(
+        "summary",
+        "Tóm tắt sách",
+        SummaryInput,
+        "tools.summary:summary",
+        async_target="tools.summary:asummary",
+        return_direct=True,
+    ),
+    lazy_tool(
+        "check_cv",
+        "Kiểm tra cv",
+        CheckCVInput,
+        "tools.check_cv:check_cv",
+        async_target="tools.check_cv:acheck_cv",
+        return_direct=True,
+    ),
+    # Không có bản async: chấm nhiều CV song song trên pool thread riêng của cv_screening
+    lazy_tool(
+        "screen_cvs",
+        "Sàng lọc, xếp hạng nhiều CV (file trong uploads) theo cùng một JD. "
+        "Dùng khi cần so sánh nhiều ứng viên; một CV thì dùng check_cv.",
+        ScreenCVInput,
+        "tools.cv_screening:screen_cvs_tool",
+        return_direct=True,
+    ),
+    lazy_tool(
+        "question_generator_tool",
+        "Tạo bộ đề kiểm tra từ yêu cầu của người dùng.\n"
+        "Tự động tìm kiếm sách từ database nếu được cung cấp tên sách.",
+        QuestionGeneratorInput,
+        "tools.question_generator:question_generator_tool",
+        async_target="tools.question_generator:aquestion_generator_tool",
+    ),
+    lazy_tool(
+        "read_book",
+        "Đọc sách trong thư viện theo từng phần. Không truyền chuong/chunk để xem mục lục "
+        "(các chương, khoảng chunk, số token); sau đó đọc một chương hoặc một khoảng chunk cụ thể.",
+        ReadBookInput,
+        "tools.read_book:read_book",
+        async_target="tools.read_book:aread_book",
+    ),
+    lazy_tool(
+        "similar_books",
+        "Gợi ý các sách có nội dung tương tự một cuốn sách trong thư viện (theo tên sách hoặc book_id).",
+        SimilarBooksInput,
+        "tools.similar_books:similar_books",
+        async_target="tools.similar_books:asimilar_books",
+    ),
+]
+
+TOOLS_BY_NAME: Dict[str, LazyTool] = {tool.name: tool for tool in TOOLS}
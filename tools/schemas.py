@@ -0,0 +1,61 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class FileInput(BaseModel):
+    message: str = Field(description="")
+    file_name: str = Field(description="")
+    file_names: Optional[List[str]] = Field(default=None, description="Các file khác upload cùng lúc, ví dụ nhiều ảnh chụp trang sách (tùy chọn)")
+
+
+class BookSearchInput(BaseModel):
+    topic: str = Field(description="Chủ đề cần tìm")
+
+
+class SummaryInput(BaseModel):
+    message: str = Field(description="")
+    content: str = Field(default="", description="")
+    ten_sach: str = Field(default="", description="Tên sách trong thư viện cần tóm tắt (tùy chọn)")
+    do_dai: str = Field(default="vừa", description="Độ dài tóm tắt: 'ngắn', 'vừa' hoặc 'dài'")
+    file_name: str = Field(default="", description="Tên file user upload cần tóm tắt (tùy chọn)")
+
+
+class CheckCVInput(BaseModel):
+    cv: str = Field(description="")
+    jd: str = Field(description="")
+
+
+class ScreenCVInput(BaseModel):
+    jd: str = Field(description="Nội dung JD")
+    file_names: Optional[List[str]] = Field(default=None, description="Tên các file CV trong uploads, bỏ trống để chấm tất cả")
+
+
+class QuestionGeneratorInput(BaseModel):
+    loai_bode: str = Field(description="Loại bộ đề cần tạo ('trắc nghiệm' hoặc 'tự luận')")
+    so_cau: int = Field(description="Số câu hỏi cần tạo (số nguyên dương)")
+    chu_de: str = Field(default="", description="Chủ đề của bộ đề (tùy chọn)")
+    noi_dung_sach: str = Field(default="", description="Nội dung sách hoặc tài liệu tham khảo (tùy chọn)")
+    ten_sach: str = Field(default="", description="Tên sách cần tìm trong database (tùy chọn)")
+    chuong: Optional[int] = Field(default=None, description="Chỉ dùng nội dung chương này của sách ten_sach (tùy chọn)")
+
+
+class SimilarBooksInput(BaseModel):
+    ten_sach: str = Field(default="", description="Tên sách cần tìm sách tương tự")
+    book_id: Optional[int] = Field(default=None, description="Mã sách (nếu đã biết, ví dụ từ kết quả search_by_topic)")
+    so_luong: int = Field(default=5, description="Số sách tương tự cần lấy (tối đa 10)")
+
+
+class ReadBookInput(BaseModel):
+    ten_sach: str = Field(default="", description="Tên sách trong thư viện")
+    book_id: Optional[int] = Field(default=None, description="Mã sách (nếu đã biết)")
+    chuong: Optional[int] = Field(default=None, description="Số thứ tự chương cần đọc (0 là phần mở đầu)")
+    chunk_start: Optional[int] = Field(default=None, description="Đoạn (chunk) bắt đầu, tính từ 0")
+    chunk_end: Optional[int] = Field(default=None, description="Đoạn (chunk) kết thúc, tính cả đoạn này")
+
+
+class ReadDocumentInput(BaseModel):
+    handle: str = Field(description="Handle tài liệu do extract_file trả về (dạng doc_...)")
+    tu_trang: Optional[int] = Field(default=None, description="Trang bắt đầu, tính từ 1")
+    den_trang: Optional[int] = Field(default=None, description="Trang kết thúc, tính cả trang này")
+    muc: Optional[int] = Field(default=None, description="Số thứ tự mục trong mục lục cần đọc (thay cho tu_trang/den_trang)")
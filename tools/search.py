@@ -1,12 +1,16 @@
-import os
-from dotenv import load_dotenv
-from langchain_tavily import TavilySearch
-
-# Load .env file
-load_dotenv()
-# Khởi tạo tool
-tavily_search_tool = TavilySearch(
-            max_results=5,
-            topic="general"
-        )
+from functools import lru_cache
+
+from settings import get_settings
+
+
+@lru_cache(maxsize=1)
+def get_tavily_search_tool():
+    """Khởi tạo tool Tavily ở lần dùng đầu tiên (client không được tạo lúc import)."""
+    from langchain_tavily import TavilySearch
+
+    return TavilySearch(
+        max_results=5,
+        topic="general",
+        tavily_api_key=get_settings().tavily_api_key,
+    )
 
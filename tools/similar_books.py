@@ -0,0 +1,55 @@
+from typing import Optional
+
+from tools.book_search import aget_similar_books, get_similar_books
+from tools.read_book import resolve_book_id
+from tools.title_index import aget_title_index
+
+# Số sách tương tự được tính sẵn cho mỗi sách (catalog.neighbours.TOP_K)
+MAX_SIMILAR = 10
+
+
+def similar_books(ten_sach: str = "", book_id: Optional[int] = None, so_luong: int = 5) -> str:
+    """
+    Tra các sách tương tự đã tính sẵn trong bảng BookNeighbour (một truy vấn theo khóa chính).
+
+    Args:
+        ten_sach: Tên sách gốc
+        book_id: Mã sách gốc, ưu tiên hơn ten_sach
+        so_luong: Số sách cần lấy
+
+    Returns:
+        str: Danh sách sách tương tự kèm thể loại và độ tương tự
+    """
+    try:
+        book_id, book_name = resolve_book_id(ten_sach, book_id)
+        if book_id is None:
+            return book_name
+
+        return _format(book_name, get_similar_books(book_id, max(1, min(so_luong, MAX_SIMILAR))))
+
+    except Exception as e:
+        return f"Lỗi khi tìm sách tương tự: {str(e)}"
+
+
+async def asimilar_books(ten_sach: str = "", book_id: Optional[int] = None, so_luong: int = 5) -> str:
+    """Bản async của similar_books (truy vấn BookNeighbour bằng DB async)."""
+    try:
+        book_id, book_name = resolve_book_id(ten_sach, book_id, await aget_title_index())
+        if book_id is None:
+            return book_name
+
+        return _format(book_name, await aget_similar_books(book_id, max(1, min(so_luong, MAX_SIMILAR))))
+
+    except Exception as e:
+        return f"Lỗi khi tìm sách tương tự: {str(e)}"
+
+
+def _format(book_name: str, rows) -> str:
+    if not rows:
+        return f"Chưa có gợi ý sách tương tự cho '{book_name}'"
+
+    lines = [
+        f"- {name} (book_id={neighbour_id}, thể loại: {category or 'không rõ'}, độ tương tự {score:.2f})"
+        for neighbour_id, name, category, score in rows
+    ]
+    return f"Sách tương tự '{book_name}':\n" + "\n".join(lines)
@@ -1,36 +1,141 @@
+import logging
 import os
+from typing import Optional
 
-from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
-from langchain_core.tools import tool
-from langchain_google_genai import ChatGoogleGenerativeAI
-from pydantic import BaseModel, Field
 
-# Load .env file
-load_dotenv()
+from llm import create_chat_model
+from tools.io_steps import arun, run
+from tracing import span, record_cache, record_usage
 
-# Get values
-api_key = os.getenv("GEMINI_API_KEY")
+logger = logging.getLogger(__name__)
 
+# Độ dài người dùng yêu cầu -> độ dài lưu trong bảng BookSummary
+LENGTHS = {"ngắn": "short", "vừa": "medium", "dài": "long"}
 
-class SummaryInput(BaseModel):
-    message: str = Field(description="")
-    content: str = Field(description="")
 
+def summary(message: str, config: RunnableConfig, content: str = "", ten_sach: str = "", do_dai: str = "vừa",
+            file_name: str = "") -> str:
+    return run(_summary(config, content, ten_sach, do_dai, file_name), _OPS)
 
-@tool("summary", args_schema=SummaryInput,
-      description="Tóm tắt sách", return_direct=True)
-def summary(message: str, content: str, config: RunnableConfig) -> str:
-    model = ChatGoogleGenerativeAI(
+
+async def asummary(message: str, config: RunnableConfig, content: str = "", ten_sach: str = "", do_dai: str = "vừa",
+                   file_name: str = "") -> str:
+    """Bản async của summary cho event loop: chờ kho tài liệu, tra DB và gọi model không chặn loop."""
+    return await arun(_summary(config, content, ten_sach, do_dai, file_name), _AOPS)
+
+
+def _summary(config: RunnableConfig, content: str, ten_sach: str, do_dai: str, file_name: str):
+    """Logic của summary, các bước I/O được yield cho run/arun (tools/io_steps.py)."""
+    if not content and file_name:
+        from tools.extract_file import UPLOAD_FOLDER
+
+        content = (yield "document", os.path.join(UPLOAD_FOLDER, file_name)).text
+
+    stored = yield from _stored_summary(ten_sach, content, do_dai)
+    if stored is not None:
+        return stored
+
+    if not content and ten_sach:
+        match = (yield "title_index",).best_match(ten_sach)
+        book = (yield "book_by_id", match.book_id) if match is not None else None
+        if book is None:
+            return f"Không tìm thấy sách '{ten_sach}' trong thư viện"
+        content = book[2]
+
+    with span("summary.llm", kind="llm") as record:
+        response = yield "summarize", _messages(content), config
+        record_usage(record, response)
+
+    return response.content
+
+
+def _document(file_path: str):
+    from tools.documents import get_document_store
+
+    return get_document_store().get(file_path)
+
+
+async def _adocument(file_path: str):
+    from tools.documents import get_document_store
+
+    return await get_document_store().aget(file_path)
+
+
+def _summarize(messages, config: RunnableConfig):
+    return _summary_model().invoke(messages, config)
+
+
+async def _asummarize(messages, config: RunnableConfig):
+    return await _summary_model().ainvoke(messages, config)
+
+
+# Các bước I/O của _summary/_stored_summary: bản sync và bản async
+_OPS = {
+    "document": _document,
+    "title_index": "tools.title_index:get_title_index",
+    "book_by_id": "tools.book_search:get_book_by_id",
+    "book_summary": "tools.book_search:get_book_summary",
+    "summary_by_hash": "tools.book_search:get_summary_by_hash",
+    "summarize": _summarize,
+}
+_AOPS = {
+    "document": _adocument,
+    "title_index": "tools.title_index:aget_title_index",
+    "book_by_id": "tools.book_search:aget_book_by_id",
+    "book_summary": "tools.book_search:aget_book_summary",
+    "summary_by_hash": "tools.book_search:aget_summary_by_hash",
+    "summarize": _asummarize,
+}
+
+
+def _summary_model():
+    return create_chat_model(
         model="gemini-2.5-flash",  # Model ngôn ngữ lớn"
         temperature=0.5,  # Mức độ sáng tạo của model, từ 0 tới 1.
         max_tokens=None,  # Giới hạn token của Input, Output. Thường nên để tối đa 32K.
         timeout=None,
         max_retries=3,
-        google_api_key=api_key  # API key đã lấy ở trên
     )
 
-    response = model.invoke([SystemMessage(content="Tóm tắt nội dung văn bản"), HumanMessage(content=content)], config)
 
-    return response
+def _messages(content: str):
+    return [SystemMessage(content="Tóm tắt nội dung văn bản"), HumanMessage(content=content)]
+
+
+def stored_summary(ten_sach: str, content: str, do_dai: str = "vừa") -> Optional[str]:
+    """
+    Tìm bản tóm tắt đã tạo sẵn bởi job catalog/summarize.py:
+    theo tên sách (title index) nếu có, nếu không thì theo hash của nội dung được truyền vào.
+    Bản tóm tắt của nội dung cũ (sách đã sửa, job chưa chạy lại) không được dùng: tóm tắt trực tiếp.
+
+    :return: nội dung tóm tắt, None nếu sách chưa được tóm tắt trước
+    """
+    return run(_stored_summary(ten_sach, content, do_dai), _OPS)
+
+
+async def astored_summary(ten_sach: str, content: str, do_dai: str = "vừa") -> Optional[str]:
+    """Bản async của stored_summary (title index và bảng BookSummary tra bằng DB async)."""
+    return await arun(_stored_summary(ten_sach, content, do_dai), _AOPS)
+
+
+def _stored_summary(ten_sach: str, content: str, do_dai: str):
+    from catalog.ingest import content_hash
+
+    length = LENGTHS.get((do_dai or "").strip().lower(), "medium")
+    with span("summary.lookup", kind="cache", length=length):
+        try:
+            result = None
+            if ten_sach:
+                match = (yield "title_index",).best_match(ten_sach)
+                if match is not None:
+                    result = yield "book_summary", match.book_id, length
+            elif content:
+                result = yield "summary_by_hash", content_hash(content), length
+        except Exception as e:
+            # Chưa có bảng BookSummary (job chưa chạy lần nào) hoặc lỗi DB: tóm tắt trực tiếp
+            logger.warning(f"Không tra được bản tóm tắt có sẵn: {e}")
+            result = None
+        record_cache("book_summary", result is not None)
+    return result
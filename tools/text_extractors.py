@@ -0,0 +1,198 @@
+"""
+Trích xuất text từ .docx và .txt theo kiểu streaming cho DocumentStore.
+
+- .docx: đọc word/document.xml trực tiếp từ file zip bằng iterparse, mỗi đoạn văn xử lý xong thì giải phóng
+  (không dựng toàn bộ cây XML / object model như python-docx, ảnh nhúng trong file không bị đọc).
+- .txt: đọc từng block, giải mã tăng dần (incremental decoder), không đọc cả file vào bộ nhớ.
+
+Trang: theo ngắt trang trong file (page break, trang Word đã dàn), trang quá PAGE_CHARS ký tự thì tự cắt,
+để read_document đọc được từng phần như PDF. Mỗi trang xong là được chuyển ngay cho add_page (DocumentStore ghi ra
+đĩa), không giữ danh sách trang trong bộ nhớ.
+"""
+import codecs
+import os
+import re
+import zipfile
+from typing import Callable, List, Optional, Tuple
+from xml.etree import ElementTree
+
+import cancellation
+from tracing import span
+
+# Số ký tự tối đa mỗi trang (~1000 token)
+PAGE_CHARS = 4000
+# Kích thước block đọc file .txt
+READ_BLOCK_BYTES = 1 << 20
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# styleId của đoạn tiêu đề: "Heading1", "Heading 2", "Title"
+_HEADING_STYLE = re.compile(r"^heading\s*(\d)$", re.IGNORECASE)
+
+
+class Paginator:
+    """
+    Gom từng dòng/đoạn thành trang: sang trang khi gặp ngắt trang hoặc khi trang vượt page_chars ký tự.
+    Trang xong được gửi cho on_page, chỉ giữ lại số trang và số byte.
+    """
+
+    def __init__(self, on_page: Callable[[str], None], page_chars: int = PAGE_CHARS):
+        self.on_page = on_page
+        self.page_chars = page_chars
+        self.page_count = 0
+        self.output_bytes = 0
+        self._lines: List[str] = []
+        self._size = 0
+
+    @property
+    def page_number(self) -> int:
+        """Số trang (từ 1) của dòng vừa thêm."""
+        return self.page_count + 1
+
+    def add(self, line: str) -> None:
+        while len(line) > self.page_chars:
+            self.add(line[:self.page_chars])
+            line = line[self.page_chars:]
+        if self._size and self._size + len(line) > self.page_chars:
+            self.break_page()
+        self._lines.append(line)
+        self._size += len(line) + 1
+
+    def break_page(self) -> None:
+        # Điểm kiểm tra hủy lượt chat: giữa các trang
+        cancellation.check("page")
+        if self._lines:
+            page = "\n".join(self._lines)
+            self.on_page(page)
+            self.page_count += 1
+            self.output_bytes += len(page.encode("utf-8"))
+            self._lines, self._size = [], 0
+
+    def finish(self) -> int:
+        self.break_page()
+        return self.page_count
+
+
+def _heading_level(paragraph: ElementTree.Element) -> Optional[int]:
+    properties = paragraph.find(f"{_W}pPr")
+    if properties is None:
+        return None
+    style = properties.find(f"{_W}pStyle")
+    if style is not None:
+        style_id = style.get(f"{_W}val", "")
+        if style_id.lower() == "title":
+            return 1
+        match = _HEADING_STYLE.match(style_id)
+        if match:
+            return int(match.group(1))
+    outline = properties.find(f"{_W}outlineLvl")
+    if outline is not None and outline.get(f"{_W}val", "").isdigit():
+        return int(outline.get(f"{_W}val")) + 1
+    return None
+
+
+def read_docx_document(file_path: str, add_page: Callable[[str], None]) -> List[Tuple[int, int, str]]:
+    """
+    Text từng trang (gửi lần lượt cho add_page) và mục lục (đoạn có style Heading/Title) của file .docx, không bắt lỗi.
+    :return: danh sách (trang bắt đầu từ 1, cấp, tiêu đề)
+    """
+    paginator = Paginator(add_page)
+    headings = []
+    with span("docx.extract", kind="extract", input_bytes=os.path.getsize(file_path)) as record:
+        with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as xml:
+            body = None
+            depth = 0
+            parts: List[str] = []
+            break_before = break_after = False
+
+            for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if element.tag == f"{_W}body":
+                        body = element
+                    continue
+
+                depth -= 1
+                tag = element.tag
+                if tag == f"{_W}t":
+                    parts.append(element.text or "")
+                elif tag == f"{_W}tab":
+                    parts.append("\t")
+                elif tag in (f"{_W}br", f"{_W}lastRenderedPageBreak"):
+                    if tag == f"{_W}br" and element.get(f"{_W}type") != "page":
+                        parts.append("\n")
+                    elif "".join(parts).strip():
+                        break_after = True
+                    else:
+                        break_before = True
+                elif tag == f"{_W}p":
+                    if break_before:
+                        paginator.break_page()
+                    text = "".join(parts).strip()
+                    if text:
+                        paginator.add(text)
+                        level = _heading_level(element)
+                        if level is not None and len(text) <= 150:
+                            headings.append((paginator.page_number, level, " ".join(text.split())))
+                    if break_after:
+                        paginator.break_page()
+                    parts, break_before, break_after = [], False, False
+                    element.clear()
+
+                # Phần tử con trực tiếp của w:body (đoạn, bảng) đã xử lý xong: bỏ khỏi cây
+                if depth == 2 and body is not None:
+                    body.clear()
+
+        record["pages"] = paginator.finish()
+        record["output_bytes"] = paginator.output_bytes
+    return headings
+
+
+def _sniff_encoding(file_path: str) -> str:
+    """utf-8 (có hoặc không có BOM), utf-16 theo BOM; không phải utf-8 hợp lệ thì coi là cp1258 (Windows tiếng Việt)."""
+    with open(file_path, "rb") as f:
+        sample = f.read(READ_BLOCK_BYTES)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1258"
+
+
+def read_txt_document(file_path: str, add_page: Callable[[str], None]) -> list:
+    """
+    Text từng trang của file .txt (ký tự form feed là ngắt trang), đọc và giải mã theo từng block,
+    trang xong gửi cho add_page. File .txt không có mục lục: trả về danh sách rỗng.
+    """
+    paginator = Paginator(add_page)
+    encoding = _sniff_encoding(file_path)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    with span("txt.extract", kind="extract", input_bytes=os.path.getsize(file_path), encoding=encoding) as record:
+        pending = ""
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(READ_BLOCK_BYTES), b""):
+                *lines, pending = (pending + decoder.decode(block)).split("\n")
+                for line in lines:
+                    _add_txt_line(paginator, line)
+                if len(pending) > paginator.page_chars:
+                    # File không xuống dòng: cắt theo số ký tự để không giữ cả file trong một chuỗi
+                    _add_txt_line(paginator, pending)
+                    pending = ""
+        _add_txt_line(paginator, pending + decoder.decode(b"", final=True))
+
+        record["pages"] = paginator.finish()
+        record["output_bytes"] = paginator.output_bytes
+    return []
+
+
+def _add_txt_line(paginator: Paginator, line: str) -> None:
+    line = line.rstrip("\r")
+    pieces = line.split("\f")
+    for index, piece in enumerate(pieces):
+        if index:
+            paginator.break_page()
+        if piece or not index:
+            paginator.add(piece)
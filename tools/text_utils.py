@@ -0,0 +1,33 @@
+import math
+import re
+import unicodedata
+from typing import Set
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def strip_accents(text: str) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt (kể cả đ -> d), giữ nguyên dấu câu."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFD", text.lower().replace("đ", "d"))
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+
+def fold_text(text: str) -> str:
+    """
+    Chuẩn hóa chuỗi để so khớp: chữ thường, bỏ dấu tiếng Việt (kể cả đ -> d),
+    bỏ ký tự đặc biệt và gộp khoảng trắng.
+    """
+    return " ".join(_NON_WORD.sub(" ", strip_accents(text)).split())
+
+
+def trigrams(folded: str) -> Set[str]:
+    """Tập trigram ký tự của chuỗi đã fold (có padding để bắt đầu/cuối từ)."""
+    padded = f"  {folded} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (khoảng 4 ký tự một token), đủ dùng để chia chunk và giới hạn prompt."""
+    return math.ceil(len(text or "") / 4)
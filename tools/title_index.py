@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set
+
+import Levenshtein
+
+from db.database import create_database
+from tools.text_utils import fold_text, trigrams
+from tracing import record_cache, span
+
+logger = logging.getLogger(__name__)
+
+# Ngưỡng độ khớp để coi chuỗi là tên sách
+TITLE_MATCH_THRESHOLD = 0.75
+# Chu kỳ nạp thêm sách mới (BookID lớn hơn lần trước) và nạp lại toàn bộ (bắt được đổi tên/xóa)
+REFRESH_INTERVAL = 60
+FULL_REFRESH_INTERVAL = 3600
+# Số ứng viên tối đa sau bước lọc trigram, trước khi tính edit distance
+MAX_CANDIDATES = 50
+# Chuỗi dài hơn ngưỡng này chắc chắn là nội dung, không phải tên sách
+MAX_TITLE_QUERY_LENGTH = 200
+# Trigram xuất hiện ở quá nhiều tên sách (vd. " ta", "tap") không giúp phân biệt, bỏ qua khi lọc
+COMMON_GRAM_RATIO = 0.2
+# Hai kết quả đầu chênh nhau ít hơn mức này thì coi là mơ hồ, không kết luận được tên sách
+AMBIGUITY_MARGIN = 0.02
+
+
+class TitleMatch(NamedTuple):
+    book_id: int
+    book_name: str
+    score: float
+
+
+class TitleIndex:
+    """
+    Chỉ mục tên sách (Book.BookName) trong bộ nhớ, không phân biệt dấu.
+    Lọc ứng viên bằng trigram rồi xếp hạng bằng edit distance (Levenshtein).
+    """
+
+    def __init__(self, refresh_interval: float = REFRESH_INTERVAL, full_refresh_interval: float = FULL_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self._names: Dict[int, str] = {}
+        self._folded: Dict[int, str] = {}
+        self._grams: Dict[str, Set[int]] = {}
+        self._max_id = 0
+        self._last_refresh = 0.0
+        self._last_full_refresh = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def name(self, book_id: int) -> Optional[str]:
+        return self._names.get(book_id)
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Nạp tên sách từ DB. Mặc định chỉ nạp sách có BookID lớn hơn lần trước.
+
+        :param full: nạp lại toàn bộ bảng
+        :return: số sách vừa nạp
+        """
+        with self._lock:
+            db = create_database()
+            try:
+                db.connect()
+                if full:
+                    rows = db.fetch("SELECT BookID, BookName FROM Book")
+                else:
+                    rows = db.fetch("SELECT BookID, BookName FROM Book WHERE BookID > %s", (self._max_id,))
+            finally:
+                db.close()
+
+            if full:
+                self._names, self._folded, self._grams, self._max_id = {}, {}, {}, 0
+                self._last_full_refresh = time.monotonic()
+            for book_id, book_name in rows:
+                self.add(book_id, book_name)
+            self._last_refresh = time.monotonic()
+            return len(rows)
+
+    def ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if now - self._last_full_refresh > self.full_refresh_interval:
+            self.refresh(full=True)
+        elif now - self._last_refresh > self.refresh_interval:
+            self.refresh()
+
+    @property
+    def stale(self) -> bool:
+        """Đã tới lúc nạp thêm / nạp lại từ DB (ensure_fresh sẽ truy vấn DB)."""
+        now = time.monotonic()
+        return (now - self._last_full_refresh > self.full_refresh_interval
+                or now - self._last_refresh > self.refresh_interval)
+
+    def add(self, book_id: int, book_name: str) -> None:
+        """Thêm/cập nhật một sách trong chỉ mục (không truy vấn DB)."""
+        with self._lock:
+            self.remove(book_id)
+            folded = fold_text(book_name or "")
+            self._names[book_id] = book_name
+            self._folded[book_id] = folded
+            for gram in trigrams(folded):
+                self._grams.setdefault(gram, set()).add(book_id)
+            self._max_id = max(self._max_id, book_id)
+
+    def remove(self, book_id: int) -> None:
+        with self._lock:
+            folded = self._folded.pop(book_id, None)
+            self._names.pop(book_id, None)
+            if folded is None:
+                return
+            for gram in trigrams(folded):
+                ids = self._grams.get(gram)
+                if ids is not None:
+                    ids.discard(book_id)
+                    if not ids:
+                        del self._grams[gram]
+
+    def lookup(self, query: str, limit: int = 5) -> List[TitleMatch]:
+        """
+        Tìm các sách có tên gần với query nhất.
+
+        :param query: chuỗi người dùng nhập (có hoặc không dấu)
+        :param limit: số kết quả tối đa
+        :return: danh sách TitleMatch, score trong [0, 1] giảm dần
+        """
+        folded = fold_text(query)
+        if not folded or len(folded) > MAX_TITLE_QUERY_LENGTH:
+            return []
+
+        with self._lock:
+            postings = sorted((self._grams.get(gram, set()) for gram in trigrams(folded)), key=len)
+            common_limit = max(len(self._names) * COMMON_GRAM_RATIO, MAX_CANDIDATES)
+            useful = [ids for ids in postings if len(ids) <= common_limit] or postings[:3]
+
+            overlap = Counter()
+            for ids in useful:
+                overlap.update(ids)
+            candidates = [
+                (book_id, self._names[book_id], self._folded[book_id])
+                for book_id, count in overlap.most_common(MAX_CANDIDATES)
+                if count / len(useful) >= 0.3
+            ]
+
+        matches = [TitleMatch(book_id, name, _similarity(folded, title)) for book_id, name, title in candidates]
+        matches.sort(key=lambda m: m.score, reverse=True)
+        return matches[:limit]
+
+    def best_match(self, query: str, threshold: float = TITLE_MATCH_THRESHOLD) -> Optional[TitleMatch]:
+        """Sách khớp nhất nếu độ khớp đạt ngưỡng và không bị mơ hồ với kết quả thứ hai, ngược lại None."""
+        matches = self.lookup(query, limit=2)
+        hit = bool(matches) and matches[0].score >= threshold
+        if hit and len(matches) > 1 and matches[0].score - matches[1].score < AMBIGUITY_MARGIN:
+            hit = False
+        record_cache("title_index", hit)
+        return matches[0] if hit else None
+
+
+def _similarity(query: str, title: str) -> float:
+    """
+    Độ khớp dựa trên edit distance: so cả chuỗi, và so với cụm từ liên tiếp
+    cùng số từ trong tên sách (người dùng thường chỉ gõ một phần tên).
+    """
+    whole = 1 - Levenshtein.distance(query, title) / max(len(query), len(title))
+
+    query_words = query.split()
+    title_words = title.split()
+    best_window = 0.0
+    if len(title_words) > len(query_words):
+        size = len(query_words)
+        for start in range(len(title_words) - size + 1):
+            window = " ".join(title_words[start:start + size])
+            best_window = max(best_window, 1 - Levenshtein.distance(query, window) / max(len(query), len(window)))
+        # Khớp một phần tên thì kém chắc chắn hơn khớp toàn bộ
+        best_window *= 0.95
+    return round(max(whole, best_window), 4)
+
+
+_title_index: Optional[TitleIndex] = None
+_title_index_lock = threading.Lock()
+
+
+def get_title_index() -> TitleIndex:
+    """Chỉ mục dùng chung cho cả process, nạp lần đầu và tự làm mới theo chu kỳ."""
+    global _title_index
+    with _title_index_lock:
+        if _title_index is None:
+            index = TitleIndex()
+            with span("title_index.build", kind="cache"):
+                index.refresh(full=True)
+            logger.info(f"Đã nạp {len(index)} tên sách vào title index")
+            _title_index = index
+    try:
+        _title_index.ensure_fresh()
+    except Exception as e:
+        logger.warning(f"Không làm mới được title index: {str(e)}")
+    return _title_index
+
+
+async def aget_title_index() -> TitleIndex:
+    """
+    get_title_index cho tool chạy trên event loop: chỉ mục đã nạp và còn mới thì trả ngay,
+    lần nạp đầu / làm mới theo chu kỳ (truy vấn DB, dựng trigram) chạy trên thread.
+    """
+    index = _title_index
+    if index is not None and not index.stale:
+        return index
+    return await asyncio.to_thread(get_title_index)
@@ -0,0 +1,329 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """Counter, gauge và histogram tối giản, xuất ra định dạng text của Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._help: Dict[str, str] = {}
+
+    def inc(self, metric: str, value: float = 1.0, help: str = "", **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(metric, {})
+            series[key] = series.get(key, 0.0) + value
+            self._help.setdefault(metric, help)
+
+    def set_gauge(self, metric: str, value: float, help: str = "", **labels) -> None:
+        with self._lock:
+            self._gauges.setdefault(metric, {})[_label_key(labels)] = value
+            self._help.setdefault(metric, help)
+
+    def observe(self, metric: str, value: float, help: str = "", **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(metric, {})
+            # [count từng bucket..., +Inf, sum]
+            state = series.setdefault(key, [0.0] * (len(DEFAULT_BUCKETS) + 2))
+            for i, bound in enumerate(DEFAULT_BUCKETS):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+            self._help.setdefault(metric, help)
+
+    def counter_value(self, metric: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(metric, {}).get(_label_key(labels), 0.0)
+
+    def counter_total(self, metric: str, **labels) -> float:
+        """Tổng các series của counter có chứa các label đã cho."""
+        wanted = set(_label_key(labels))
+        with self._lock:
+            return sum(value for key, value in self._counters.get(metric, {}).items() if wanted <= set(key))
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    lines.append(f"# HELP {name} {self._help.get(name) or name}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name) or name}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, state in series.items():
+                    for i, bound in enumerate(DEFAULT_BUCKETS):
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', str(bound)),))} {state[i]}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {state[-2]}")
+                    lines.append(f"{name}_count{_format_labels(key)} {state[-2]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {state[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (
+        f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in key
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+metrics = MetricsRegistry()
+
+
+class TurnTrace:
+    """Tập hợp các span của một lượt chat, dùng để hiển thị breakdown trên UI."""
+
+    def __init__(self, turn_id: Optional[str] = None):
+        self.turn_id = turn_id or uuid.uuid4().hex
+        self.spans: List[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: dict) -> None:
+        with self._lock:
+            self.spans.append(record)
+
+    def breakdown(self) -> List[dict]:
+        """Gộp span theo (kind, name): số lần gọi, tổng thời gian, token, payload."""
+        rows: Dict[Tuple[str, str], dict] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for record in spans:
+            row = rows.setdefault((record["kind"], record["name"]), {
+                "kind": record["kind"],
+                "name": record["name"],
+                "calls": 0,
+                "total_ms": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "payload_bytes": 0,
+                "cache_hits": 0,
+            })
+            row["calls"] += 1
+            row["total_ms"] += record["duration_ms"]
+            row["prompt_tokens"] += record.get("prompt_tokens", 0)
+            row["completion_tokens"] += record.get("completion_tokens", 0)
+            row["payload_bytes"] += record.get("input_bytes", 0) + record.get("output_bytes", 0)
+            row["cache_hits"] += record.get("cache_hits", 0)
+        for row in rows.values():
+            row["total_ms"] = round(row["total_ms"], 1)
+        return sorted(rows.values(), key=lambda r: r["total_ms"], reverse=True)
+
+
+_current_turn: ContextVar[Optional[TurnTrace]] = ContextVar("current_turn", default=None)
+_current_span: ContextVar[Optional[dict]] = ContextVar("current_span", default=None)
+_trace_file_lock = threading.Lock()
+
+
+@contextmanager
+def turn(turn_id: Optional[str] = None) -> Iterator[TurnTrace]:
+    """
+    Gom các span phát sinh trong một lượt chat.
+    Context được copy sang task asyncio và thread của executor nên span trong node/tool đều được ghi nhận.
+    """
+    trace = TurnTrace(turn_id)
+    token = _current_turn.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_turn.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attrs) -> Iterator[dict]:
+    """
+    Đo thời gian một đoạn code. Dict trả về có thể bổ sung thuộc tính (token, payload, ...).
+
+    :param name: tên span, ví dụ tên tool hoặc node
+    :param kind: nhóm span: node, tool, llm, db, extract, ...
+    """
+    record = dict(attrs, name=name, kind=kind)
+    parent = _current_span.get()
+    token = _current_span.set(record)
+    start_wall = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield record
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(token)
+        record.update({
+            "start": start_wall,
+            "duration_ms": round(duration * 1000, 3),
+            "parent": parent.get("name") if parent else None,
+        })
+        if error:
+            record["error"] = error
+        _finish_span(record, duration)
+
+
+def _finish_span(record: dict, duration: float) -> None:
+    name, kind = record["name"], record["kind"]
+    metrics.observe("agent_span_duration_seconds", duration, help="Thời gian thực thi span",
+                    kind=kind, name=name)
+    if record.get("error"):
+        metrics.inc("agent_span_errors_total", help="Số span kết thúc bằng exception", kind=kind, name=name)
+    for field in ("prompt_tokens", "completion_tokens"):
+        if record.get(field):
+            metrics.inc("agent_tokens_total", record[field], help="Số token gửi/nhận từ LLM",
+                        name=name, type=field.split("_")[0])
+    for field, direction in (("input_bytes", "in"), ("output_bytes", "out")):
+        if record.get(field):
+            metrics.inc("agent_payload_bytes_total", record[field], help="Kích thước payload",
+                        kind=kind, name=name, direction=direction)
+
+    trace = _current_turn.get()
+    if trace is not None:
+        record["trace_id"] = trace.turn_id
+        trace.add(record)
+    _write_trace_line(record)
+
+
+def _write_trace_line(record: dict) -> None:
+    path = get_settings().trace_file
+    if not path:
+        return
+    try:
+        with _trace_file_lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        logger.warning(f"Không ghi được trace file {path}: {str(e)}")
+
+
+def record_usage(record: dict, message) -> None:
+    """Ghi số token prompt/completion (và token đọc từ cache) từ usage_metadata của AIMessage."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    record["prompt_tokens"] = record.get("prompt_tokens", 0) + usage.get("input_tokens", 0)
+    record["completion_tokens"] = record.get("completion_tokens", 0) + usage.get("output_tokens", 0)
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    if cached:
+        record["cached_tokens"] = record.get("cached_tokens", 0) + cached
+        record_cache("llm_context", True)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Đếm cache hit/miss, đồng thời cộng vào span hiện tại."""
+    metrics.inc("agent_cache_requests_total", help="Số lần tra cache", cache=cache, result="hit" if hit else "miss")
+    current = _current_span.get()
+    if current is not None and hit:
+        current["cache_hits"] = current.get("cache_hits", 0) + 1
+
+
+def payload_size(value) -> int:
+    """
+    Kích thước (byte, UTF-8) của payload: tổng các chuỗi bên trong list/tuple/dict, không tính dấu ngoặc/phân cách.
+    Không json.dumps cả payload (dòng DB kèm nội dung sách, ...): hàm chạy trên event loop ở mỗi node/tool async.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value) if value.isascii() else len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_size(key) + payload_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    return payload_size(str(value))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> None:
+    """Mở endpoint /metrics (Prometheus) trên thread nền. Gọi nhiều lần chỉ mở một server."""
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is not None:
+            return
+        try:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Không mở được metrics server ở cổng {port}: {str(e)}")
+            return
+        threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Metrics Prometheus tại http://{host}:{port}/metrics")
+
+
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def log_in_background() -> None:
+    """
+    Ghi log trên thread nền: handler của root logger (stderr, file, ...) được chuyển sang QueueListener,
+    root chỉ còn QueueHandler nên logger.info trong node/tool async không ghi stream trên event loop.
+    Gọi nhiều lần chỉ cài một lần.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    root = logging.getLogger()
+    if not root.handlers:
+        # Cấu hình mà tools/question_generator.py vẫn đặt khi được import (lúc đó root đã có handler, bị bỏ qua)
+        logging.basicConfig(level=logging.INFO)
+    handlers = list(root.handlers)
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_listener.start()
+    # Ghi nốt log còn trong queue khi process kết thúc
+    atexit.register(_log_listener.stop)
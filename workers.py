@@ -0,0 +1,282 @@
+"""
+Process worker cho việc nặng CPU của tool (parse PDF, OCR, xuất docx), chạy ngoài process của Streamlit.
+
+Một lượt upload nặng không còn giữ GIL của process đang phục vụ UI cho mọi session:
+thread của tool chỉ chờ kết quả, việc tính toán chạy trong process riêng.
+
+- Hàng đợi job có giới hạn (WORKER_QUEUE_SIZE): đầy thì người gọi chờ (vẫn dừng được khi lượt chat bị hủy).
+- Mỗi process chạy một job một lúc; process được thay mới sau WORKER_MAX_JOBS job
+  hoặc khi RSS đỉnh vượt WORKER_MAX_RSS_MB (thư viện PDF/ảnh hay giữ bộ nhớ sau file lớn).
+- Kết quả trả về bằng tham chiếu file: hàm chạy trong worker ghi kết quả lớn ra đĩa (kho tài liệu, file docx)
+  và chỉ trả về đường dẫn / giá trị nhỏ, không gửi text hay bytes lớn qua pipe.
+- Lượt chat bị hủy (cancellation.py) khi job đang chạy thì process bị terminate, job chưa chạy bị bỏ.
+- WORKER_PROCESSES=0: chạy thẳng trên thread của người gọi như trước.
+
+Hàm chạy trong worker phải là hàm cấp module (pickle được), tham số và kết quả cũng vậy.
+"""
+import asyncio
+import logging
+import multiprocessing
+import pickle
+import queue
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+import cancellation
+from cancellation import CancelToken, TurnCancelled
+from deadline import check, current_deadline, remaining
+from settings import get_settings
+from tracing import metrics, span
+
+logger = logging.getLogger(__name__)
+
+# Chu kỳ kiểm tra job bị hủy / process chết khi đang chờ kết quả
+POLL_S = 0.1
+# Thời gian chờ process tự thoát khi thay mới trước khi terminate
+STOP_TIMEOUT_S = 5.0
+
+
+class WorkerCrashed(RuntimeError):
+    """Process worker chết giữa chừng (bị OOM kill, lỗi thư viện C, ...)."""
+
+
+class _Job:
+    def __init__(self, func: Callable, args: tuple, kwargs: dict, token: Optional[CancelToken]):
+        self.func, self.args, self.kwargs, self.token = func, args, kwargs, token
+        self.name = getattr(func, "__name__", "job")
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KB, macOS: byte
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def _worker_main(conn) -> None:
+    """Vòng lặp của process worker: nhận (func, args, kwargs), trả về ((status, value), RSS đỉnh MB)."""
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if message is None:
+            return
+        func, args, kwargs = message
+        try:
+            result = ("ok", func(*args, **kwargs))
+        except BaseException as e:
+            result = ("error", e)
+        try:
+            conn.send((result, _peak_rss_mb()))
+        except Exception as e:
+            # Kết quả / exception không pickle được
+            conn.send((("error", RuntimeError(f"{type(result[1]).__name__}: {result[1]} ({e})")), _peak_rss_mb()))
+
+
+class _Worker:
+    """Một process worker và đầu pipe phía process cha, tạo lại khi cần."""
+
+    def __init__(self, context, index: int):
+        self._context = context
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.jobs = 0
+
+    def ensure_started(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            return
+        self.close()
+        parent_conn, child_conn = self._context.Pipe()
+        self.process = self._context.Process(target=_worker_main, args=(child_conn,),
+                                             name=f"worker-{self.index}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn, self.jobs = parent_conn, 0
+
+    def stop(self) -> None:
+        """Cho process thoát sau job hiện tại (dùng khi thay mới), quá hạn thì terminate."""
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(STOP_TIMEOUT_S)
+        self.close()
+
+    def close(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(STOP_TIMEOUT_S)
+        if self.conn is not None:
+            self.conn.close()
+        self.process = self.conn = None
+
+
+class WorkerPool:
+    """
+    Pool process với hàng đợi có giới hạn. Mỗi process có một thread điều phối trong process cha:
+    lấy job từ hàng đợi, gửi sang process, chờ kết quả, thay process khi đủ số job / quá bộ nhớ.
+    """
+
+    def __init__(self, processes: int, max_jobs: int, max_rss_mb: float, queue_size: int):
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self._queue: "queue.Queue[_Job]" = queue.Queue(maxsize=max(1, queue_size))
+        # forkserver/spawn: không fork process cha đang có nhiều thread (Streamlit, pool, ...)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._workers = [_Worker(context, index) for index in range(processes)]
+        for worker in self._workers:
+            threading.Thread(target=self._dispatch, args=(worker,), name=f"worker-dispatch-{worker.index}",
+                             daemon=True).start()
+
+    def submit(self, func: Callable, *args, token: Optional[CancelToken] = None, **kwargs) -> Future:
+        """
+        Đưa job vào hàng đợi, chờ nếu hàng đợi đầy.
+        :param token: token hủy của lượt chat (mặc định: lượt đang chạy)
+        """
+        token = cancellation.current_token() if token is None else token
+        job = _Job(func, args, kwargs, token)
+        while True:
+            cancellation.check("worker_queue", token)
+            try:
+                self._queue.put(job, timeout=POLL_S)
+                break
+            except queue.Full:
+                metrics.inc("worker_queue_full_total", help="Số lần job phải chờ vì hàng đợi worker đầy", job=job.name)
+        self._report_depth()
+        if token is not None:
+            # Job chưa chạy: bỏ luôn; job đang chạy: thread điều phối thấy token bị hủy và terminate process
+            token.on_cancel(job.future.cancel)
+        return job.future
+
+    def _report_depth(self) -> None:
+        metrics.set_gauge("worker_queue_depth", self._queue.qsize(), help="Số job đang chờ process worker")
+
+    def _dispatch(self, worker: _Worker) -> None:
+        while True:
+            job = self._queue.get()
+            self._report_depth()
+            if not job.future.set_running_or_notify_cancel():
+                metrics.inc("worker_jobs_total", help="Số job chạy trong process worker", job=job.name,
+                            result="cancelled")
+                continue
+            metrics.observe("worker_queue_wait_seconds", time.monotonic() - job.enqueued,
+                            help="Thời gian job chờ trong hàng đợi worker", job=job.name)
+            try:
+                self._run(worker, job)
+            except Exception as e:
+                logger.exception(f"Lỗi điều phối worker {worker.index}")
+                worker.close()
+                if not job.future.done():
+                    job.future.set_exception(e)
+
+    def _run(self, worker: _Worker, job: _Job) -> None:
+        worker.ensure_started()
+        try:
+            worker.conn.send((job.func, job.args, job.kwargs))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            # Hàm/tham số không pickle được: lỗi của người gọi, process vẫn dùng tiếp được
+            job.future.set_exception(e)
+            return
+
+        while not worker.conn.poll(POLL_S):
+            if job.token is not None and job.token.cancelled:
+                worker.close()
+                self._finish(job, "cancelled", exception=TurnCancelled(f"Lượt chat đã bị hủy ({job.token.reason})"))
+                metrics.inc("worker_recycles_total", help="Số lần thay process worker", reason="cancelled")
+                return
+            if not worker.process.is_alive():
+                break
+        try:
+            (status, value), rss_mb = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.process.join(STOP_TIMEOUT_S)
+            code = worker.process.exitcode
+            worker.close()
+            self._finish(job, "crashed", exception=WorkerCrashed(f"Process worker thoát giữa chừng (exit code {code})"))
+            metrics.inc("worker_recycles_total", help="Số lần thay process worker", reason="crashed")
+            return
+
+        worker.jobs += 1
+        if status == "ok":
+            self._finish(job, "ok", value)
+        else:
+            self._finish(job, "error", exception=value)
+
+        reason = "jobs" if worker.jobs >= self.max_jobs else "memory" if rss_mb > self.max_rss_mb else None
+        if reason is not None:
+            logger.info(f"Thay process worker {worker.index} ({reason}: {worker.jobs} job, RSS đỉnh {rss_mb:.0f} MB)")
+            worker.stop()
+            metrics.inc("worker_recycles_total", help="Số lần thay process worker", reason=reason)
+
+    @staticmethod
+    def _finish(job: _Job, result: str, value: Any = None, exception: Optional[BaseException] = None) -> None:
+        metrics.inc("worker_jobs_total", help="Số job chạy trong process worker", job=job.name, result=result)
+        if exception is not None:
+            job.future.set_exception(exception)
+        else:
+            job.future.set_result(value)
+
+
+@lru_cache(maxsize=1)
+def get_worker_pool() -> Optional[WorkerPool]:
+    """Pool dùng chung của process, None nếu tắt (WORKER_PROCESSES=0)."""
+    settings = get_settings()
+    if settings.worker_processes <= 0:
+        return None
+    return WorkerPool(settings.worker_processes, settings.worker_max_jobs, settings.worker_max_rss_mb,
+                      settings.worker_queue_size)
+
+
+def run_in_worker(func: Callable, *args, **kwargs) -> Any:
+    """
+    Chạy func(*args, **kwargs) trong process worker và chờ kết quả (cùng kết quả/exception như gọi trực tiếp).
+    Lượt chat bị hủy thì ném TurnCancelled, hết thời gian của lượt thì ném TurnTimeout (job vẫn chạy nốt).
+    """
+    pool = get_worker_pool()
+    if pool is None:
+        return func(*args, **kwargs)
+
+    token, deadline = cancellation.current_token(), current_deadline()
+    name = getattr(func, "__name__", "job")
+    with span(f"worker.{name}", kind="worker"):
+        future = pool.submit(func, *args, token=token, **kwargs)
+        waiting = [future] + ([token.future()] if token is not None else [])
+        while not future.done():
+            wait(waiting, timeout=remaining(deadline), return_when=FIRST_COMPLETED)
+            cancellation.check("worker", token)
+            if deadline is not None:
+                check("worker", deadline)
+        return future.result()
+
+
+async def arun_in_worker(func: Callable, *args, **kwargs) -> Any:
+    """
+    Bản async của run_in_worker cho tool chạy trên event loop: chờ kết quả bằng asyncio.wait, không giữ thread nào.
+    WORKER_PROCESSES=0 thì func chạy trên thread (asyncio.to_thread) thay vì chặn event loop.
+    """
+    pool = get_worker_pool()
+    if pool is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    token, deadline = cancellation.current_token(), current_deadline()
+    name = getattr(func, "__name__", "job")
+    with span(f"worker.{name}", kind="worker"):
+        # Hàng đợi đầy thì submit phải chờ: chờ trên thread, không chờ trên event loop
+        future = await asyncio.to_thread(pool.submit, func, *args, token=token, **kwargs)
+        while not future.done():
+            await cancellation.wait_future(future, token, remaining(deadline))
+            cancellation.check("worker", token)
+            if deadline is not None:
+                check("worker", deadline)
+        return future.result()